@@ -0,0 +1,63 @@
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from make_corpus import write_corpus
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run(corpus, work_dir, extra):
+    # Ejecuta generador.py y devuelve el tiempo total y la memoria máxima (de -sj)
+    stats_path = Path(work_dir) / "stats.json"
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(ROOT / "generador.py"), "-d", str(corpus), "-jrt", "-jm", "-jcrt", "-jf", "compact",
+                    "-sj", str(stats_path), *extra], cwd=work_dir, check=True, stdout=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+    with open(stats_path, encoding="utf-8") as stats_file:
+        return elapsed, json.load(stats_file)["total"]["peak_rss_mib"]
+
+
+def load(path, key):
+    with open(path, encoding="utf-8") as json_file:
+        return json.load(json_file)[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modo exacto vs --approx: tiempo, memoria y precisión del ranking de retweets y menciones")
+    parser.add_argument("-f", "--files", type=int, default=16, help="Archivos del corpus sintético")
+    parser.add_argument("-t", "--tweets", type=int, default=10000, help="Tweets por archivo")
+    parser.add_argument("-u", "--users", type=int, default=50000, help="Usuarios distintos del corpus")
+    parser.add_argument("-c", "--capacity", default="500,2000", help="Capacidades de Space-Saving separadas por comas")
+    parser.add_argument("-k", "--top", type=int, default=100, help="Tamaño del ranking que se compara")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus = Path(work_dir) / "corpus"
+        write_corpus(corpus, args.files, args.tweets, users=args.users)
+        elapsed, rss = run(corpus, work_dir, [])
+        retweets = {record["username"]: record["receivedRetweets"] for record in load(Path(work_dir) / "rt.json", "retweets")}
+        mentions = {record["username"]: record["receivedMentions"] for record in load(Path(work_dir) / "mención.json", "mentions")}
+        top_retweets, top_mentions = set(list(retweets)[:args.top]), set(list(mentions)[:args.top])
+        print(f"{args.files * args.tweets} tweets, {len(retweets)} autores retuiteados, {len(mentions)} usuarios mencionados")
+        print(f"{'modo':<16}{'tiempo (s)':>12}{'RSS máx (MiB)':>15}{f'top {args.top} rt':>12}{f'top {args.top} menc.':>14}{'error rt':>10}")
+        print(f"{'exacto':<16}{elapsed:>12.2f}{rss:>15.1f}{1.0:>12.2f}{1.0:>14.2f}{0.0:>10.3f}")
+
+        for capacity in (int(c) for c in args.capacity.split(",")):
+            elapsed, rss = run(corpus, work_dir, ["-ax", "-axc", str(capacity)])
+            approx_retweets = load(Path(work_dir) / "rt_aprox.json", "retweets")[:args.top]
+            approx_mentions = load(Path(work_dir) / "mención_aprox.json", "mentions")[:args.top]
+            # Recall del ranking y error relativo medio del conteo de los autores del top
+            recall_retweets = len(top_retweets & {record["username"] for record in approx_retweets}) / max(len(top_retweets), 1)
+            recall_mentions = len(top_mentions & {record["username"] for record in approx_mentions}) / max(len(top_mentions), 1)
+            error = sum(abs(record["receivedRetweets"] - retweets.get(record["username"], 0)) / max(retweets.get(record["username"], 0), 1)
+                        for record in approx_retweets) / max(len(approx_retweets), 1)
+            print(f"{f'approx {capacity}':<16}{elapsed:>12.2f}{rss:>15.1f}{recall_retweets:>12.2f}{recall_mentions:>14.2f}{error:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import bz2
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from generador import bz2_segments, find_bz2_markers, read_segment_lines, read_tweet_lines
+from make_corpus import write_corpus
+
+
+def count_segment_lines(file_path, segment):
+    lines = read_segment_lines(file_path, segment)
+    return len(lines), sum(len(line) for line in lines)
+
+
+def read_split(file_path, processes):
+    # Búsqueda de bloques y descompresión por tramos repartidas entre processes procesos
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        segments = bz2_segments(file_path, find_bz2_markers(file_path, executor.map), processes)
+        if segments is None:
+            raise SystemExit(f"{file_path} no se puede dividir en tramos de bloques")
+        counts = list(executor.map(count_segment_lines, [file_path] * len(segments), segments))
+    return sum(lines for lines, size in counts), sum(size for lines, size in counts), len(segments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lectura de un solo .json.bz2 grande: BZ2File secuencial vs tramos de bloques en paralelo (-sb)")
+    parser.add_argument("-i", "--input", help="Archivo .json.bz2 a leer (por defecto se genera uno sintético)")
+    parser.add_argument("-t", "--tweets", type=int, default=200000, help="Tweets del archivo sintético")
+    parser.add_argument("-p", "--processes", default="1,2,4,8", help="Cantidades de procesos separadas por comas")
+    parser.add_argument("-l", "--level", type=int, default=9, help="Nivel de compresión del archivo sintético")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_path = args.input
+        if file_path is None:
+            corpus = write_corpus(Path(work_dir) / "corpus", files=1, tweets_per_file=args.tweets)[0]
+            file_path = Path(work_dir) / "grande.json.bz2"
+            file_path.write_bytes(bz2.compress(bz2.decompress(corpus.read_bytes()), args.level))
+        size = Path(file_path).stat().st_size / 1e6
+
+        start = time.perf_counter()
+        lines = list(read_tweet_lines(file_path))
+        baseline = time.perf_counter() - start
+        expected = (len(lines), sum(len(line) for line in lines))
+        del lines
+        print(f"{size:.1f} MB comprimidos, {expected[1] / 1e6:.1f} MB de JSON, {expected[0]} líneas")
+        print(f"{'lectura':<12}{'procesos':>9}{'tramos':>8}{'tiempo (s)':>12}{'MB/s':>9}{'aceleración':>13}")
+        print(f"{'BZ2File':<12}{1:>9}{1:>8}{baseline:>12.2f}{size / baseline:>9.1f}{1.0:>13.2f}")
+        for processes in (int(p) for p in args.processes.split(",")):
+            start = time.perf_counter()
+            line_count, json_bytes, segments = read_split(file_path, processes)
+            elapsed = time.perf_counter() - start
+            if (line_count, json_bytes) != expected:
+                raise SystemExit(f"Los tramos leyeron {line_count} líneas y {json_bytes} bytes, se esperaban {expected}")
+            print(f"{'tramos':<12}{processes:>9}{segments:>8}{elapsed:>12.2f}{size / elapsed:>9.1f}{baseline / elapsed:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
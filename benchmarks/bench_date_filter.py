@@ -0,0 +1,56 @@
+import argparse
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from generador import compile_date_filter
+
+
+def validate_tweet_date(tweet, fi, ff):
+    # Implementación anterior: vuelve a interpretar -fi/-ff y created_at con strptime en cada tweet
+    if 'created_at' in tweet:
+        tweet_date = datetime.strptime(tweet['created_at'], "%a %b %d %H:%M:%S +0000 %Y").date()
+        if fi is not None and tweet_date < datetime.strptime(fi, "%d-%m-%y").date():
+            return False
+        if ff is not None and tweet_date > datetime.strptime(ff, "%d-%m-%y").date():
+            return False
+    return True
+
+
+def make_tweets(n, days, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2016, 1, 1)
+    return [{"created_at": (start + timedelta(seconds=rng.randint(0, days * 86400))).strftime("%a %b %d %H:%M:%S +0000 %Y")}
+            for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el filtro de fechas anterior con el filtro precompilado")
+    parser.add_argument("-n", "--tweets", type=int, default=200000, help="Cantidad de tweets sintéticos")
+    parser.add_argument("--days", type=int, default=365, help="Días cubiertos por los tweets")
+    parser.add_argument("-fi", "--fecha_inicial", default="01-03-16")
+    parser.add_argument("-ff", "--fecha_final", default="30-09-16")
+    args = parser.parse_args()
+
+    tweets = make_tweets(args.tweets, args.days)
+    fi, ff = args.fecha_inicial, args.fecha_final
+    date_filter = compile_date_filter(fi, ff)
+
+    # Ambas implementaciones deben aceptar exactamente los mismos tweets
+    assert [validate_tweet_date(t, fi, ff) for t in tweets] == [date_filter(t) for t in tweets]
+
+    legacy = min(timeit.repeat(lambda: [validate_tweet_date(t, fi, ff) for t in tweets], number=1, repeat=3))
+    compiled = min(timeit.repeat(lambda: [date_filter(t) for t in tweets], number=1, repeat=3))
+
+    print(f"tweets: {len(tweets)}  ventana: {fi} .. {ff}")
+    print(f"strptime por tweet : {legacy:.3f} s  ({len(tweets) / legacy:,.0f} tweets/s)")
+    print(f"filtro precompilado: {compiled:.3f} s  ({len(tweets) / compiled:,.0f} tweets/s)")
+    print(f"aceleración        : {legacy / compiled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
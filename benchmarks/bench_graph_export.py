@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import networkx as nx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_memory import synthetic_retweets
+from generador import GRAPH_FORMATS, TweetStore, process_retweet, write_graph
+
+
+def write_networkx_gexf(filename, names, edges, weighted):
+    # Camino anterior: un grafo de networkx con los screen_name como nodos y nx.write_gexf
+    G = nx.Graph()
+    if weighted:
+        G.add_weighted_edges_from((names[u], names[v], weight) for (u, v), weight in edges)
+    else:
+        G.add_edges_from((names[u], names[v]) for (u, v), weight in edges)
+    nx.write_gexf(G, filename)
+
+
+def measure(export):
+    tracemalloc.start()
+    start = time.perf_counter()
+    export()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo y memoria máxima de la exportación de grafos: networkx vs escritura directa")
+    parser.add_argument("-n", "--retweets", type=int, default=200000, help="Cantidad de retweets sintéticos")
+    parser.add_argument("-u", "--users", type=int, default=50000, help="Cantidad de usuarios distintos")
+    parser.add_argument("-gw", "--graph_weights", action="store_true", help="Incluir el peso de cada arista")
+    args = parser.parse_args()
+
+    store = TweetStore()
+    for tweet in synthetic_retweets(args.retweets, args.users):
+        process_retweet(tweet, store)
+    edges = list(store.retweet_edges().items())
+
+    exports = [("networkx gexf", "gexf", lambda filename: write_networkx_gexf(filename, store.names, edges, args.graph_weights))]
+    for graph_format in GRAPH_FORMATS:
+        exports.append((f"directo {graph_format}", graph_format,
+                        lambda filename, graph_format=graph_format: write_graph(filename, store.names, edges, graph_format, args.graph_weights)))
+
+    print(f"aristas: {len(edges)}")
+    print(f"{'exportación':<18}{'tiempo (s)':>12}{'MB':>8}{'pico MiB':>10}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, extension, export in exports:
+            filename = os.path.join(output_dir, f"rt.{extension}")
+            elapsed, peak = measure(lambda: export(filename))
+            baseline = baseline or elapsed
+            size = os.path.getsize(filename) / 1e6
+            print(f"{name:<18}{elapsed:>12.2f}{size:>8.1f}{peak / 2**20:>10.1f}  ({baseline / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_memory import synthetic_retweets
+from generador import (TweetStore, compute_coretweets, coretweet_records, mention_records, process_retweet,
+                       retweet_records, write_json_records)
+
+
+def write_whole_document(filename, key, records, json_format):
+    # Camino anterior: el documento completo se arma en memoria y se escribe con json.dump
+    document = {key: list(records)}
+    with open(filename, "w", encoding="utf-8") as json_file:
+        json.dump(document, json_file, ensure_ascii=False, indent=2)
+    return os.path.getsize(filename)
+
+
+def measure(writer, filename, key, make_records, json_format):
+    tracemalloc.start()
+    start = time.perf_counter()
+    written = writer(filename, key, make_records(), json_format)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return written, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendimiento (MB/s) y memoria máxima de los escritores JSON")
+    parser.add_argument("-n", "--retweets", type=int, default=200000, help="Cantidad de retweets sintéticos")
+    parser.add_argument("-u", "--users", type=int, default=20000, help="Cantidad de usuarios distintos")
+    args = parser.parse_args()
+
+    store = TweetStore()
+    for tweet in synthetic_retweets(args.retweets, args.users):
+        process_retweet(tweet, store)
+    coretweets = compute_coretweets(store.author_retweeters())
+
+    outputs = (
+        ("rt", "retweets", lambda: retweet_records(store)),
+        ("mención", "mentions", lambda: mention_records(store)),
+        ("corrtw", "coretweets", lambda: coretweet_records(store, coretweets)),
+    )
+    modes = (
+        ("documento completo", write_whole_document, "indent"),
+        ("streaming indent", write_json_records, "indent"),
+        ("streaming compact", write_json_records, "compact"),
+        ("streaming ndjson", write_json_records, "ndjson"),
+    )
+    print(f"{'salida':<10}{'modo':<20}{'MB':>9}{'MB/s':>9}{'pico MiB':>10}")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, key, make_records in outputs:
+            for mode, writer, json_format in modes:
+                filename = os.path.join(output_dir, f"{name}.json")
+                written, elapsed, peak = measure(writer, filename, key, make_records, json_format)
+                size = written / 1e6
+                print(f"{name:<10}{mode:<20}{size:>9.1f}{size / elapsed:>9.1f}{peak / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
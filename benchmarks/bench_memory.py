@@ -0,0 +1,91 @@
+import argparse
+import gc
+import json
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from generador import TweetStore, process_retweet
+
+
+def legacy_process_retweet(tweet, retweets_info, mentions_info):
+    # Estructura anterior: diccionarios anidados con los screen_name repetidos en cada lista
+    original = tweet['retweeted_status']
+    author = original['user']['screen_name']
+    tweet_id = str(original['id'])
+    retweets_info.setdefault(author, {"tweets": {}})
+    retweets_info[author]["tweets"].setdefault(tweet_id, {"retweetedBy": []})
+    retweets_info[author]["tweets"][tweet_id]["retweetedBy"].append(tweet['user']['screen_name'])
+    for mentioned in set(mention['screen_name'] for mention in original['entities']['user_mentions']):
+        mentions_info.setdefault(mentioned, {"mentions": []})
+        mentions_info[mentioned]["mentions"].append({"mentionBy": author, "tweets": [tweet_id]})
+
+
+def synthetic_retweets(n, users, seed=0):
+    # Cada línea pasa por json.loads para que los nombres sean cadenas nuevas, como al leer un archivo
+    rng = random.Random(seed)
+    originals = max(n // 20, 1)
+    for _ in range(n):
+        original = rng.randrange(originals)
+        author = int(rng.paretovariate(1.1)) % users
+        mentioned = [f"user{(original * 7 + k) % users}" for k in range(original % 3)]
+        line = json.dumps({
+            "id_str": str(10**17 + rng.randrange(10**9)),
+            "user": {"screen_name": f"user{rng.randrange(users)}"},
+            "retweeted_status": {
+                "id": 10**17 + original,
+                "user": {"screen_name": f"user{author}"},
+                "entities": {"hashtags": [], "user_mentions": [{"screen_name": name} for name in mentioned]},
+            },
+        })
+        yield json.loads(line)
+
+
+def measure(n, users, ingest):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = ingest(synthetic_retweets(n, users))
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    payload = len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    return current, payload, elapsed
+
+
+def ingest_legacy(tweets):
+    retweets_info, mentions_info = {}, {}
+    for tweet in tweets:
+        legacy_process_retweet(tweet, retweets_info, mentions_info)
+    return retweets_info, mentions_info
+
+
+def ingest_store(tweets):
+    store = TweetStore()
+    for tweet in tweets:
+        process_retweet(tweet, store)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria retenida por millón de retweets: diccionarios anidados vs TweetStore")
+    parser.add_argument("-n", "--retweets", type=int, default=200000, help="Cantidad de retweets sintéticos")
+    parser.add_argument("-u", "--users", type=int, default=200000, help="Cantidad de usuarios distintos")
+    args = parser.parse_args()
+
+    scale = 1000000 / args.retweets
+    print(f"retweets: {args.retweets}  usuarios: {args.users}")
+    print(f"{'estructura':<22}{'MiB/millón':>12}{'pickle MiB/millón':>20}{'tiempo (s)':>12}")
+    for name, ingest in (("diccionarios", ingest_legacy), ("TweetStore", ingest_store)):
+        current, payload, elapsed = measure(args.retweets, args.users, ingest)
+        print(f"{name:<22}{current * scale / 2**20:>12.1f}{payload * scale / 2**20:>20.1f}{elapsed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
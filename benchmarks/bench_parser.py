@@ -0,0 +1,72 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from generador import TweetStore, make_tweet_parser, orjson, process_original_tweet, process_retweet, read_tweet_lines, simdjson
+
+
+def full_tweet(i, retweeted_status=None):
+    # Tweet con el tamaño aproximado de la API (perfil de usuario, urls, multimedia, etc.)
+    user = {key: f"{key} {i}" for key in ("name", "description", "location", "url", "profile_image_url",
+                                           "profile_banner_url", "profile_background_color", "lang", "time_zone")}
+    user.update({f"count_{k}": i * k for k in range(15)})
+    user["screen_name"] = f"user{i % 500}"
+    tweet = {
+        "created_at": "Wed Oct 10 20:19:24 +0000 2018", "id": 10**17 + i, "id_str": str(10**17 + i),
+        "text": "lorem ipsum " * 20, "source": "<a href=\"http://twitter.com\">Twitter Web Client</a>", "user": user,
+        "entities": {
+            "hashtags": [{"text": "Chile", "indices": [1, 5]}],
+            "urls": [{"url": "https://t.co/x", "expanded_url": "https://example.com/" * 3, "indices": [3, 4]}] * 2,
+            "user_mentions": [{"screen_name": f"user{i % 77}", "name": "Nombre", "id": i, "id_str": str(i), "indices": [0, 3]}],
+        },
+        "extended_entities": {"media": [{"id": i, "media_url": "http://x/" * 5,
+                                         "sizes": {size: {"w": 1, "h": 2, "resize": "fit"} for size in ("thumb", "small", "medium", "large")}}]},
+        "place": None, "coordinates": None, "retweet_count": 3, "favorite_count": 5, "lang": "es",
+    }
+    if retweeted_status is not None:
+        tweet["retweeted_status"] = retweeted_status
+    return tweet
+
+
+def timed(lines, parser, process):
+    parse_tweet = make_tweet_parser(parser)
+    store = TweetStore()
+    start = time.perf_counter()
+    for line in lines:
+        tweet = parse_tweet(line)
+        if process:
+            if 'retweeted_status' in tweet:
+                process_retweet(tweet, store)
+            else:
+                process_original_tweet(tweet, store)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tweets por segundo de cada lector JSON disponible")
+    parser.add_argument("-f", "--file", help="Archivo .json.bz2 de muestra (por defecto se generan tweets sintéticos)")
+    parser.add_argument("-n", "--tweets", type=int, default=50000, help="Cantidad de tweets sintéticos")
+    args = parser.parse_args()
+
+    if args.file:
+        lines = list(read_tweet_lines(args.file))
+    else:
+        lines = [json.dumps(full_tweet(i, full_tweet(i + 1) if i % 2 else None)).encode() for i in range(args.tweets)]
+
+    backends = ["json"] + (["orjson"] if orjson is not None else []) + (["simdjson"] if simdjson is not None else [])
+    print(f"tweets: {len(lines)}  tamaño medio: {sum(map(len, lines)) / len(lines):.0f} bytes")
+    print(f"{'lector':<10}{'lectura (tweets/s)':>22}{'lectura + proceso (tweets/s)':>32}")
+    baseline = None
+    for backend in backends:
+        parse_rate = timed(lines, backend, False)
+        total_rate = timed(lines, backend, True)
+        baseline = baseline or total_rate
+        print(f"{backend:<10}{parse_rate:>22,.0f}{total_rate:>32,.0f}  ({total_rate / baseline:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
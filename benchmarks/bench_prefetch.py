@@ -0,0 +1,101 @@
+import argparse
+import builtins
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import generador
+from generador import DEFAULT_BUFFER_SIZE, Prefetcher, read_and_process_files
+from make_corpus import write_corpus
+
+# Almacenamiento simulado: (latencia por lectura en segundos, ancho de banda en bytes/s)
+STORAGES = {
+    "local": None,
+    "disco": (0.010, 40e6),
+    "nfs": (0.003, 8e6),
+}
+
+
+class ThrottledRaw(io.RawIOBase):
+    # Archivo que tarda latency más size / bandwidth en cada lectura, como un disco de
+    # platos sin caché o un montaje NFS. waited acumula la espera simulada.
+    waited = 0.0
+
+    def __init__(self, path, latency, bandwidth):
+        self.file = io.FileIO(path, "rb")
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.file.readinto(buffer)
+        delay = self.latency + count / self.bandwidth
+        ThrottledRaw.waited += delay
+        time.sleep(delay)
+        return count
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def throttled_open(latency, bandwidth):
+    def open_file(file, mode="r", buffering=-1, *args, **kwargs):
+        if mode != "rb":
+            return builtins.open(file, mode, buffering, *args, **kwargs)
+        return io.BufferedReader(ThrottledRaw(file, latency, bandwidth), buffering if buffering > 0 else DEFAULT_BUFFER_SIZE)
+    return open_file
+
+
+def read_only(corpus, buffer_size):
+    # Solo lectura y descompresión: es la cota inferior del tiempo con prefetch, que a lo
+    # sumo esconde el procesamiento detrás de la lectura
+    file_paths = list(Path(corpus).rglob('*.json.bz2'))
+    with Prefetcher(file_paths, 2, buffer_size) as prefetcher:
+        for file_path in file_paths:
+            for line in prefetcher.lines(file_path):
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ganancia de solapar lectura/descompresión y procesamiento (--prefetch) con almacenamiento lento simulado")
+    parser.add_argument("-f", "--files", type=int, default=8, help="Archivos del corpus sintético")
+    parser.add_argument("-t", "--tweets", type=int, default=5000, help="Tweets por archivo")
+    parser.add_argument("-p", "--prefetch", default="0,2,8", help="Profundidades de prefetch separadas por comas")
+    parser.add_argument("-s", "--storage", default=",".join(STORAGES), help="Almacenamientos simulados: " + ", ".join(STORAGES))
+    parser.add_argument("-bs", "--buffer_size", type=int, default=DEFAULT_BUFFER_SIZE, help="Tamaño del búfer de lectura en bytes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as corpus:
+        paths = write_corpus(corpus, args.files, args.tweets)
+        print(f"{sum(path.stat().st_size for path in paths) / 1e6:.1f} MB comprimidos en {len(paths)} archivos")
+        print(f"{'almacenamiento':<16}{'prefetch':>9}{'E/S (s)':>9}{'tiempo (s)':>12}{'tweets/s':>11}{'aceleración':>13}")
+        for storage in args.storage.split(","):
+            baseline = None
+            for depth in (int(depth) for depth in args.prefetch.split(",")):
+                if STORAGES[storage] is None:
+                    generador.open = builtins.open
+                else:
+                    generador.open = throttled_open(*STORAGES[storage])
+                if baseline is None:
+                    start = time.perf_counter()
+                    read_only(corpus, args.buffer_size)
+                    print(f"{storage:<16}{'lectura':>9}{'':>9}{time.perf_counter() - start:>12.2f}")
+                ThrottledRaw.waited = 0.0
+                start = time.perf_counter()
+                store = read_and_process_files(corpus, buffer_size=args.buffer_size, prefetch=depth)
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed
+                tweets = len(store.tweet_author)
+                print(f"{storage:<16}{depth:>9}{ThrottledRaw.waited:>9.2f}{elapsed:>12.2f}{tweets / elapsed:>11,.0f}{baseline / elapsed:>13.2f}")
+        generador.open = builtins.open
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import http.client
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from generador import QueryService, latency_percentile, load_service_records, make_query_server
+from make_corpus import write_corpus
+
+
+def get(connection, route, **params):
+    connection.request("GET", f"{route}?{urlencode(params)}")
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de las consultas del modo servicio (-sv) sin caché y desde la caché LRU")
+    parser.add_argument("-f", "--files", type=int, default=8, help="Archivos del corpus sintético")
+    parser.add_argument("-t", "--tweets", type=int, default=5000, help="Tweets por archivo")
+    parser.add_argument("-u", "--users", type=int, default=50, help="Usuarios consultados (los más retuiteados)")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Veces que se repite cada consulta")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as corpus:
+        write_corpus(corpus, args.files, args.tweets)
+        start = time.perf_counter()
+        service = QueryService(load_service_records(corpus))
+        print(f"{args.files * args.tweets} tweets cargados en {time.perf_counter() - start:.2f} s")
+
+        server = make_query_server("0", service)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        users = [record["username"] for record in service.base.top("rt", args.users)]
+        # Cortes de un mes como "menciones de Y en marzo"
+        queries = [("/top", {"tipo": "rt", "k": 100}), ("/top", {"tipo": "corretweets", "k": 100})]
+        for user in users:
+            queries += [("/rt", {"usuario": user}), ("/menciones", {"usuario": user}), ("/vecinos", {"usuario": user, "k": 20}),
+                        ("/corretweets", {"usuario": user}), ("/menciones", {"usuario": user, "fi": "01-03-16", "ff": "31-03-16"})]
+
+        round_trips = {False: [], True: []}
+        for repetition in range(args.repeat):
+            for route, params in queries:
+                start = time.perf_counter()
+                get(connection, route, **params)
+                round_trips[repetition > 0].append(time.perf_counter() - start)
+        connection.close()
+        server.shutdown()
+        server.server_close()
+
+        statistics = service.statistics()
+        print(f"{'ruta':<16}{'origen':<10}{'consultas':>11}{'p50 (ms)':>11}{'p99 (ms)':>11}")
+        for route, origins in statistics["routes"].items():
+            for origin, summary in origins.items():
+                print(f"{route:<16}{'caché' if origin == 'cached' else 'cálculo':<10}{summary['count']:>11}{summary['p50Ms']:>11.3f}{summary['p99Ms']:>11.3f}")
+        for cached, samples in round_trips.items():
+            if samples:
+                print(f"ida y vuelta {'repetidas' if cached else 'primeras':<10}: p50 {latency_percentile(samples, 0.5):.3f} ms, p99 {latency_percentile(samples, 0.99):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from make_corpus import write_corpus
+
+ROOT = Path(__file__).resolve().parent.parent
+INGEST_STAGES = ("descompresión", "lectura JSON", "filtrado", "agregación", "caché")
+
+
+def stage_wall(summary, *stages):
+    return sum(summary["stages"].get(stage, {}).get("wall", 0.0) for stage in stages)
+
+
+def run(command, cwd, stats_path):
+    start = time.perf_counter()
+    subprocess.run(command, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+    with open(stats_path, encoding="utf-8") as stats_file:
+        return elapsed, json.load(stats_file)
+
+
+def stage_times(report, processes):
+    # Lectura por proceso: el máximo entre procesos con MPI y el promedio con --workers.
+    # Con MPI los corretweets también se reparten entre procesos.
+    total = report["total"]
+    if "ranks" in report:
+        ingest = max(stage_wall(summary, *INGEST_STAGES) for summary in report["ranks"])
+        merge = max(stage_wall(summary, "combinación") for summary in report["ranks"])
+        coretweets = max(stage_wall(summary, "corretweets") for summary in report["ranks"])
+    else:
+        ingest = stage_wall(total, *INGEST_STAGES) / processes
+        merge = stage_wall(total, "combinación")
+        coretweets = stage_wall(total, "corretweets")
+    return ingest, merge, coretweets, total["tweets"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Curvas de escalamiento de generador.py (--workers) y generadorp.py (MPI) sobre corpus sintéticos")
+    parser.add_argument("-t", "--tweets", default="20000,80000", help="Tamaños del corpus en tweets, separados por comas")
+    parser.add_argument("-f", "--files", type=int, default=16, help="Archivos por corpus")
+    parser.add_argument("-p", "--processes", default="1,2,4", help="Cantidades de procesos separadas por comas")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="Repeticiones por configuración (se informa la mejor)")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Semilla del corpus")
+    parser.add_argument("-k", "--keep", help="Directorio donde guardar (y reutilizar) los corpus generados")
+    parser.add_argument("-o", "--output", help="Guardar los resultados en este archivo JSON")
+    parser.add_argument("--mpiexec", default=shutil.which("mpiexec"), help="Ejecutable de MPI (sin él solo se mide --workers)")
+    args = parser.parse_args()
+
+    mpi_flags = ["--allow-run-as-root", "--oversubscribe"] if os.geteuid() == 0 else []
+    results = []
+    print(f"{'tweets':>8}{'modo':>9}{'procesos':>10}{'total (s)':>11}{'lectura (s)':>13}{'combinación (s)':>17}{'corretweets (s)':>17}{'tweets/s':>11}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_root = Path(args.keep or work_dir)
+        for tweets in (int(t) for t in args.tweets.split(",")):
+            corpus = corpus_root / f"corpus_{tweets}_{args.files}_{args.seed}"
+            if not corpus.exists():
+                write_corpus(corpus, args.files, max(tweets // args.files, 1), seed=args.seed)
+
+            for processes in (int(p) for p in args.processes.split(",")):
+                stats_path = Path(work_dir) / "stats.json"
+                common = ["-d", str(corpus), "-jrt", "-jcrt", "-sj", str(stats_path)]
+                commands = [("workers", [sys.executable, str(ROOT / "generador.py"), *common, "-w", str(processes)])]
+                if args.mpiexec:
+                    commands.append(("mpi", [args.mpiexec, *mpi_flags, "-n", str(processes), sys.executable, str(ROOT / "generadorp.py"), *common]))
+
+                for mode, command in commands:
+                    elapsed, report = min((run(command, work_dir, stats_path) for _ in range(args.repeat)), key=lambda result: result[0])
+                    ingest, merge, coretweets, total_tweets = stage_times(report, processes)
+                    results.append({"tweets": total_tweets, "mode": mode, "processes": processes, "total": elapsed,
+                                    "ingest": ingest, "merge": merge, "coretweets": coretweets})
+                    print(f"{total_tweets:>8}{mode:>9}{processes:>10}{elapsed:>11.2f}{ingest:>13.2f}{merge:>17.2f}{coretweets:>17.2f}{total_tweets / elapsed:>11,.0f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
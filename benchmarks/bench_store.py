@@ -0,0 +1,51 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from generador import compile_date_filter, compile_store, read_and_process_files
+from make_corpus import write_corpus
+
+# Consultas: (nombre, -fi, -ff, lista de hashtags)
+QUERIES = [
+    ("todo", None, None, None),
+    ("un mes", "01-03-16", "31-03-16", None),
+    ("hashtags", None, None, ["tag1*", "ñandú"]),
+    ("mes y hashtags", "01-03-16", "31-03-16", ["tag1*", "ñandú"]),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lectura de .json.bz2 vs caché (-c) vs almacén columnar compilado (-cs/-st) para consultas por fecha y hashtags")
+    parser.add_argument("-f", "--files", type=int, default=27, help="Archivos del corpus sintético")
+    parser.add_argument("-t", "--tweets", type=int, default=5000, help="Tweets por archivo")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus, cache_dir, store_dir = (Path(work_dir) / name for name in ("corpus", "cache", "store"))
+        file_paths = write_corpus(corpus, args.files, args.tweets)
+        start = time.perf_counter()
+        compile_store(sorted(corpus.rglob('*.json.bz2')), store_dir, cache_dir=cache_dir)
+        print(f"{args.files * args.tweets} tweets, {sum(path.stat().st_size for path in file_paths) / 1e6:.1f} MB comprimidos; "
+              f"almacén de {sum(path.stat().st_size for path in store_dir.iterdir()) / 1e6:.1f} MB compilado en {time.perf_counter() - start:.2f} s")
+        print(f"{'consulta':<16}{'lectura':<10}{'tiempo (s)':>12}{'tweets':>10}{'aceleración':>13}")
+        sources = [("json.bz2", {}), ("caché", {"cache_dir": cache_dir}), ("almacén", {"store_dir": store_dir})]
+        for name, fi, ff, hashtags in QUERIES:
+            hashtags_file = None
+            if hashtags is not None:
+                hashtags_file = Path(work_dir) / "hashtags.txt"
+                hashtags_file.write_text("\n".join(hashtags), encoding="utf-8")
+            baseline = None
+            for source, options in sources:
+                start = time.perf_counter()
+                store = read_and_process_files(corpus, hashtags_file, compile_date_filter(fi, ff), **options)
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed
+                print(f"{name:<16}{source:<10}{elapsed:>12.3f}{len(store.tweet_author):>10}{baseline / elapsed:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
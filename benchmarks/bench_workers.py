@@ -0,0 +1,40 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run(command, cwd):
+    start = time.perf_counter()
+    subprocess.run(command, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara generador.py --workers N con generadorp.py bajo mpiexec -n N")
+    parser.add_argument("-d", "--directory", required=True, help="Directorio con archivos *.json.bz2")
+    parser.add_argument("-p", "--processes", default="1,2,4", help="Cantidades de procesos separadas por comas")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Repeticiones por configuración (se informa la mejor)")
+    parser.add_argument("--mpiexec", default=shutil.which("mpiexec") or "mpiexec", help="Ejecutable de MPI")
+    args = parser.parse_args()
+
+    directory = str(Path(args.directory).resolve())
+    mpi_flags = ["--allow-run-as-root", "--oversubscribe"] if os.geteuid() == 0 else []
+    print(f"{'procesos':>8}{'--workers (s)':>16}{'MPI (s)':>12}{'workers/MPI':>14}")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for processes in (int(p) for p in args.processes.split(",")):
+            sequential = [sys.executable, str(ROOT / "generador.py"), "-d", directory, "-jrt", "-w", str(processes)]
+            parallel = [args.mpiexec, *mpi_flags, "-n", str(processes), sys.executable, str(ROOT / "generadorp.py"), "-d", directory, "-jrt"]
+            workers_time = min(run(sequential, output_dir) for _ in range(args.repeat))
+            mpi_time = min(run(parallel, output_dir) for _ in range(args.repeat))
+            print(f"{processes:>8}{workers_time:>16.2f}{mpi_time:>12.2f}{workers_time / mpi_time:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
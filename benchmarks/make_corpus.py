@@ -0,0 +1,123 @@
+import argparse
+import bz2
+import json
+import random
+from bisect import bisect
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+from pathlib import Path
+
+# Hashtags con acentos y mayúsculas para ejercitar la normalización de -h
+ACCENTED_HASHTAGS = ["ñandú", "Educación", "MÚSICA", "Perú", "São_Paulo", "Ｃｈｉｌｅ"]
+
+
+class ZipfSampler:
+    # Muestreo con probabilidad proporcional a 1 / rango^alpha sobre n elementos. Los rangos
+    # se asignan a los elementos con una permutación propia, así el usuario más retuiteado
+    # no es también el que más retuitea.
+    def __init__(self, rng, n, alpha):
+        self.rng = rng
+        self.cum_weights = list(accumulate(1.0 / (rank ** alpha) for rank in range(1, n + 1)))
+        self.items = list(range(n))
+        rng.shuffle(self.items)
+
+    def __call__(self):
+        return self.items[bisect(self.cum_weights, self.rng.random() * self.cum_weights[-1])]
+
+
+def created_at(moment):
+    return moment.strftime("%a %b %d %H:%M:%S +0000 %Y")
+
+
+def make_user(user):
+    return {"id": 10**6 + user, "id_str": str(10**6 + user), "screen_name": f"user{user}", "name": f"Usuario {user}",
+            "followers_count": user * 7 % 5000, "lang": "es", "description": "cuenta sintética " * 3}
+
+
+def write_corpus(out_dir, files=20, tweets_per_file=5000, users=20000, hashtags=500, seed=0,
+                 author_alpha=1.1, retweeter_alpha=0.8, mention_alpha=1.0, hashtag_alpha=1.2,
+                 retweet_ratio=0.6, mentions_per_tweet=1.0, hashtags_per_tweet=1.0,
+                 start="2016-01-01", days=270):
+    # Escribe files archivos .json.bz2 con tweets_per_file tweets cada uno, en directorios
+    # año/mes/día. Los archivos se reparten entre los days días y cada uno solo tiene tweets
+    # del día de su directorio (si hay más archivos que días, se dividen el día). Con la
+    # misma semilla y parámetros el corpus es idéntico byte a byte.
+    rng = random.Random(seed)
+    authors = ZipfSampler(rng, users, author_alpha)
+    retweeters = ZipfSampler(rng, users, retweeter_alpha)
+    mentioned = ZipfSampler(rng, users, mention_alpha)
+    tag_names = [f"tag{k}" for k in range(hashtags - len(ACCENTED_HASHTAGS))] + ACCENTED_HASHTAGS
+    tags = ZipfSampler(rng, len(tag_names), hashtag_alpha)
+
+    start = datetime.fromisoformat(start)
+    file_days = [file_index * days // files for file_index in range(files)]
+    files_per_day = Counter(file_days)
+    next_id = 10**17
+    latest_original = {}
+    paths = []
+    for file_index, day in enumerate(file_days):
+        file_span = timedelta(days=1) / files_per_day[day]
+        file_start = start + timedelta(days=day) + file_span * (file_index - file_days.index(day))
+        offsets = sorted(rng.random() * file_span.total_seconds() for _ in range(tweets_per_file))
+        path = Path(out_dir) / file_start.strftime("%Y/%m/%d") / f"{file_start:%H}_{file_index:04d}.json.bz2"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with bz2.open(path, "wt", encoding="utf-8") as out:
+            for offset in offsets:
+                moment = file_start + timedelta(seconds=offset)
+                next_id += rng.randrange(1, 1000)
+                author = authors()
+                original = latest_original.get(author)
+                if original is not None and rng.random() < retweet_ratio:
+                    tweet = {
+                        "created_at": created_at(moment), "id": next_id, "id_str": str(next_id),
+                        "text": "RT @{}: {}".format(original["user"]["screen_name"], original["text"]),
+                        "user": make_user(retweeters()), "entities": original["entities"],
+                        "retweeted_status": original, "lang": "es",
+                    }
+                else:
+                    entities = {
+                        "hashtags": [{"text": tag_names[tags()], "indices": [0, 1]}
+                                     for _ in range(int(rng.expovariate(1 / hashtags_per_tweet)))],
+                        "user_mentions": [{"screen_name": f"user{mentioned()}", "indices": [0, 1]}
+                                          for _ in range(int(rng.expovariate(1 / mentions_per_tweet)))],
+                    }
+                    tweet = {
+                        "created_at": created_at(moment), "id": next_id, "id_str": str(next_id),
+                        "text": "tweet sintético " * rng.randrange(1, 8), "user": make_user(author),
+                        "entities": entities, "lang": "es", "retweet_count": 0,
+                    }
+                    latest_original[author] = tweet
+                out.write(json.dumps(tweet, ensure_ascii=False) + "\n")
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un corpus sintético y reproducible de archivos .json.bz2")
+    parser.add_argument("-o", "--output", required=True, help="Directorio de salida")
+    parser.add_argument("-f", "--files", type=int, default=20, help="Cantidad de archivos")
+    parser.add_argument("-t", "--tweets", type=int, default=5000, help="Tweets por archivo")
+    parser.add_argument("-u", "--users", type=int, default=20000, help="Cantidad de usuarios distintos")
+    parser.add_argument("-ht", "--hashtags", type=int, default=500, help="Cantidad de hashtags distintos")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Semilla del generador")
+    parser.add_argument("--author_alpha", type=float, default=1.1, help="Exponente de la ley de potencias de los autores retuiteados")
+    parser.add_argument("--retweeter_alpha", type=float, default=0.8, help="Exponente de la ley de potencias de los retweeters")
+    parser.add_argument("--mention_alpha", type=float, default=1.0, help="Exponente de la ley de potencias de los usuarios mencionados")
+    parser.add_argument("--hashtag_alpha", type=float, default=1.2, help="Exponente de la ley de potencias de los hashtags")
+    parser.add_argument("--retweet_ratio", type=float, default=0.6, help="Proporción de retweets")
+    parser.add_argument("--mentions_per_tweet", type=float, default=1.0, help="Menciones promedio por tweet original")
+    parser.add_argument("--hashtags_per_tweet", type=float, default=1.0, help="Hashtags promedio por tweet original")
+    parser.add_argument("--start", default="2016-01-01", help="Fecha del primer tweet (aaaa-mm-dd)")
+    parser.add_argument("--days", type=int, default=270, help="Días que abarca el corpus")
+    args = parser.parse_args()
+
+    paths = write_corpus(args.output, args.files, args.tweets, args.users, args.hashtags, args.seed,
+                         args.author_alpha, args.retweeter_alpha, args.mention_alpha, args.hashtag_alpha,
+                         args.retweet_ratio, args.mentions_per_tweet, args.hashtags_per_tweet, args.start, args.days)
+    size = sum(path.stat().st_size for path in paths)
+    print(f"{len(paths)} archivos, {len(paths) * args.tweets} tweets, {size / 1e6:.1f} MB comprimidos en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,82 @@ import os
 import argparse
 import sys
 import bz2
+import io
+import heapq
+import hashlib
 import json
-import networkx as nx
+import math
+import re
+import select
+import socketserver
+import unicodedata
+from fnmatch import translate
+import csv
+import pickle
+import queue
+import random
+import struct
+import tempfile
+import threading
 import time
-from collections import defaultdict
-from itertools import combinations
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain, combinations, groupby
+from operator import itemgetter
 import glob
 from pathlib import Path
-from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+from datetime import date, datetime
 import shutil
+from array import array
+from xml.sax.saxutils import quoteattr
 
-def parse_args():
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Tamaño por defecto del búfer de lectura de los archivos comprimidos (1 MiB)
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+TWEET_PARSERS = ("auto", "orjson", "simdjson", "json")
+
+GRAPH_FORMATS = ("gexf", "graphml", "csv")
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Descripción de tu script.", add_help=False)
     parser.add_argument("-d", "--directory", required=True, help="Directorio de entrada")
     parser.add_argument("-fi", "--fecha_inicial", help="Fecha inicial en formato dd-mm-aa")
     parser.add_argument("-ff", "--fecha_final", help="Fecha final en formato dd-mm-aa")
-    parser.add_argument("-h", "--hashtags_file", help="Nombre de archivo de texto con hashtags")
+    parser.add_argument("-h", "--hashtags_file", help="Nombre de archivo de texto con hashtags (uno por línea; admite prefijos como chile* y comodines * y ?)")
+    parser.add_argument("-ix", "--date_index", help="Archivo con el primer y último día de cada .json.bz2; se crea o actualiza en cada ejecución y con -fi/-ff se omiten los archivos fuera de la ventana")
+    parser.add_argument("-dl", "--date_layout", action="store_true", help="Deducir el día de cada archivo de los directorios año/mes/día (±1 día) como pista; solo se omiten los archivos fuera de -fi/-ff cuyo rango confirma -ix o -c")
+    parser.add_argument("-bs", "--buffer_size", type=int, default=DEFAULT_BUFFER_SIZE, help="Tamaño del búfer de lectura en bytes")
+    parser.add_argument("-sb", "--split_bz2", type=int, help="Dividir los .json.bz2 de al menos estos MB en partes de bloques bzip2 que se leen en paralelo (con -w o MPI; no se usa con -c)")
+    parser.add_argument("-pf", "--prefetch", type=int, default=0, help="Bloques descomprimidos (de --buffer_size bytes) que un hilo lector adelanta mientras se procesan los tweets; 0 lo desactiva (no se usa con -c)")
+    parser.add_argument("-c", "--cache", help="Directorio de la caché de resultados parciales por archivo")
+    parser.add_argument("-st", "--store", help="Leer los tweets del almacén columnar compilado con -cs en lugar de los .json.bz2 de -d (requiere NumPy)")
+    parser.add_argument("-m", "--memory_limit", type=int, help="Límite de memoria en MiB para las filas agregadas; al superarlo se vuelcan a disco y las salidas se calculan fuera de memoria (en generadorp.py solo en el proceso 0)")
+    parser.add_argument("-sd", "--spill_dir", help="Directorio para los archivos temporales de -m (por defecto el temporal del sistema)")
+    parser.add_argument("-p", "--parser", choices=TWEET_PARSERS, default="auto", help="Lector JSON de los tweets (auto usa orjson o simdjson si están instalados)")
     
     # New options for graph and JSON generation
     parser.add_argument("-grt", "--generate_retweet_graph", action="store_true", help="Generar grafo de retweets")
@@ -27,328 +87,3005 @@ def parse_args():
     parser.add_argument("-jm", "--generate_mentions_json", action="store_true", help="Generar JSON de menciones")
     parser.add_argument("-gcrt", "--generate_corretweet_graph", action="store_true", help="Generar grafo de corretweets")
     parser.add_argument("-jcrt", "--generate_corretweet_json", action="store_true", help="Generar JSON de corretweets")
+    parser.add_argument("-gf", "--graph_format", choices=GRAPH_FORMATS, default="gexf", help="Formato de los grafos: GEXF (Gephi), GraphML o lista de aristas CSV")
+    parser.add_argument("-gw", "--graph_weights", action="store_true", help="Agregar a los grafos de retweets y menciones el peso de cada arista (cantidad de retweets o menciones)")
+    parser.add_argument("-jf", "--json_format", choices=["indent", "compact", "ndjson"], default="indent", help="Formato de los JSON: con sangría, compacto o un registro por línea (NDJSON)")
+    parser.add_argument("-lm", "--mentions_layout", choices=["occurrence", "grouped"], default="occurrence", help="Menciones en el JSON: una entrada por mención (occurrence) o una por par de usuarios con el total y sus tweets (grouped)")
+    parser.add_argument("-pr", "--profile", action="store_true", help="Mostrar tiempo de pared, CPU y memoria máxima de cada etapa")
+    parser.add_argument("-sj", "--stats_json", help="Guardar el informe de etapas en este archivo JSON (activa --profile)")
+    parser.add_argument("-ax", "--approx", action="store_true", help="Modo aproximado: bocetos de memoria fija (Space-Saving, Count-Min, HyperLogLog y MinHash) en lugar de los agregados exactos; escribe rt_aprox, mención_aprox y corrtw_aprox con sus cotas de error (no se usa con -c, -st ni -m)")
+    parser.add_argument("-axc", "--approx_capacity", type=int, default=2000, help="Con --approx, usuarios candidatos que sigue cada Space-Saving")
+    parser.add_argument("-mcrt", "--min_coretweets", type=int, default=1, help="Mínimo de retweeters en común para incluir un par de autores")
+    parser.add_argument("-kcrt", "--top_coretweets", type=int, help="Incluir solo los K pares de autores con más corretweets")
+    return parser
+
+def parse_args():
+    parser = build_parser()
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Cantidad de procesos para leer los archivos en paralelo")
+    parser.add_argument("-lv", "--live", type=float, help="Modo continuo: vigila -d (o lee NDJSON de la entrada estándar con -d -) y reescribe rt, mención y corrtw en JSON cada LIVE segundos")
+    parser.add_argument("-vw", "--window", type=float, help="Con -lv, ventana deslizante en horas: los tweets más viejos que el último leído menos la ventana salen de los agregados")
+    parser.add_argument("-sv", "--serve", help="Modo servicio: carga los agregados una vez y responde consultas HTTP en este puerto local o socket Unix (ruta)")
+    parser.add_argument("-cs", "--compile_store", help="Compilar los .json.bz2 de -d en un almacén columnar en este directorio, para leerlo después con -st (requiere NumPy)")
+    parser.add_argument("-qc", "--query_cache", type=int, default=1024, help="Con -sv, cantidad de resultados de consultas que se guardan en la caché LRU")
 
     args = parser.parse_args()
+    if args.directory == "-" and args.live is None:
+        parser.error("-d - (entrada estándar) solo se admite con -lv")
+    if args.serve is not None and args.live is not None:
+        parser.error("-sv y -lv no se pueden usar juntos")
+    if args.approx and (args.cache or args.store or args.memory_limit is not None or args.live is not None or args.serve is not None or args.compile_store):
+        parser.error("--approx no se usa con -c, -st, -m, -lv, -sv ni -cs")
     return args.directory, args.fecha_inicial, args.fecha_final, args.hashtags_file, args
 
 def get_tweet_id(tweet):
     return tweet['id_str'] if 'retweeted_status' in tweet else str(tweet['id'])
 
-def validate_tweet_date(tweet, fi, ff):
-    if 'created_at' in tweet:
-        tweet_date_str = tweet['created_at']
-        
-        # Convertir la fecha del tweet al formato deseado
-        tweet_date = datetime.strptime(tweet_date_str, "%a %b %d %H:%M:%S +0000 %Y").date()
-            
-        if fi is not None:
-            # Convertir la fecha inicial al formato deseado
-            fi = datetime.strptime(fi, "%d-%m-%y").date()
-            #print("soy fi: ",fi)
-            if tweet_date < fi:
-                return False
-
-        if ff is not None:
-            # Convertir la fecha final al formato deseado
-            ff = datetime.strptime(ff, "%d-%m-%y").date()
-            if tweet_date > ff:
-                return False
-
-        # Si no se generó ninguna excepción, la fecha se validó correctamente
-        return True
-
+# Meses abreviados tal como aparecen en el campo created_at de la API de Twitter
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+def created_at_day(created_at):
+    # Ordinal del día de created_at; formato "Wed Oct 10 20:19:24 +0000 2018"
+    if len(created_at) == 30 and created_at[19:26] == ' +0000 ':
+        return date(int(created_at[26:]), MONTHS[created_at[4:7]], int(created_at[8:10])).toordinal()
+    return datetime.strptime(created_at, "%a %b %d %H:%M:%S +0000 %Y").date().toordinal()
+
+class DateFilter:
+    # Ventana de fechas precompilada: -fi/-ff se convierten una sola vez en ordinales
+    # enteros y cada created_at se resuelve con una caché indexada por su fecha
+    def __init__(self, fi=None, ff=None):
+        self.lower = datetime.strptime(fi, "%d-%m-%y").date().toordinal() if fi is not None else None
+        self.upper = datetime.strptime(ff, "%d-%m-%y").date().toordinal() if ff is not None else None
+        self._cache = {}
+
+    def contains(self, day):
+        return (self.lower is None or day >= self.lower) and (self.upper is None or day <= self.upper)
+
+    def accepts(self, created_at):
+        # Formato "Wed Oct 10 20:19:24 +0000 2018": el día solo depende del mes, el día y el año
+        if len(created_at) != 30 or created_at[19:26] != ' +0000 ':
+            return self.contains(created_at_day(created_at))
+        key = created_at[4:10] + created_at[26:]
+        accepted = self._cache.get(key)
+        if accepted is None:
+            accepted = self._cache[key] = self.contains(created_at_day(created_at))
+        return accepted
+
+    def __call__(self, tweet):
+        created_at = tweet.get('created_at')
+        return created_at is None or self.accepts(created_at)
+
+    def overlaps(self, first, last):
+        return (self.lower is None or last >= self.lower) and (self.upper is None or first <= self.upper)
+
+def compile_date_filter(fi=None, ff=None):
+    if fi is None and ff is None:
+        return None
+    return DateFilter(fi, ff)
+
+class DaySpan:
+    # Primer y último día de los tweets de un archivo. Si algún tweet no trae created_at el
+    # filtro de fechas lo acepta siempre, así que el archivo queda sin rango (None).
+    def __init__(self):
+        self.first = None
+        self.last = None
+        self.undated = False
+        self._days = {}
+
+    def add_day(self, day):
+        if day < 0:
+            self.undated = True
+        elif self.first is None:
+            self.first = self.last = day
+        elif day < self.first:
+            self.first = day
+        elif day > self.last:
+            self.last = day
+
+    def add_line(self, line, parse_tweet):
+        # Día de una línea descartada antes de decodificarla. En los tweets de la API de Twitter
+        # created_at es la primera clave, así que se lee de la línea sin decodificar el JSON;
+        # si la línea no empieza así (u otro formato), se decodifica entera
+        match = CREATED_AT_IN_LINE.match(line)
+        if match is None:
+            self.add(parse_tweet(line))
+            return
+        created_at = match.group(1)
+        key = created_at[4:10] + created_at[26:]
+        day = self._days.get(key)
+        if day is None:
+            day = self._days[key] = created_at_day(created_at.decode('ascii'))
+        self.add_day(day)
+
+    def add(self, tweet):
+        # Solo cuentan los tweets que llegan al filtro de fechas (los avisos sin usuario se ignoran)
+        if 'user' not in tweet:
+            return
+        created_at = tweet.get('created_at')
+        if created_at is None:
+            self.undated = True
+            return
+        key = created_at[4:10] + created_at[26:]
+        day = self._days.get(key)
+        if day is None:
+            day = self._days[key] = created_at_day(created_at)
+        self.add_day(day)
+
+    def range(self):
+        if self.undated or self.first is None:
+            return None
+        return self.first, self.last
+
+# Un tweet con al menos un hashtag tiene "hashtags": [{ en la línea JSON sin decodificar
+HASHTAGS_IN_LINE = re.compile(rb'"hashtags"\s*:\s*\[\s*\{')
+# created_at del tweet cuando es la primera clave de la línea, como en la API de Twitter
+CREATED_AT_IN_LINE = re.compile(rb'\s*\{\s*"created_at"\s*:\s*"([^"]*)"')
+
+# Etapas de filtrado, en el orden en que se aplican a cada tweet
+FILTER_STAGES = ("línea sin hashtags", "sin hashtags", "hashtags", "fecha")
+
+def normalize_hashtag(tag):
+    # Comparación sin distinguir mayúsculas ni variantes Unicode (NFKC + casefold)
+    return unicodedata.normalize("NFKC", unicodedata.normalize("NFKC", tag).casefold())
+
+class HashtagFilter:
+    # Lista de hashtags normalizada una sola vez. Las entradas exactas van a un conjunto,
+    # las terminadas en * a un conjunto de prefijos agrupados por largo y el resto de los
+    # comodines a una sola expresión regular. El resultado de cada hashtag leído se guarda
+    # en una caché, así cada texto distinto se normaliza y compara una sola vez.
+    def __init__(self, hashtags):
+        self.exact = set()
+        self.prefixes = set()
+        patterns = []
+        for tag in hashtags:
+            tag = normalize_hashtag(tag.strip().lstrip('#'))
+            if not tag:
+                continue
+            if tag.endswith('*') and not any(char in tag[:-1] for char in '*?['):
+                self.prefixes.add(tag[:-1])
+            elif any(char in tag for char in '*?['):
+                patterns.append(translate(tag))
+            else:
+                self.exact.add(tag)
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.prefixes})
+        self.pattern = re.compile('|'.join(patterns)) if patterns else None
+        self._cache = {}
+
+    def __bool__(self):
+        return bool(self.exact or self.prefixes or self.pattern)
+
+    def matches(self, text):
+        matched = self._cache.get(text)
+        if matched is None:
+            tag = normalize_hashtag(text)
+            matched = (tag in self.exact
+                       or any(tag[:length] in self.prefixes for length in self.prefix_lengths if len(tag) >= length)
+                       or (self.pattern is not None and self.pattern.match(tag) is not None))
+            self._cache[text] = matched
+        return matched
+
+    def rejects(self, tweet):
+        # Etapa que descarta el tweet, o None si alguno de sus hashtags está en la lista
+        hashtags = (tweet.get('entities') or {}).get('hashtags')
+        if not hashtags:
+            return "sin hashtags"
+        for tag in hashtags:
+            if self.matches(tag['text']):
+                return None
+        return "hashtags"
+
+def compile_hashtag_filter(hashtags=None):
+    hashtag_filter = HashtagFilter(hashtags or ())
+    return hashtag_filter if hashtag_filter else None
+
+def load_hashtag_filter(hashtags_file=None):
+    if not hashtags_file:
+        return None
+    with open(hashtags_file, 'r', encoding='utf-8') as file:
+        return compile_hashtag_filter(file.read().splitlines())
+
+def print_rejected(rejected):
+    if rejected:
+        print("Tweets descartados por etapa:")
+        for stage in FILTER_STAGES:
+            if stage in rejected:
+                print(f"  {stage}: {rejected[stage]}")
+
+# Etapas del informe de --profile, en orden de ejecución
+PROFILE_STAGES = ("descubrimiento", "bloques bz2", "descompresión", "lectura JSON", "filtrado", "agregación", "caché",
+                  "almacén", "combinación", "corretweets", "escritura JSON", "escritura grafos")
+INGEST_STAGES = ("descompresión", "lectura JSON", "filtrado", "agregación", "caché", "almacén")
+
+def peak_rss_mib():
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+class Profile:
+    # Tiempo de pared y tiempo de CPU acumulados por etapa, más los volúmenes leídos. Al combinar
+    # perfiles de varios procesos los tiempos se suman. La memoria de cada etapa es el máximo RSS
+    # del proceso alcanzado al terminarla (ru_maxrss no baja), no lo que usó la etapa por sí sola.
+    def __init__(self):
+        self.wall = {}
+        self.cpu = {}
+        self.peak_rss = {}
+        self.tweets = 0
+        self.compressed_bytes = 0
+        self.json_bytes = 0
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def add(self, stage, wall, cpu):
+        self.wall[stage] = self.wall.get(stage, 0.0) + wall
+        self.cpu[stage] = self.cpu.get(stage, 0.0) + cpu
+        self.peak_rss[stage] = max(self.peak_rss.get(stage, 0.0), peak_rss_mib())
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def merge(self, other):
+        for stage in other.wall:
+            self.wall[stage] = self.wall.get(stage, 0.0) + other.wall[stage]
+            self.cpu[stage] = self.cpu.get(stage, 0.0) + other.cpu[stage]
+            self.peak_rss[stage] = max(self.peak_rss.get(stage, 0.0), other.peak_rss[stage])
+        self.tweets += other.tweets
+        self.compressed_bytes += other.compressed_bytes
+        self.json_bytes += other.json_bytes
+        return self
+
+    def summary(self):
+        ingest_wall = sum(self.wall.get(stage, 0.0) for stage in INGEST_STAGES)
+        rate = lambda amount: amount / ingest_wall if ingest_wall > 0 else 0.0
+        return {
+            "stages": {stage: {"wall": self.wall[stage], "cpu": self.cpu[stage], "peak_rss_mib": self.peak_rss[stage]}
+                       for stage in PROFILE_STAGES if stage in self.wall},
+            "wall": time.perf_counter() - self.start_wall,
+            "cpu": time.process_time() - self.start_cpu,
+            "peak_rss_mib": peak_rss_mib(),
+            "tweets": self.tweets,
+            "compressed_bytes": self.compressed_bytes,
+            "json_bytes": self.json_bytes,
+            "tweets_per_s": rate(self.tweets),
+            "compressed_mb_per_s": rate(self.compressed_bytes / 1e6),
+            "json_mb_per_s": rate(self.json_bytes / 1e6),
+        }
+
+def stage_timer(profile):
+    # profile.stage si hay perfil; si no, un contexto que no mide nada
+    return profile.stage if profile is not None else lambda name: nullcontext()
+
+def print_profile(summary):
+    print(f"{'Etapa':<18}{'Pared (s)':>11}{'CPU (s)':>10}{'RSS máx acumulado (MiB)':>25}")
+    for stage, times in summary["stages"].items():
+        print(f"{stage:<18}{times['wall']:>11.2f}{times['cpu']:>10.2f}{times['peak_rss_mib']:>25.1f}")
+    print(f"{'total':<18}{summary['wall']:>11.2f}{summary['cpu']:>10.2f}{summary['peak_rss_mib']:>25.1f}")
+    print(f"Tweets: {summary['tweets']} ({summary['tweets_per_s']:,.0f} tweets/s), "
+          f"comprimido: {summary['compressed_bytes'] / 1e6:.1f} MB ({summary['compressed_mb_per_s']:.1f} MB/s), "
+          f"JSON: {summary['json_bytes'] / 1e6:.1f} MB ({summary['json_mb_per_s']:.1f} MB/s)")
+
+def save_profile(filename, report):
+    report = dict(report, command=sys.argv, date=datetime.now().isoformat(timespec="seconds"))
+    with open(filename, "w", encoding="utf-8") as stats_file:
+        json.dump(report, stats_file, ensure_ascii=False, indent=2)
+
+class TweetStore:
+    # Almacén compacto de retweets y menciones: cada screen_name se registra una sola vez en
+    # una tabla de símbolos y los tweets se guardan como columnas de enteros. Los nombres
+    # solo se vuelven a materializar al generar los JSON y los grafos.
+    def __init__(self, spilled=None):
+        self.names = []
+        self.name_ids = {}
+        # Con -m, las filas que superan el límite de memoria se vuelcan a disco (SpilledRows)
+        self.spilled = spilled
+        # Tweets en orden de llegada: autor, id del tweet y quién lo retuiteó (-1 si es original)
+        self.tweet_author = array('i')
+        self.tweet_id = array('q')
+        self.tweet_retweeter = array('i')
+        # Menciones agrupadas por par (mencionado, quien menciona): una fila por par distinto
+        # y, por cada mención, el número de par y el tweet
+        self.mention_pairs = {}
+        self.pair_user = array('i')
+        self.pair_by = array('i')
+        self.mention_pair = array('i')
+        self.mention_tweet = array('q')
+        # Cantidad de tweets descartados por cada etapa de filtrado
+        self.rejected = {}
+        # Primer y último día de cada archivo leído, para el índice de fechas (-ix)
+        self.file_days = {}
+
+    def __getstate__(self):
+        # La tabla inversa se reconstruye al recibir el objeto, así se envía menos por MPI
+        state = self.__dict__.copy()
+        del state['name_ids']
+        del state['mention_pairs']
+        state['spilled'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.name_ids = {name: name_id for name_id, name in enumerate(self.names)}
+        self.mention_pairs = {pair: pair_id for pair_id, pair in enumerate(zip(self.pair_user, self.pair_by))}
+
+    def intern(self, name):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def pair_id(self, mentioned, mention_by):
+        pair_id = self.mention_pairs.get((mentioned, mention_by))
+        if pair_id is None:
+            pair_id = self.mention_pairs[(mentioned, mention_by)] = len(self.pair_user)
+            self.pair_user.append(mentioned)
+            self.pair_by.append(mention_by)
+        return pair_id
+
+    def reject(self, stage, count=1):
+        self.rejected[stage] = self.rejected.get(stage, 0) + count
+
+    def add_tweet(self, author, tweet_id, retweeter=None):
+        self.tweet_author.append(self.intern(author))
+        self.tweet_id.append(int(tweet_id))
+        self.tweet_retweeter.append(-1 if retweeter is None else self.intern(retweeter))
+
+    def add_mention(self, mentioned, mention_by, tweet_id):
+        self.mention_pair.append(self.pair_id(self.intern(mentioned), self.intern(mention_by)))
+        self.mention_tweet.append(int(tweet_id))
+
+    def merge(self, other):
+        # Traduce los identificadores de la otra tabla de símbolos a los de esta; el -1 final
+        # mantiene la marca de tweet original
+        remap = [self.intern(name) for name in other.names]
+        remap.append(-1)
+        self.tweet_author.extend(remap[i] for i in other.tweet_author)
+        self.tweet_id.extend(other.tweet_id)
+        self.tweet_retweeter.extend(remap[i] for i in other.tweet_retweeter)
+        pair_remap = [self.pair_id(remap[mentioned], remap[mention_by]) for mentioned, mention_by in zip(other.pair_user, other.pair_by)]
+        self.mention_pair.extend(pair_remap[i] for i in other.mention_pair)
+        self.mention_tweet.extend(other.mention_tweet)
+        for stage, count in other.rejected.items():
+            self.reject(stage, count)
+        for signature, day_range in other.file_days.items():
+            self.add_file_days(signature, day_range)
+        return self
+
+    def add_file_days(self, signature, day_range):
+        # Las partes de un archivo dividido con -sb aportan cada una su rango de días
+        if signature in self.file_days:
+            previous = self.file_days[signature]
+            day_range = None if previous is None or day_range is None else (min(previous[0], day_range[0]), max(previous[1], day_range[1]))
+        self.file_days[signature] = day_range
+
+    def memory_bytes(self):
+        # Memoria aproximada de las filas (la tabla de nombres siempre queda en memoria)
+        return (16 * len(self.tweet_author) + 12 * len(self.mention_pair)
+                + (8 + MENTION_PAIR_BYTES) * len(self.pair_user))
+
+    def spill_if_needed(self):
+        if self.spilled is not None and self.memory_bytes() > self.spilled.memory_limit:
+            self.spill_rows()
+
+    def spill_rows(self):
+        # Vuelca las filas a corridas ordenadas (tweets por autor, menciones por usuario
+        # mencionado), cada una con su posición en el orden de llegada, y vacía el almacén
+        spilled = self.spilled
+        author, tweet_id, retweeter = self.tweet_author, self.tweet_id, self.tweet_retweeter
+        if author:
+            base = spilled.tweet_rows
+            order = sorted(range(len(author)), key=author.__getitem__)
+            spilled.tweets.add_run((author[row], base + row, tweet_id[row], retweeter[row]) for row in order)
+            spilled.tweet_rows += len(author)
+        if self.mention_pair:
+            base = spilled.mention_rows
+            pair_user, pair_by, mention_pair, mention_tweet = self.pair_user, self.pair_by, self.mention_pair, self.mention_tweet
+            mentioned = array('i', (pair_user[pair] for pair in mention_pair))
+            order = sorted(range(len(mentioned)), key=mentioned.__getitem__)
+            spilled.mentions.add_run((mentioned[row], base + row, pair_by[mention_pair[row]], mention_tweet[row]) for row in order)
+            spilled.mention_rows += len(mentioned)
+        self.tweet_author = array('i')
+        self.tweet_id = array('q')
+        self.tweet_retweeter = array('i')
+        self.mention_pairs = {}
+        self.pair_user = array('i')
+        self.pair_by = array('i')
+        self.mention_pair = array('i')
+        self.mention_tweet = array('q')
+
+    def retweets_info(self):
+        # {autor: {"tweets": {id: {"retweetedBy": [...]}}}} en el orden de llegada de los tweets
+        names = self.names
+        retweets_info = {}
+        for author, tweet_id, retweeter in zip(self.tweet_author, self.tweet_id, self.tweet_retweeter):
+            tweets = retweets_info.setdefault(names[author], {"tweets": {}})["tweets"]
+            retweeted_by = tweets.setdefault(str(tweet_id), {"retweetedBy": []})["retweetedBy"]
+            if retweeter >= 0:
+                retweeted_by.append(names[retweeter])
+        return retweets_info
+
+    def mentions_info(self):
+        names = self.names
+        mentions_info = {}
+        for pair, tweet_id in zip(self.mention_pair, self.mention_tweet):
+            mentioned, mention_by = self.pair_user[pair], self.pair_by[pair]
+            mentions = mentions_info.setdefault(names[mentioned], {"mentions": []})["mentions"]
+            mentions.append({"mentionBy": names[mention_by], "tweets": [str(tweet_id)]})
+        return mentions_info
+
+    def author_retweeters(self):
+        # Conjunto de retweeters (como ids) de cada autor con al menos un retweet, en el
+        # orden en que aparecieron los autores
+        retweeters = {author: set() for author in dict.fromkeys(self.tweet_author)}
+        for author, retweeter in zip(self.tweet_author, self.tweet_retweeter):
+            if retweeter >= 0:
+                retweeters[author].add(retweeter)
+        return {author: users for author, users in retweeters.items() if users}
+
+    def retweet_edges(self):
+        # Aristas autor-retweeter con la cantidad de retweets de cada par
+        return undirected_edge_weights((author, retweeter) for author, retweeter in zip(self.tweet_author, self.tweet_retweeter) if retweeter >= 0)
+
+    def mention_edges(self):
+        # Aristas mencionado-quien menciona con la cantidad de menciones de cada par
+        weights = {}
+        for pair, count in Counter(self.mention_pair).items():
+            mentioned, mention_by = self.pair_user[pair], self.pair_by[pair]
+            edge = (mention_by, mentioned) if (mention_by, mentioned) in weights else (mentioned, mention_by)
+            weights[edge] = weights.get(edge, 0) + count
+        return weights
+
+def undirected_edge_weights(pairs):
+    # Los pares dirigidos se cuentan primero (Counter) y después (b, a) se suma a (a, b) si
+    # ya apareció, en una sola arista no dirigida; el diccionario conserva el orden de aparición
+    weights = {}
+    for (u, v), count in Counter(pairs).items():
+        edge = (v, u) if (v, u) in weights else (u, v)
+        weights[edge] = weights.get(edge, 0) + count
+    return weights
+
+def accepts_tweet(tweet, original, store, hashtag_filter=None, date_filter=None):
+    # Los hashtags se revisan en el tweet original y la fecha en el tweet leído; cada
+    # rechazo se cuenta en la etapa que lo descartó
+    if hashtag_filter is not None:
+        stage = hashtag_filter.rejects(original)
+        if stage is not None:
+            store.reject(stage)
+            return False
+    if date_filter is not None and not date_filter(tweet):
+        store.reject("fecha")
+        return False
     return True
 
-def process_original_tweet(tweet, retweets_info, mentions_info, hashtags_set=None, fi=None, ff=None):
-    if fi is not None or ff is not None:
-        if not validate_tweet_date(tweet, fi, ff):
-            # Validation failed, do something or simply return
+# Registros de tamaño fijo de las corridas en disco de -m
+TWEET_RECORD = struct.Struct('<iqqi')        # autor, orden de llegada, id del tweet, retweeter
+MENTION_RECORD = struct.Struct('<iqiq')      # mencionado, orden de llegada, quien menciona, tweet
+EDGE_RECORD = struct.Struct('<iiqiii')       # extremo menor, extremo mayor, primera aparición, u, v, cantidad
+ORDERED_EDGE_RECORD = struct.Struct('<qiii')  # primera aparición, u, v, peso
+AUTHOR_RECORD = struct.Struct('<ii')         # retweeter, índice del autor
+SHARED_RECORD = struct.Struct('<iii')        # índice del autor 1, índice del autor 2, retweeter
+RANKED_RECORD = struct.Struct('<qiiqi')      # -corretweets, autor 1, autor 2, posición y cantidad de retweeters
+# Memoria estimada de una fila de mention_pairs y de una tupla en el búfer de un ExternalSorter
+MENTION_PAIR_BYTES = 160
+SORT_RECORD_BYTES = 200
+# Registros leídos o escritos por bloque y corridas abiertas a la vez al mezclar
+RUN_BATCH = 65536
+MAX_MERGE_RUNS = 64
+
+def write_run(path, record, records):
+    pack = record.pack
+    with open(path, 'wb') as run_file:
+        batch = []
+        for item in records:
+            batch.append(pack(*item))
+            if len(batch) == RUN_BATCH:
+                run_file.write(b''.join(batch))
+                batch = []
+        run_file.write(b''.join(batch))
+
+def read_run(path, record, start=0, count=None):
+    # Registros de una corrida; con start y count, solo ese tramo
+    with open(path, 'rb') as run_file:
+        run_file.seek(start * record.size)
+        while count is None or count > 0:
+            batch = RUN_BATCH if count is None else min(RUN_BATCH, count)
+            chunk = run_file.read(batch * record.size)
+            if not chunk:
+                break
+            yield from record.iter_unpack(chunk)
+            if count is not None:
+                count -= batch
+
+class Reiterable:
+    # Iterable que crea un iterador nuevo en cada recorrido (para salidas que leen dos veces)
+    def __init__(self, make_iterator):
+        self.make_iterator = make_iterator
+
+    def __iter__(self):
+        return self.make_iterator()
+
+class ExternalSorter:
+    # Ordena tuplas de enteros con memoria acotada: se acumulan hasta max_records, se escriben
+    # ordenadas como corridas en disco y al recorrerlas se mezclan con heapq.merge. Si todo
+    # entra en memoria no se escribe nada. Se puede recorrer varias veces.
+    def __init__(self, directory, record, max_records):
+        self.directory = directory
+        self.record = record
+        self.max_records = max(max_records, 1)
+        self.buffer = []
+        self.runs = []
+
+    def add(self, item):
+        self.buffer.append(item)
+        if len(self.buffer) >= self.max_records:
+            self.buffer.sort()
+            self.add_run(self.buffer)
+            self.buffer = []
+
+    def add_run(self, records):
+        # records ya viene ordenado
+        handle, path = tempfile.mkstemp(suffix='.run', dir=self.directory)
+        os.close(handle)
+        write_run(path, self.record, records)
+        self.runs.append(path)
+
+    def __iter__(self):
+        if self.buffer:
+            self.buffer.sort()
+            if not self.runs:
+                return iter(self.buffer)
+            self.add_run(self.buffer)
+            self.buffer = []
+        while len(self.runs) > MAX_MERGE_RUNS:
+            group, self.runs = self.runs[:MAX_MERGE_RUNS], self.runs[MAX_MERGE_RUNS:]
+            self.add_run(heapq.merge(*(read_run(path, self.record) for path in group)))
+            for path in group:
+                os.remove(path)
+        return heapq.merge(*(read_run(path, self.record) for path in self.runs))
+
+    def discard(self):
+        for path in self.runs:
+            os.remove(path)
+        self.buffer = []
+        self.runs = []
+
+class SpilledRows:
+    # Filas de un TweetStore volcadas a disco con -m. Al generar las salidas las corridas se
+    # mezclan en un archivo por tipo con un índice por usuario (inicio, filas, primera
+    # aparición), así cada registro del ranking se arma leyendo solo las filas de ese
+    # usuario. Aristas y corretweets se calculan con ordenamientos externos y salen en el
+    # mismo orden que en memoria.
+    def __init__(self, memory_limit, spill_dir=None):
+        self.memory_limit = memory_limit
+        self.directory = tempfile.mkdtemp(prefix='generador-', dir=spill_dir)
+        # Cada etapa tiene a lo sumo dos búferes de ordenamiento llenándose a la vez
+        self.max_records = memory_limit // (2 * SORT_RECORD_BYTES)
+        self.tweets = self.sorter(TWEET_RECORD)
+        self.mentions = self.sorter(MENTION_RECORD)
+        self.tweet_rows = 0
+        self.mention_rows = 0
+        self._tweet_index = None
+        self._mention_index = None
+
+    def sorter(self, record):
+        return ExternalSorter(self.directory, record, self.max_records)
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def merge_runs(self, sorter, record, user_count, count_retweets=False):
+        # Mezcla las corridas en un solo archivo ordenado por usuario y orden de llegada
+        handle, path = tempfile.mkstemp(suffix='.sorted', dir=self.directory)
+        os.close(handle)
+        start, rows, first_seq, received = (array('q', bytes(8 * user_count)) for _ in range(4))
+
+        def indexed(records):
+            for position, item in enumerate(records):
+                user = item[0]
+                if rows[user] == 0:
+                    start[user] = position
+                    first_seq[user] = item[1]
+                rows[user] += 1
+                if count_retweets and item[3] >= 0:
+                    received[user] += 1
+                yield item
+
+        write_run(path, record, indexed(sorter))
+        sorter.discard()
+        return path, start, rows, first_seq, received
+
+    def tweet_index(self, user_count):
+        if self._tweet_index is None:
+            self._tweet_index = self.merge_runs(self.tweets, TWEET_RECORD, user_count, count_retweets=True)
+        return self._tweet_index
+
+    def mention_index(self, user_count):
+        if self._mention_index is None:
+            self._mention_index = self.merge_runs(self.mentions, MENTION_RECORD, user_count)
+        return self._mention_index
+
+    def retweet_records(self, names):
+        path, start, rows, first_seq, received = self.tweet_index(len(names))
+        # Mismo orden que en memoria: más retweets primero y, en empate, por primera aparición
+        ranking = sorted((author for author in range(len(names)) if received[author] > 0),
+                         key=lambda author: (-received[author], first_seq[author]))
+        for author in ranking:
+            tweets = {}
+            for _, _, tweet_id, retweeter in read_run(path, TWEET_RECORD, start[author], rows[author]):
+                retweeted_by = tweets.setdefault("tweetId: {}".format(tweet_id), {"retweetedBy": []})["retweetedBy"]
+                if retweeter >= 0:
+                    retweeted_by.append(names[retweeter])
+            yield {"username": names[author], "receivedRetweets": received[author], "tweets": tweets}
+
+    def mention_records(self, names, layout="occurrence"):
+        path, start, rows, first_seq, received = self.mention_index(len(names))
+        ranking = sorted((mentioned for mentioned in range(len(names)) if rows[mentioned] > 0),
+                         key=lambda mentioned: (-rows[mentioned], first_seq[mentioned]))
+        for mentioned in ranking:
+            occurrences = read_run(path, MENTION_RECORD, start[mentioned], rows[mentioned])
+            if layout == "grouped":
+                groups = {}
+                for _, _, mention_by, tweet_id in occurrences:
+                    groups.setdefault(mention_by, []).append(str(tweet_id))
+                mentions = [{"mentionBy": names[mention_by], "totalMentions": len(tweets), "tweets": tweets}
+                            for mention_by, tweets in groups.items()]
+            else:
+                mentions = [{"mentionBy": names[mention_by], "tweets": [str(tweet_id)]}
+                            for _, _, mention_by, tweet_id in occurrences]
+            yield {"username": names[mentioned], "receivedMentions": rows[mentioned], "mentions": mentions}
+
+    def undirected_edges(self, directed_groups):
+        # directed_groups da, por usuario, los pares dirigidos con su primera aparición y
+        # cantidad. (a, b) y (b, a) se juntan en una arista con la orientación y la posición
+        # del par que apareció primero, igual que undirected_edge_weights.
+        directed = self.sorter(EDGE_RECORD)
+        for user, pairs in directed_groups:
+            for other, (seq, count) in pairs.items():
+                directed.add((min(user, other), max(user, other), seq, user, other, count))
+        ordered = self.sorter(ORDERED_EDGE_RECORD)
+        for _, group in groupby(directed, key=itemgetter(0, 1)):
+            first = next(group)
+            ordered.add((first[2], first[3], first[4], first[5] + sum(item[5] for item in group)))
+        directed.discard()
+        return Reiterable(lambda: (((u, v), weight) for _, u, v, weight in ordered))
+
+    def user_pairs(self, path, record, other_column):
+        # Por cada usuario del archivo ordenado: {otro usuario: [primera aparición, cantidad]}
+        for user, group in groupby(read_run(path, record), key=itemgetter(0)):
+            pairs = {}
+            for item in group:
+                other = item[other_column]
+                if other >= 0:
+                    pair = pairs.get(other)
+                    if pair is None:
+                        pairs[other] = [item[1], 1]
+                    else:
+                        pair[1] += 1
+            yield user, pairs
+
+    def retweet_edges(self, user_count):
+        path = self.tweet_index(user_count)[0]
+        return self.undirected_edges(self.user_pairs(path, TWEET_RECORD, 3))
+
+    def mention_edges(self, user_count):
+        path = self.mention_index(user_count)[0]
+        return self.undirected_edges(self.user_pairs(path, MENTION_RECORD, 2))
+
+    def coretweets(self, user_count, min_coretweets=1, top_k=None):
+        # Mismo cálculo que compute_coretweets con tres ordenamientos externos: retweeter ->
+        # autores, par de autores -> retweeters y pares por cantidad de corretweets
+        path, start, rows, first_seq, received = self.tweet_index(user_count)
+        authors = sorted((author for author in range(user_count) if received[author] > 0), key=first_seq.__getitem__)
+        author_index = {author: index for index, author in enumerate(authors)}
+
+        by_retweeter = self.sorter(AUTHOR_RECORD)
+        for author, group in groupby(read_run(path, TWEET_RECORD), key=itemgetter(0)):
+            index = author_index.get(author)
+            if index is not None:
+                for retweeter in {item[3] for item in group if item[3] >= 0}:
+                    by_retweeter.add((retweeter, index))
+
+        shared = self.sorter(SHARED_RECORD)
+        for retweeter, group in groupby(by_retweeter, key=itemgetter(0)):
+            for i, j in combinations([index for _, index in group], 2):
+                shared.add((i, j, retweeter))
+        by_retweeter.discard()
+
+        ranked = self.sorter(RANKED_RECORD)
+        handle, retweeters_path = tempfile.mkstemp(suffix='.retweeters', dir=self.directory)
+        with os.fdopen(handle, 'wb') as retweeters_file:
+            offset = 0
+            for (i, j), group in groupby(shared, key=itemgetter(0, 1)):
+                common = array('i', (item[2] for item in group))
+                if len(common) >= min_coretweets:
+                    common.tofile(retweeters_file)
+                    ranked.add((-len(common), i, j, offset, len(common)))
+                    offset += len(common)
+        shared.discard()
+
+        def ranked_coretweets():
+            with open(retweeters_path, 'rb') as retweeters_file:
+                for position, (_, i, j, offset, count) in enumerate(ranked):
+                    if top_k is not None and position >= top_k:
+                        break
+                    retweeters_file.seek(4 * offset)
+                    common = array('i')
+                    common.fromfile(retweeters_file, count)
+                    yield (authors[i], authors[j]), list(common)
+        return Reiterable(ranked_coretweets)
+
+def make_spilled_rows(memory_limit=None, spill_dir=None):
+    # memory_limit en MiB; None desactiva el volcado a disco
+    if memory_limit is None:
+        return None
+    return SpilledRows(memory_limit * 2**20, spill_dir)
+
+def process_original_tweet(tweet, store, hashtag_filter=None, date_filter=None):
+    if 'user' in tweet:
+        if not accepts_tweet(tweet, tweet, store, hashtag_filter, date_filter):
             return
 
-    if 'user' in tweet:
         tweet_author_username = tweet['user']['screen_name']
         tweet_id = get_tweet_id(tweet)
+        store.add_tweet(tweet_author_username, tweet_id)
 
-        if 'entities' in tweet and 'hashtags' in tweet['entities']:
-            tweet_hashtags = {tag['text'].lower() for tag in tweet['entities']['hashtags']}
-            if hashtags_set and not tweet_hashtags.intersection(hashtags_set):
-                return
-
-        retweets_info.setdefault(tweet_author_username, {"tweets": {}})
-        retweets_info[tweet_author_username]["tweets"].setdefault(tweet_id, {"retweetedBy": []})
-
-        process_mentions(tweet, mentions_info)
-
-def process_retweet(tweet, retweets_info, mentions_info, hashtags_set=None, fi=None, ff=None):
-    if fi is not None or ff is not None:
-        if not validate_tweet_date(tweet, fi, ff):
-            return
+        process_mentions(tweet, store)
 
+def process_retweet(tweet, store, hashtag_filter=None, date_filter=None):
     if 'retweeted_status' in tweet and 'user' in tweet['retweeted_status']:
-        retweet_author_username = tweet['retweeted_status']['user']['screen_name']
-        retweeted_tweet_id = get_tweet_id(tweet['retweeted_status'])
+        original_tweet = tweet['retweeted_status']
+        if not accepts_tweet(tweet, original_tweet, store, hashtag_filter, date_filter):
+            return
 
-        if 'entities' in tweet['retweeted_status'] and 'hashtags' in tweet['retweeted_status']['entities']:
-            retweet_hashtags = {tag['text'].lower() for tag in tweet['retweeted_status']['entities']['hashtags']}
-            if hashtags_set and not retweet_hashtags.intersection(hashtags_set):
-                return
+        retweet_author_username = original_tweet['user']['screen_name']
+        retweeted_tweet_id = get_tweet_id(original_tweet)
+        store.add_tweet(retweet_author_username, retweeted_tweet_id, tweet['user']['screen_name'])
 
-        retweets_info.setdefault(retweet_author_username, {"tweets": {}})
-        retweets_info[retweet_author_username]["tweets"].setdefault(retweeted_tweet_id, {"retweetedBy": []})
-        retweets_info[retweet_author_username]["tweets"][retweeted_tweet_id]["retweetedBy"].append(tweet['user']['screen_name'])
+        process_mentions(original_tweet, store)
 
-        original_tweet = tweet['retweeted_status']
-        process_mentions(original_tweet, mentions_info)
-
-def process_mentions(tweet, mentions_info):
+def process_mentions(tweet, store):
     if 'entities' in tweet and 'user_mentions' in tweet['entities'] and tweet['entities']['user_mentions']:
-        mentioned_usernames = set(mention['screen_name'] for mention in tweet['entities']['user_mentions'])
+        # dict.fromkeys elimina repetidos conservando el orden de aparición
+        mentioned_usernames = dict.fromkeys(mention['screen_name'] for mention in tweet['entities']['user_mentions'])
+        mention_by = tweet['user']['screen_name']
+        tweet_id = get_tweet_id(tweet)
         for mentioned_username in mentioned_usernames:
-            mentions_info.setdefault(mentioned_username, {"mentions": []})
-            mentions_info[mentioned_username]["mentions"].append({"mentionBy": tweet['user']['screen_name'], "tweets": [get_tweet_id(tweet)]})
-
-def decompress_and_create_json_files(directory, hashtags_file=None, fi=None, ff=None):
-    retweets_info = {}
-    mentions_info = {}
-
-    # Cargar hashtags desde el archivo
-    hashtags_set = set()
-    if hashtags_file:
-        with open(hashtags_file, 'r') as hashtags_file:
-            hashtags_set = {line.strip().lower() for line in hashtags_file}
+            store.add_mention(mentioned_username, mention_by, tweet_id)
+
+# Versión del formato de los registros guardados en la caché (-c)
+RECORDS_VERSION = 1
+
+class FileRecords:
+    # Registros de un archivo antes de aplicar los filtros: una fila por tweet con su día,
+    # autor, id, retweeter (-1 si es original), hashtags y menciones. Permiten recalcular
+    # los agregados con otros -fi/-ff/-h sin volver a leer el .json.bz2.
+    def __init__(self):
+        self.names = []
+        self.name_ids = {}
+        self.tags = []
+        self.tag_ids = {}
+        self.day = array('i')
+        self.author = array('i')
+        self.tweet_id = array('q')
+        self.retweeter = array('i')
+        # tag_end y mention_end marcan dónde terminan los hashtags y menciones de cada fila
+        self.tag_end = array('i')
+        self.row_tags = array('i')
+        self.mention_end = array('i')
+        self.row_mentions = array('i')
+        self._days = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('name_ids', 'tag_ids', '_days'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.name_ids = {name: name_id for name_id, name in enumerate(self.names)}
+        self.tag_ids = {tag: tag_id for tag_id, tag in enumerate(self.tags)}
+        self._days = {}
+
+    def intern(self, name):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def intern_tag(self, tag):
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self.tag_ids[tag] = len(self.tags)
+            self.tags.append(tag)
+        return tag_id
+
+    def add(self, tweet):
+        # Mismas reglas que process_original_tweet, process_retweet y process_mentions
+        if 'retweeted_status' in tweet:
+            original = tweet['retweeted_status']
+            if 'user' not in original:
+                return
+            retweeter = self.intern(tweet['user']['screen_name'])
+        else:
+            original = tweet
+            if 'user' not in tweet:
+                return
+            retweeter = -1
+
+        day = -1
+        if 'created_at' in tweet:
+            created_at = tweet['created_at']
+            day = self._days.get(created_at[:10] + created_at[19:])
+            if day is None:
+                day = self._days[created_at[:10] + created_at[19:]] = created_at_day(created_at)
+
+        self.day.append(day)
+        self.author.append(self.intern(original['user']['screen_name']))
+        self.tweet_id.append(int(get_tweet_id(original)))
+        self.retweeter.append(retweeter)
+
+        # Sin la clave entities.hashtags la fila queda sin hashtags, igual que con la lista vacía
+        entities = original.get('entities')
+        if entities is not None and entities.get('hashtags'):
+            self.row_tags.extend(self.intern_tag(tag['text']) for tag in entities['hashtags'])
+        self.tag_end.append(len(self.row_tags))
+        if entities is not None and entities.get('user_mentions'):
+            mentioned_usernames = dict.fromkeys(mention['screen_name'] for mention in entities['user_mentions'])
+            self.row_mentions.extend(self.intern(name) for name in mentioned_usernames)
+        self.mention_end.append(len(self.row_mentions))
+
+    def day_range(self):
+        if -1 in self.day or not self.day:
+            return None
+        return min(self.day), max(self.day)
+
+    def replay(self, store, hashtag_filter=None, date_filter=None):
+        # Aplica los filtros y agrega las filas aceptadas al TweetStore, en el mismo orden
+        # en que process_file las habría agregado
+        names = self.names
+        name_ids = [-1] * len(names)
+
+        def store_id(name_id):
+            if name_ids[name_id] < 0:
+                name_ids[name_id] = store.intern(names[name_id])
+            return name_ids[name_id]
+
+        tag_matches = [hashtag_filter.matches(tag) for tag in self.tags] if hashtag_filter is not None else None
+        day_matches = {}
+        tag_start = mention_start = 0
+        for row in range(len(self.author)):
+            tag_end = self.tag_end[row]
+            mention_end = self.mention_end[row]
+            accepted = True
+            if tag_matches is not None:
+                if tag_start == tag_end:
+                    store.reject("sin hashtags")
+                    accepted = False
+                elif not any(tag_matches[tag_id] for tag_id in self.row_tags[tag_start:tag_end]):
+                    store.reject("hashtags")
+                    accepted = False
+            day = self.day[row]
+            if accepted and date_filter is not None and day >= 0:
+                accepted = day_matches.get(day)
+                if accepted is None:
+                    accepted = day_matches[day] = date_filter.contains(day)
+                if not accepted:
+                    store.reject("fecha")
+
+            if accepted:
+                author = store_id(self.author[row])
+                tweet_id = self.tweet_id[row]
+                store.tweet_author.append(author)
+                store.tweet_id.append(tweet_id)
+                store.tweet_retweeter.append(-1 if self.retweeter[row] < 0 else store_id(self.retweeter[row]))
+                for mention_index in range(mention_start, mention_end):
+                    store.mention_pair.append(store.pair_id(store_id(self.row_mentions[mention_index]), author))
+                    store.mention_tweet.append(tweet_id)
+
+            tag_start = tag_end
+            mention_start = mention_end
+
+def read_tweet_lines(file_path, buffer_size=DEFAULT_BUFFER_SIZE):
+    # Lee los tweets línea por línea directamente desde el flujo comprimido,
+    # sin escribir copias descomprimidas en el directorio de entrada
+    with open(file_path, 'rb', buffering=buffer_size) as raw, bz2.BZ2File(raw, 'rb') as source:
+        for line in io.BufferedReader(source, buffer_size):
+            if line.strip():
+                yield line
+
+class Prefetcher:
+    # Hilo lector que descomprime los archivos de file_paths, en orden, en bloques de
+    # buffer_size bytes y los deja en una cola de a lo sumo depth bloques. Mientras el hilo
+    # principal procesa un archivo, el lector avanza con el resto y con los siguientes; la
+    # lectura de disco y bz2 liberan el GIL. Con la cola llena el lector espera.
+    def __init__(self, file_paths, depth, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.queue = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.read_files, args=(list(file_paths), buffer_size), daemon=True)
+        self.thread.start()
+
+    def read_files(self, file_paths, buffer_size):
+        try:
+            for file_path in file_paths:
+                with open(file_path, 'rb', buffering=buffer_size) as raw, bz2.BZ2File(raw, 'rb') as source:
+                    while True:
+                        chunk = source.read(buffer_size)
+                        if not self.put((file_path, chunk)):
+                            return
+                        if not chunk:
+                            break
+        except Exception as error:
+            self.put((None, error))
+
+    def put(self, item):
+        # Espera lugar en la cola salvo que el hilo principal ya haya cerrado el lector
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def lines(self, file_path):
+        # Líneas no vacías de file_path, que tiene que ser el siguiente archivo de la lista
+        pending = b''
+        while True:
+            path, chunk = self.queue.get()
+            if path is None:
+                raise chunk
+            if path != file_path:
+                raise RuntimeError(f"Se esperaba {file_path} y el lector entregó {path}")
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield line + b'\n'
+        if pending.strip():
+            yield pending
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_prefetcher(file_paths, depth, buffer_size=DEFAULT_BUFFER_SIZE):
+    # Sin profundidad (o sin archivos) no hay hilo lector y process_file lee como siempre
+    if not depth or not file_paths:
+        return nullcontext()
+    return Prefetcher(file_paths, depth, buffer_size)
+
+def project_tweet(tweet):
+    # Copia solo los campos que usan process_original_tweet, process_retweet y process_mentions
+    record = {}
+    for key in ('created_at', 'id', 'id_str'):
+        if key in tweet:
+            record[key] = tweet[key]
+    if 'user' in tweet:
+        record['user'] = {'screen_name': tweet['user']['screen_name']}
+    if 'entities' in tweet:
+        entities = tweet['entities']
+        record['entities'] = {}
+        if 'hashtags' in entities:
+            record['entities']['hashtags'] = [{'text': tag['text']} for tag in entities['hashtags']]
+        if 'user_mentions' in entities:
+            record['entities']['user_mentions'] = [{'screen_name': mention['screen_name']} for mention in entities['user_mentions']]
+    if 'retweeted_status' in tweet:
+        record['retweeted_status'] = project_tweet(tweet['retweeted_status'])
+    return record
+
+def make_tweet_parser(name="auto"):
+    if name == "auto":
+        name = "orjson" if orjson is not None else "simdjson" if simdjson is not None else "json"
+
+    if name == "orjson":
+        if orjson is None:
+            raise ValueError("El parser orjson no está instalado")
+        fast_loads = orjson.loads
+    elif name == "simdjson":
+        if simdjson is None:
+            raise ValueError("El parser simdjson no está instalado")
+        # simdjson lee el documento de forma perezosa y lo invalida en la siguiente línea,
+        # así que se proyecta enseguida a un registro liviano con los campos necesarios
+        document_parser = simdjson.Parser()
+        fast_loads = lambda line: project_tweet(document_parser.parse(line))
+    else:
+        return json.loads
+
+    def parse_tweet(line):
+        # Las líneas que el parser rápido rechaza (p. ej. surrogates sueltos) se leen con json
+        try:
+            return fast_loads(line)
+        except ValueError:
+            return json.loads(line)
+
+    return parse_tweet
+
+def read_file_records(file_path, buffer_size=DEFAULT_BUFFER_SIZE, parser="auto"):
+    parse_tweet = make_tweet_parser(parser)
+    records = FileRecords()
+    for line in read_tweet_lines(file_path, buffer_size):
+        records.add(parse_tweet(line))
+    return records
+
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return str(Path(file_path).resolve()), stat.st_size, stat.st_mtime_ns
+
+def cache_entry_path(cache_dir, signature):
+    return Path(cache_dir) / (hashlib.sha1(signature[0].encode('utf-8')).hexdigest() + '.rec')
+
+def load_cached_records(cache_dir, file_path):
+    # Devuelve los registros guardados si el archivo no cambió (misma ruta, tamaño y mtime)
+    signature = file_signature(file_path)
+    try:
+        with open(cache_entry_path(cache_dir, signature), 'rb') as cache_file:
+            if pickle.load(cache_file) != (RECORDS_VERSION, signature):
+                return None
+            return pickle.load(cache_file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+def save_cached_records(cache_dir, file_path, records):
+    signature = file_signature(file_path)
+    entry_path = cache_entry_path(cache_dir, signature)
+    entry_path.parent.mkdir(parents=True, exist_ok=True)
+    # Se escribe en un archivo temporal y se renombra para que otro proceso nunca lea una entrada a medias
+    temp_path = entry_path.with_name(f"{entry_path.name}.{os.getpid()}.tmp")
+    with open(temp_path, 'wb') as cache_file:
+        pickle.dump((RECORDS_VERSION, signature), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(records, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, entry_path)
+
+def load_file_records(file_path, buffer_size=DEFAULT_BUFFER_SIZE, parser="auto", cache_dir=None):
+    # Registros del archivo desde la caché (-c) o, si no están o el archivo cambió, leyéndolo
+    records = load_cached_records(cache_dir, file_path) if cache_dir is not None else None
+    if records is None:
+        records = read_file_records(file_path, buffer_size, parser)
+        if cache_dir is not None:
+            save_cached_records(cache_dir, file_path, records)
+    return records
+
+def process_file(file_path, store, hashtag_filter=None, date_filter=None, buffer_size=DEFAULT_BUFFER_SIZE, parser="auto", cache_dir=None, index_days=False, profile=None, prefetcher=None):
+    # Con index_days se guarda en store.file_days el primer y último día del archivo. Con
+    # prefetcher las líneas llegan del hilo lector (Prefetcher) en lugar de leerse aquí.
+    if cache_dir is not None:
+        # Con caché, los filtros se aplican sobre los registros guardados del archivo
+        with stage_timer(profile)("caché"):
+            records = load_file_records(file_path, buffer_size, parser, cache_dir)
+            records.replay(store, hashtag_filter, date_filter)
+            if index_days:
+                store.file_days[file_signature(file_path)] = records.day_range()
+        if profile is not None:
+            profile.tweets += len(records.author)
+        return
+
+    parse_tweet = make_tweet_parser(parser)
+    day_span = DaySpan() if index_days else None
+    lines = prefetcher.lines(file_path) if prefetcher is not None else read_tweet_lines(file_path, buffer_size)
+    if profile is not None:
+        process_lines_profiled(lines, store, hashtag_filter, date_filter, parse_tweet, day_span, profile)
+        profile.compressed_bytes += os.path.getsize(file_path)
+    else:
+        process_lines(lines, store, hashtag_filter, date_filter, parse_tweet, day_span)
+    if day_span is not None:
+        store.file_days[file_signature(file_path)] = day_span.range()
+
+def process_lines(lines, store, hashtag_filter, date_filter, parse_tweet, day_span=None):
+    for line in lines:
+        # Con lista de hashtags, las líneas sin ningún hashtag se descartan sin decodificar el JSON
+        if hashtag_filter is not None and HASHTAGS_IN_LINE.search(line) is None:
+            store.reject("línea sin hashtags")
+            if day_span is not None:
+                day_span.add_line(line, parse_tweet)
+            continue
+        tweet = parse_tweet(line)
+        if day_span is not None:
+            day_span.add(tweet)
+        if 'retweeted_status' in tweet:
+            process_retweet(tweet, store, hashtag_filter, date_filter)
+        else:
+            process_original_tweet(tweet, store, hashtag_filter, date_filter)
+
+def process_lines_profiled(lines, store, hashtag_filter, date_filter, parse_tweet, day_span, profile):
+    # Mismo recorrido que process_lines, midiendo por separado cada etapa de cada línea.
+    # Los filtros se aplican aquí con accepts_tweet y los tweets aceptados se agregan sin filtros.
+    clock, cpu_clock = time.perf_counter, time.process_time
+    stage_wall = dict.fromkeys(("descompresión", "lectura JSON", "filtrado", "agregación"), 0.0)
+    stage_cpu = dict.fromkeys(stage_wall, 0.0)
+    tweets = json_bytes = 0
+
+    def charge(stage, wall, cpu):
+        now, now_cpu = clock(), cpu_clock()
+        stage_wall[stage] += now - wall
+        stage_cpu[stage] += now_cpu - cpu
+        return now, now_cpu
+
+    wall, cpu = clock(), cpu_clock()
+    for line in lines:
+        wall, cpu = charge("descompresión", wall, cpu)
+        tweets += 1
+        json_bytes += len(line)
+        if hashtag_filter is not None and HASHTAGS_IN_LINE.search(line) is None:
+            store.reject("línea sin hashtags")
+            if day_span is not None:
+                day_span.add_line(line, parse_tweet)
+            wall, cpu = charge("filtrado", wall, cpu)
+            continue
+        tweet = parse_tweet(line)
+        wall, cpu = charge("lectura JSON", wall, cpu)
+
+        if day_span is not None:
+            day_span.add(tweet)
+        is_retweet = 'retweeted_status' in tweet
+        original = tweet['retweeted_status'] if is_retweet else tweet
+        accepted = 'user' in original and accepts_tweet(tweet, original, store, hashtag_filter, date_filter)
+        wall, cpu = charge("filtrado", wall, cpu)
+        if accepted:
+            if is_retweet:
+                process_retweet(tweet, store)
+            else:
+                process_original_tweet(tweet, store)
+            wall, cpu = charge("agregación", wall, cpu)
+
+    for stage in stage_wall:
+        profile.add(stage, stage_wall[stage], stage_cpu[stage])
+    profile.tweets += tweets
+    profile.json_bytes += json_bytes
+
+# Marcas de 48 bits de bzip2 que preceden a cada bloque (pi) y al fin de cada flujo (raíz de pi)
+BZ2_BLOCK_MAGIC = 0x314159265359
+BZ2_END_MAGIC = 0x177245385090
+# Bytes por tramo de búsqueda de marcas y bytes comprimidos aproximados por parte de -sb
+BZ2_SCAN_BYTES = 64 * 2**20
+BZ2_SEGMENT_BYTES = 4 * 2**20
+# Bloques siguientes que una parte puede descomprimir para completar su última línea
+BZ2_LOOKAHEAD_BLOCKS = 16
+
+def bz2_marker_patterns():
+    # Las marcas no están alineadas a bytes: para cada desplazamiento de bit se buscan los
+    # 5 bytes que la marca ocupa completos y después se verifican los bits de los extremos
+    patterns = []
+    for magic in (BZ2_BLOCK_MAGIC, BZ2_END_MAGIC):
+        for shift in range(8):
+            patterns.append(((magic << (16 - shift)).to_bytes(8, 'big')[1:6], magic, shift))
+    return patterns
+
+BZ2_MARKER_PATTERNS = bz2_marker_patterns()
+
+def scan_bz2_markers(file_path, start, end):
+    # Marcas que empiezan en los bytes [start, end): (bit, marca, CRC de 32 bits que la sigue)
+    with open(file_path, 'rb') as raw:
+        raw.seek(start)
+        # Los ceros del final completan los 12 bytes que se leen de una marca al final del archivo
+        data = raw.read(end - start + 11) + bytes(12)
+    markers = []
+    for pattern, magic, shift in BZ2_MARKER_PATTERNS:
+        position = data.find(pattern, 1)
+        while 0 < position <= end - start:
+            # 96 bits desde el byte donde empieza la marca: relleno, marca, CRC y resto
+            word = int.from_bytes(data[position - 1:position + 11], 'big')
+            if (word >> (48 - shift)) & 0xffffffffffff == magic:
+                markers.append((8 * (start + position - 1) + shift, magic, (word >> (16 - shift)) & 0xffffffff))
+            position = data.find(pattern, position + 1)
+    markers.sort()
+    return markers
+
+def find_bz2_markers(file_path, map_function=map):
+    # Busca las marcas de todo el archivo por tramos; map_function reparte los tramos entre
+    # procesos (executor.map con -w)
+    size = os.path.getsize(file_path)
+    starts = range(0, size, BZ2_SCAN_BYTES)
+    ends = [min(start + BZ2_SCAN_BYTES, size) for start in starts]
+    return [marker for markers in map_function(scan_bz2_markers, [file_path] * len(starts), starts, ends) for marker in markers]
+
+def combine_bz2_crc(combined, block_crc):
+    return ((combined << 1 | combined >> 31) ^ block_crc) & 0xffffffff
+
+def bz2_blocks(file_path, markers):
+    # Recorre los flujos del archivo y devuelve sus bloques (nivel, bit inicial, bit final,
+    # CRC). Una secuencia de bytes igual a una marca dentro de los datos comprimidos cambia el
+    # CRC combinado de su flujo: en ese caso, o si la estructura no cierra, devuelve None.
+    size = os.path.getsize(file_path)
+    blocks = []
+    position = index = 0
+    with open(file_path, 'rb') as raw:
+        while position < size:
+            raw.seek(position)
+            header = raw.read(4)
+            if header[:3] != b'BZh' or not b'1' <= header[3:] <= b'9':
+                return None
+            if index == len(markers) or markers[index][0] != 8 * (position + 4):
+                return None
+            combined = 0
+            while True:
+                bit, magic, crc = markers[index]
+                index += 1
+                if magic == BZ2_END_MAGIC:
+                    break
+                if index == len(markers):
+                    return None
+                blocks.append((header[3:], bit, markers[index][0], crc))
+                combined = combine_bz2_crc(combined, crc)
+            if combined != crc:
+                return None
+            # Tras la marca de fin y el CRC combinado el flujo se completa hasta el byte
+            position = (bit + 80 + 7) // 8
+    if index != len(markers):
+        return None
+    return blocks
+
+def decompress_bz2_blocks(raw, blocks):
+    # Descomprime bloques consecutivos rearmando, por cada tramo contiguo del mismo nivel, un
+    # flujo independiente: encabezado, los bits de los bloques, marca de fin y CRC combinado
+    output = []
+    group = [blocks[0]]
+    for block in blocks[1:] + [None]:
+        if block is not None and block[0] == group[-1][0] and block[1] == group[-1][2]:
+            group.append(block)
+            continue
+        level, start, end = group[0][0], group[0][1], group[-1][2]
+        raw.seek(start // 8)
+        data = raw.read((end + 7) // 8 - start // 8)
+        bits = (int.from_bytes(data, 'big') >> (8 * len(data) - (end - 8 * (start // 8)))) & ((1 << (end - start)) - 1)
+        combined = 0
+        for _, _, _, crc in group:
+            combined = combine_bz2_crc(combined, crc)
+        bit_count = end - start + 80
+        padding = -bit_count % 8
+        stream = ((((bits << 48) | BZ2_END_MAGIC) << 32 | combined) << padding).to_bytes((bit_count + padding) // 8, 'big')
+        output.append(bz2.decompress(b'BZh' + level + stream))
+        group = [block]
+    return b''.join(output)
+
+def bz2_segments(file_path, markers, processes=1):
+    # Parte el archivo en tramos de bloques comprimidos de hasta BZ2_SEGMENT_BYTES y al menos
+    # 4 por proceso: (bloques, bloques siguientes, es el primero). None si no se puede o no
+    # vale la pena dividirlo.
+    segment_bytes = min(BZ2_SEGMENT_BYTES, os.path.getsize(file_path) // (4 * processes))
+    blocks = bz2_blocks(file_path, markers)
+    if blocks is None:
+        return None
+    segments = []
+    start = 0
+    for index, block in enumerate(blocks):
+        if block[2] - blocks[start][1] >= 8 * segment_bytes or index == len(blocks) - 1:
+            segments.append((blocks[start:index + 1], blocks[index + 1:index + 2 + BZ2_LOOKAHEAD_BLOCKS], start == 0))
+            start = index + 1
+    return segments if len(segments) > 1 else None
+
+def segment_bytes(segment):
+    blocks = segment[0]
+    return (blocks[-1][2] - blocks[0][1]) // 8
+
+def read_segment_lines(file_path, segment):
+    # Líneas que empiezan en el tramo. Salvo en el primero, lo que hay antes del primer salto
+    # de línea es la cola de la última línea del tramo anterior, que la completa
+    # descomprimiendo los bloques siguientes hasta encontrar su salto de línea.
+    blocks, following, first = segment
+    with open(file_path, 'rb') as raw:
+        data = decompress_bz2_blocks(raw, blocks)
+        if not first:
+            newline = data.find(b'\n')
+            if newline < 0:
+                return []
+            data = data[newline + 1:]
+        for count, block in enumerate(following):
+            if count == BZ2_LOOKAHEAD_BLOCKS:
+                raise ValueError(f"{file_path}: una línea ocupa más de {BZ2_LOOKAHEAD_BLOCKS} bloques bzip2; léalo sin -sb")
+            extra = decompress_bz2_blocks(raw, [block])
+            newline = extra.find(b'\n')
+            if newline >= 0:
+                data += extra[:newline + 1]
+                break
+            data += extra
+    return [line for line in io.BytesIO(data) if line.strip()]
+
+def process_bz2_segment(file_path, segment, store, hashtag_filter=None, date_filter=None, parser="auto", index_days=False, profile=None):
+    # Como process_file, para un tramo de bloques de un archivo dividido con -sb
+    with stage_timer(profile)("descompresión"):
+        lines = read_segment_lines(file_path, segment)
+    parse_tweet = make_tweet_parser(parser)
+    day_span = DaySpan() if index_days else None
+    if profile is not None:
+        process_lines_profiled(lines, store, hashtag_filter, date_filter, parse_tweet, day_span, profile)
+        profile.compressed_bytes += segment_bytes(segment)
+    else:
+        process_lines(lines, store, hashtag_filter, date_filter, parse_tweet, day_span)
+    # Un tramo sin tweets no aporta rango (None significaría "hay tweets sin fecha")
+    if day_span is not None and (day_span.undated or day_span.first is not None):
+        store.add_file_days(file_signature(file_path), day_span.range())
+
+def process_bz2_segment_task(file_path, segment, hashtag_filter, date_filter, parser, index_days=False, profiling=False, approx=None):
+    store = new_store(approx=approx)
+    profile = Profile() if profiling else None
+    process_bz2_segment(file_path, segment, store, hashtag_filter, date_filter, parser, index_days, profile)
+    return store, profile
+
+def process_file_task(file_path, hashtag_filter, date_filter, buffer_size, parser, cache_dir, index_days=False, profiling=False, prefetch=0, approx=None):
+    # Tarea de un proceso del pool: devuelve el resultado parcial compacto de un archivo
+    # y, con profiling, el perfil de sus etapas. Con prefetch el archivo se descomprime en
+    # un hilo mientras se procesan sus tweets.
+    store = new_store(approx=approx)
+    profile = Profile() if profiling else None
+    with open_prefetcher([file_path] if cache_dir is None else [], prefetch, buffer_size) as prefetcher:
+        process_file(file_path, store, hashtag_filter, date_filter, buffer_size, parser, cache_dir, index_days, profile, prefetcher)
+    return store, profile
+
+def process_files_with_workers(file_paths, hashtag_filter, date_filter, buffer_size, parser, cache_dir, workers, index_days=False, profile=None, spilled=None, split_bytes=None, prefetch=0, approx=None):
+    store = new_store(spilled, approx)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        if split_bytes is not None and cache_dir is None:
+            # Los archivos de al menos split_bytes se reparten por tramos de bloques bzip2
+            for file_path in file_paths:
+                if file_path.stat().st_size >= split_bytes:
+                    with stage_timer(profile)("bloques bz2"):
+                        segments = bz2_segments(file_path, find_bz2_markers(file_path, executor.map), workers)
+                    if segments is not None:
+                        futures[file_path] = [executor.submit(process_bz2_segment_task, file_path, segment, hashtag_filter, date_filter, parser, index_days, profile is not None, approx)
+                                              for segment in segments]
+
+        # Los archivos más grandes se envían primero para repartir mejor la carga
+        for file_path in sorted(file_paths, key=lambda path: path.stat().st_size, reverse=True):
+            if file_path not in futures:
+                futures[file_path] = [executor.submit(process_file_task, file_path, hashtag_filter, date_filter, buffer_size, parser, cache_dir, index_days, profile is not None, prefetch, approx)]
+
+        # Los resultados parciales se combinan en el orden original de los archivos (y de
+        # los tramos), así la salida es la misma que con un solo proceso
+        for file_path in file_paths:
+            for future in futures.pop(file_path):
+                part, part_profile = future.result()
+                with stage_timer(profile)("combinación"):
+                    store.merge(part)
+                    store.spill_if_needed()
+                if profile is not None:
+                    profile.merge(part_profile)
+
+    return store
+
+# Versión del formato del índice de fechas (-ix)
+DATE_INDEX_VERSION = 1
+
+def load_date_index(index_path):
+    # {ruta: (tamaño, mtime_ns, primer día, último día)}; los días son ordinales o None
+    try:
+        with open(index_path, 'r', encoding='utf-8') as index_file:
+            document = json.load(index_file)
+    except FileNotFoundError:
+        return {}
+    if document.get('version') != DATE_INDEX_VERSION:
+        return {}
+    date_index = {}
+    for path, (size, mtime_ns, first, last) in document['files'].items():
+        day_range = None if first is None else (date.fromisoformat(first).toordinal(), date.fromisoformat(last).toordinal())
+        date_index[path] = (size, mtime_ns, day_range)
+    return date_index
+
+def save_date_index(index_path, date_index, file_days):
+    # Agrega los rangos recién calculados y reescribe el índice de forma atómica
+    for (path, size, mtime_ns), day_range in file_days.items():
+        date_index[path] = (size, mtime_ns, day_range)
+    files = {}
+    for path, (size, mtime_ns, day_range) in sorted(date_index.items()):
+        first, last = (None, None) if day_range is None else (date.fromordinal(day_range[0]).isoformat(), date.fromordinal(day_range[1]).isoformat())
+        files[path] = [size, mtime_ns, first, last]
+    index_path = Path(index_path)
+    temp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as index_file:
+        # Una línea por archivo, para poder revisar el índice a mano
+        entries = ",\n".join(f"  {json.dumps(path, ensure_ascii=False)}: {json.dumps(entry)}" for path, entry in files.items())
+        index_file.write('{"version": %d, "files": {\n%s\n}}\n' % (DATE_INDEX_VERSION, entries))
+    os.replace(temp_path, index_path)
+
+def layout_day_range(file_path, base_path):
+    # Rango deducido de directorios año/mes[/día] bajo -d, con un día de margen por zona horaria
+    parts = Path(file_path).relative_to(base_path).parts[:-1]
+    for index, part in enumerate(parts):
+        if len(part) == 4 and part.isdigit() and index + 1 < len(parts) and parts[index + 1].isdigit():
+            year, month = int(part), int(parts[index + 1])
+            if not 1 <= month <= 12:
+                return None
+            try:
+                if index + 2 < len(parts) and parts[index + 2].isdigit():
+                    first = last = date(year, month, int(parts[index + 2])).toordinal()
+                else:
+                    first = date(year, month, 1).toordinal()
+                    last = date(year + month // 12, month % 12 + 1, 1).toordinal() - 1
+            except ValueError:
+                return None
+            return first - 1, last + 1
+    return None
+
+def prune_files(file_paths, date_filter, date_index=None, base_path=None, cache_dir=None):
+    # Deja solo los archivos cuyo rango de días se cruza con la ventana de fechas. Un archivo
+    # se omite solo si su rango lo confirma el índice (-ix) o sus registros en la caché (-c).
+    # Con base_path el rango de los directorios es solo una pista: nada asegura que un
+    # archivo tenga únicamente tweets del día de su ruta. Los que según la ruta quedan fuera
+    # de la ventana y no tienen rango confirmado se leen igual y se devuelven en hinted.
+    if date_filter is None:
+        return file_paths, []
+    kept = []
+    hinted = []
+    for file_path in file_paths:
+        day_range = None
+        if date_index:
+            path, size, mtime_ns = file_signature(file_path)
+            entry = date_index.get(path)
+            if entry is not None and entry[:2] == (size, mtime_ns):
+                day_range = entry[2]
+        if day_range is None and base_path is not None:
+            layout_range = layout_day_range(file_path, base_path)
+            if layout_range is not None and not date_filter.overlaps(*layout_range):
+                # Con -c la pista se confirma con los registros guardados, sin descomprimir
+                records = load_cached_records(cache_dir, file_path) if cache_dir is not None else None
+                if records is not None:
+                    day_range = records.day_range()
+                if day_range is None:
+                    hinted.append(file_path)
+        if day_range is None or date_filter.overlaps(*day_range):
+            kept.append(file_path)
+    return kept, hinted
+
+def print_layout_hints(hinted, file_days, date_filter, indexed=False):
+    # Verifica la pista de -dl con el rango real de los archivos que se leyeron por ella
+    if not hinted:
+        return
+    misplaced = 0
+    for file_path in hinted:
+        day_range = file_days.get(file_signature(file_path))
+        if day_range is None or date_filter.overlaps(*day_range):
+            misplaced += 1
+    print(f"Archivos fuera de -fi/-ff según su directorio (-dl), leídos para confirmarlo: {len(hinted)}")
+    if misplaced:
+        print(f"  Con tweets dentro de la ventana o sin fecha: {misplaced} (su directorio no indica el día de todos sus tweets)")
+    elif not indexed:
+        print("  Con -ix se guarda el rango de cada archivo y se omiten sin abrirlos en las próximas ejecuciones")
+
+# Versión del formato del almacén columnar (-cs/-st)
+STORE_VERSION = 1
+
+# Columnas del almacén, una por archivo binario little-endian. tag_end y mention_end marcan
+# dónde terminan en row_tags y row_mentions los hashtags y mencionados de cada fila, como
+# en FileRecords; los usuarios y hashtags son índices de names.json y tags.json.
+STORE_COLUMNS = {
+    "day": "<i4",
+    "author": "<i4",
+    "tweet_id": "<i8",
+    "retweeter": "<i4",
+    "tag_end": "<i8",
+    "row_tags": "<i4",
+    "mention_end": "<i8",
+    "row_mentions": "<i4",
+}
+
+# Filas que se filtran y agregan de una vez al leer el almacén
+STORE_CHUNK_ROWS = 1 << 20
+
+def require_numpy():
+    if numpy is None:
+        raise SystemExit("-cs y -st necesitan NumPy (pip install numpy)")
+
+def compile_store(file_paths, store_dir, buffer_size=DEFAULT_BUFFER_SIZE, parser="auto", cache_dir=None, workers=1):
+    # Pasa los registros de cada archivo (FileRecords, desde la caché si está) a columnas con
+    # identificadores de usuario y hashtag comunes a todo el almacén. store.json se escribe
+    # al final: sin él el almacén está incompleto y -st no lo abre.
+    require_numpy()
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    (store_dir / "store.json").unlink(missing_ok=True)
+    names, name_ids, tags, tag_ids = [], {}, [], {}
+
+    def global_ids(table, ids, values):
+        remap = []
+        for value in values:
+            value_id = ids.get(value)
+            if value_id is None:
+                value_id = ids[value] = len(table)
+                table.append(value)
+            remap.append(value_id)
+        return numpy.array(remap, dtype=numpy.int32)
+
+    files = []
+    rows = tag_refs = mention_refs = 0
+    # Con workers > 1 los archivos se leen en paralelo y se recorren en orden; el pool se
+    # cierra aunque falle algún archivo
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+        map_records = executor.map if executor is not None else map
+        file_records = map_records(load_file_records, file_paths, [buffer_size] * len(file_paths), [parser] * len(file_paths), [cache_dir] * len(file_paths))
+        outputs = {column: open(store_dir / f"{column}.bin", "wb") for column in STORE_COLUMNS}
+        try:
+            for file_path, records in zip(file_paths, file_records):
+                name_remap = global_ids(names, name_ids, records.names)
+                tag_remap = global_ids(tags, tag_ids, records.tags)
+                retweeter = numpy.frombuffer(records.retweeter, dtype=numpy.int32)
+                columns = {
+                    "day": numpy.frombuffer(records.day, dtype=numpy.int32),
+                    "author": name_remap[numpy.frombuffer(records.author, dtype=numpy.int32)],
+                    "tweet_id": numpy.frombuffer(records.tweet_id, dtype=numpy.int64),
+                    "retweeter": numpy.where(retweeter >= 0, name_remap[numpy.maximum(retweeter, 0)], -1),
+                    "tag_end": numpy.frombuffer(records.tag_end, dtype=numpy.int32).astype(numpy.int64) + tag_refs,
+                    "row_tags": tag_remap[numpy.frombuffer(records.row_tags, dtype=numpy.int32)],
+                    "mention_end": numpy.frombuffer(records.mention_end, dtype=numpy.int32).astype(numpy.int64) + mention_refs,
+                    "row_mentions": name_remap[numpy.frombuffer(records.row_mentions, dtype=numpy.int32)],
+                }
+                for column, values in columns.items():
+                    values.astype(STORE_COLUMNS[column]).tofile(outputs[column])
+                files.append([*file_signature(file_path), rows, rows + len(records.author), records.day_range()])
+                rows += len(records.author)
+                tag_refs += len(records.row_tags)
+                mention_refs += len(records.row_mentions)
+        finally:
+            for output in outputs.values():
+                output.close()
+
+    for filename, table in (("names.json", names), ("tags.json", tags)):
+        with open(store_dir / filename, "w", encoding="utf-8") as table_file:
+            json.dump(table, table_file, ensure_ascii=False)
+    with open(store_dir / "store.json", "w", encoding="utf-8") as meta_file:
+        json.dump({"version": STORE_VERSION, "rows": rows, "columns": STORE_COLUMNS, "files": files}, meta_file, ensure_ascii=False)
+    return rows, len(files)
+
+class CompiledStore:
+    # Almacén compilado con -cs: las columnas se abren con numpy.memmap, así solo se leen
+    # del disco las páginas de las filas que se recorren
+    def __init__(self, store_dir):
+        require_numpy()
+        store_dir = Path(store_dir)
+        try:
+            with open(store_dir / "store.json", encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+        except FileNotFoundError:
+            raise SystemExit(f"{store_dir} no es un almacén compilado con -cs (o la compilación no terminó)")
+        if meta["version"] != STORE_VERSION or meta["columns"] != STORE_COLUMNS:
+            raise SystemExit(f"El almacén {store_dir} tiene otro formato; vuelva a compilarlo con -cs")
+        self.rows = meta["rows"]
+        self.files = meta["files"]
+        self.columns = {}
+        for column, dtype in STORE_COLUMNS.items():
+            path = store_dir / f"{column}.bin"
+            # numpy.memmap no admite archivos vacíos
+            self.columns[column] = numpy.memmap(path, dtype=dtype, mode="r") if path.stat().st_size else numpy.zeros(0, dtype=dtype)
+        with open(store_dir / "names.json", encoding="utf-8") as names_file:
+            self.names = json.load(names_file)
+        with open(store_dir / "tags.json", encoding="utf-8") as tags_file:
+            self.tags = json.load(tags_file)
+
+    def row_ranges(self, date_filter=None):
+        # Filas (inicio, fin) de cada archivo, sin los que quedan enteros fuera de la ventana
+        return [(start, stop) for path, size, mtime_ns, start, stop, day_range in self.files
+                if start < stop and (date_filter is None or day_range is None or date_filter.overlaps(*day_range))]
+
+    def load(self, store, ranges, hashtag_filter=None, date_filter=None, profile=None):
+        # Agrega a store las filas aceptadas de ranges en el mismo orden, y con los mismos
+        # identificadores, que FileRecords.replay; de a STORE_CHUNK_ROWS filas para que -m
+        # pueda volcar a disco entre un bloque y el siguiente
+        store_ids = numpy.full(len(self.names), -1, dtype=numpy.int64)
+        tag_matches = numpy.array([hashtag_filter.matches(tag) for tag in self.tags], dtype=bool) if hashtag_filter is not None else None
+        for start, stop in ranges:
+            for chunk_start in range(start, stop, STORE_CHUNK_ROWS):
+                chunk_stop = min(chunk_start + STORE_CHUNK_ROWS, stop)
+                with stage_timer(profile)("almacén"):
+                    self.load_rows(store, store_ids, chunk_start, chunk_stop, tag_matches, date_filter)
+                if profile is not None:
+                    profile.tweets += chunk_stop - chunk_start
+                store.spill_if_needed()
+        return store
+
+    def accepted_rows(self, store, start, stop, tag_matches=None, date_filter=None):
+        # Mismos filtros y conteos de descartes que FileRecords.replay, como máscaras
+        columns = self.columns
+        accepted = numpy.ones(stop - start, dtype=bool)
+        if tag_matches is not None:
+            tag_end = numpy.asarray(columns["tag_end"][start:stop])
+            tag_start = numpy.empty_like(tag_end)
+            tag_start[0] = columns["tag_end"][start - 1] if start else 0
+            tag_start[1:] = tag_end[:-1]
+            # Hashtags aceptados acumulados: una fila pasa si suma alguno entre su inicio y su fin
+            base = tag_start[0]
+            matched = numpy.concatenate(([0], numpy.cumsum(tag_matches[columns["row_tags"][base:tag_end[-1]]])))
+            tagged = tag_end > tag_start
+            accepted = matched[tag_end - base] > matched[tag_start - base]
+            self.reject(store, "sin hashtags", ~tagged)
+            self.reject(store, "hashtags", tagged & ~accepted)
+        if date_filter is not None:
+            day = numpy.asarray(columns["day"][start:stop])
+            in_window = numpy.ones(stop - start, dtype=bool)
+            if date_filter.lower is not None:
+                in_window &= day >= date_filter.lower
+            if date_filter.upper is not None:
+                in_window &= day <= date_filter.upper
+            in_window |= day < 0
+            self.reject(store, "fecha", accepted & ~in_window)
+            accepted &= in_window
+        return start + numpy.flatnonzero(accepted)
+
+    @staticmethod
+    def reject(store, stage, mask):
+        count = int(numpy.count_nonzero(mask))
+        if count:
+            store.reject(stage, count)
+
+    def load_rows(self, store, store_ids, start, stop, tag_matches=None, date_filter=None):
+        columns = self.columns
+        rows = self.accepted_rows(store, start, stop, tag_matches, date_filter)
+        if not len(rows):
+            return
+        author = columns["author"][rows]
+        retweeter = columns["retweeter"][rows]
+        tweet_id = columns["tweet_id"][rows].astype(numpy.int64)
+        mention_end = columns["mention_end"][rows]
+        mention_start = numpy.where(rows > 0, columns["mention_end"][numpy.maximum(rows - 1, 0)], 0)
+        counts = mention_end - mention_start
+        mention_row = numpy.repeat(numpy.arange(len(rows)), counts)
+        mention_slot = numpy.arange(len(mention_row)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        mentioned = columns["row_mentions"][numpy.repeat(mention_start, counts) + mention_slot]
+
+        # Los usuarios nuevos se registran en el orden de replay: por fila, autor, retweeter y mencionados
+        retweeted = numpy.flatnonzero(retweeter >= 0)
+        sequence = numpy.concatenate((author, retweeter[retweeted], mentioned))
+        order = numpy.lexsort((numpy.concatenate((numpy.zeros(len(rows), dtype=numpy.int64), numpy.ones(len(retweeted), dtype=numpy.int64), 2 + mention_slot)),
+                               numpy.concatenate((numpy.arange(len(rows)), retweeted, mention_row))))
+        sequence = sequence[order]
+        unseen, first = numpy.unique(sequence[store_ids[sequence] < 0], return_index=True)
+        for name_id in unseen[numpy.argsort(first)].tolist():
+            store_ids[name_id] = store.intern(self.names[name_id])
+
+        author_ids = store_ids[author].astype(numpy.int32)
+        store.tweet_author.frombytes(author_ids.tobytes())
+        store.tweet_id.frombytes(tweet_id.tobytes())
+        store.tweet_retweeter.frombytes(numpy.where(retweeter >= 0, store_ids[numpy.maximum(retweeter, 0)], -1).astype(numpy.int32).tobytes())
+        if not len(mentioned):
+            return
+        # Pares (mencionado, quien menciona): los nuevos reciben número en orden de aparición
+        keys = (store_ids[mentioned] << 32) | author_ids[mention_row].astype(numpy.int64)
+        unique_keys, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+        pair_ids = numpy.empty(len(unique_keys), dtype=numpy.int32)
+        for index in numpy.argsort(first).tolist():
+            key = int(unique_keys[index])
+            pair_ids[index] = store.pair_id(key >> 32, key & 0xFFFFFFFF)
+        store.mention_pair.frombytes(pair_ids[inverse.reshape(-1)].tobytes())
+        store.mention_tweet.frombytes(tweet_id[mention_row].tobytes())
+
+def part_ranges(ranges, part, parts):
+    # La parte part de parts de las filas de ranges, en partes consecutivas de igual tamaño
+    total = sum(stop - start for start, stop in ranges)
+    lower, upper = total * part // parts, total * (part + 1) // parts
+    selected = []
+    offset = 0
+    for start, stop in ranges:
+        begin, end = max(start, start + lower - offset), min(stop, start + upper - offset)
+        if begin < end:
+            selected.append((begin, end))
+        offset += stop - start
+    return selected
+
+def open_compiled_store(store_dir, directory=None, date_filter=None):
+    # Abre el almacén y devuelve también las filas de los archivos dentro de -fi/-ff. Con
+    # directory avisa si los .json.bz2 cambiaron desde la compilación.
+    compiled = CompiledStore(store_dir)
+    if directory is not None:
+        compiled_files = {(path, size, mtime_ns) for path, size, mtime_ns, *rest in compiled.files}
+        current_files = {file_signature(file_path) for file_path in Path(directory).rglob('*.json.bz2')}
+        if compiled_files != current_files:
+            print(f"Aviso: {len(current_files - compiled_files)} archivos de {directory} son nuevos o cambiaron y {len(compiled_files - current_files)} "
+                  f"ya no están desde que se compiló {store_dir}; se usa el almacén tal como está (vuelva a compilarlo con -cs)")
+    ranges = compiled.row_ranges(date_filter)
+    if directory is not None and len(ranges) < len(compiled.files):
+        print(f"Archivos omitidos por fecha: {len(compiled.files) - len(ranges)} de {len(compiled.files)}")
+    return compiled, ranges
+
+# Bocetos de --approx: ancho y profundidad de Count-Min, precisión de HyperLogLog (2^p
+# registros por autor) y funciones de hash de MinHash por autor
+COUNT_MIN_WIDTH = 8192
+COUNT_MIN_DEPTH = 4
+HLL_PRECISION = 10
+MINHASH_PERMUTATIONS = 64
+# Autores más retuiteados entre los que se estiman los corretweets
+APPROX_CORETWEET_AUTHORS = 200
+
+# MinHash usa h(x) = (a x + b) mod p con p = 2^61 - 1; los coeficientes son fijos para que
+# las firmas de distintos procesos se puedan combinar
+MERSENNE_61 = (1 << 61) - 1
+_minhash_rng = random.Random(61)
+MINHASH_COEFFICIENTS = [(_minhash_rng.randrange(1, MERSENNE_61), _minhash_rng.randrange(MERSENNE_61)) for _ in range(MINHASH_PERMUTATIONS)]
+
+@lru_cache(maxsize=1 << 16)
+def user_hash(name):
+    # 64 bits estables entre procesos (hash() de un str cambia en cada proceso)
+    return int.from_bytes(hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class CountMinSketch:
+    # Conteo aproximado de cualquier usuario en depth filas de width contadores: nunca
+    # subestima y sobreestima en a lo sumo e / width * total con probabilidad 1 - e^-depth
+    def __init__(self, width=COUNT_MIN_WIDTH, depth=COUNT_MIN_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.table = array('q', bytes(8 * width * depth))
+        self.total = 0
+
+    def cells(self, key_hash):
+        # Las depth funciones de hash salen de las dos mitades del hash (h1 + fila * h2)
+        low, high = key_hash & 0xFFFFFFFF, key_hash >> 32
+        return [row * self.width + (low + row * high) % self.width for row in range(self.depth)]
+
+    def add(self, key_hash, count=1):
+        table = self.table
+        for cell in self.cells(key_hash):
+            table[cell] += count
+        self.total += count
+
+    def estimate(self, key_hash):
+        return min(self.table[cell] for cell in self.cells(key_hash))
+
+    def error_bound(self):
+        return math.e / self.width * self.total, 1 - math.exp(-self.depth)
+
+    def merge(self, other):
+        self.table = array('q', map(int.__add__, self.table, other.table))
+        self.total += other.total
+
+class HyperLogLog:
+    # Cantidad aproximada de elementos distintos en 2^precision registros de un byte, con
+    # error relativo típico 1.04 / sqrt(2^precision)
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value_hash):
+        bits = 64 - self.precision
+        index = value_hash >> bits
+        rank = bits - (value_hash & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self):
+        size = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / size) * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * size and zeros:
+            return size * math.log(size / zeros)
+        return raw
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+class MinHash:
+    # Firma de un conjunto: el mínimo de cada función de hash sobre sus elementos. La
+    # fracción de posiciones iguales entre dos firmas estima el índice de Jaccard.
+    def __init__(self):
+        self.signature = array('Q', [MERSENNE_61]) * MINHASH_PERMUTATIONS
+
+    def add(self, value_hash):
+        value = value_hash % MERSENNE_61
+        signature = self.signature
+        for index, (a, b) in enumerate(MINHASH_COEFFICIENTS):
+            hashed = (a * value + b) % MERSENNE_61
+            if hashed < signature[index]:
+                signature[index] = hashed
+
+    def jaccard(self, other):
+        return sum(mine == theirs for mine, theirs in zip(self.signature, other.signature)) / len(self.signature)
+
+    def merge(self, other):
+        self.signature = array('Q', map(min, self.signature, other.signature))
+
+class SpaceSaving:
+    # Los capacity usuarios con más conteos. Cada entrada es [conteo, error, HyperLogLog,
+    # MinHash] y el valor real está entre conteo - error y conteo. Con la tabla llena un
+    # usuario nuevo reemplaza al de menor conteo y hereda ese conteo como error; sus bocetos
+    # de retweeters empiezan vacíos, así error también cuenta los retweets que no vieron.
+    # Un montículo con conteos posiblemente atrasados (nunca mayores que el real) encuentra
+    # el mínimo sin recorrer la tabla.
+    def __init__(self, capacity, distinct=False):
+        self.capacity = capacity
+        self.distinct = distinct
+        self.entries = {}
+        self.heap = []
+        self.total = 0
+
+    def new_entry(self, count):
+        if self.distinct:
+            return [count, count, HyperLogLog(), MinHash()]
+        return [count, count, None, None]
+
+    def add(self, name, value_hash=None):
+        self.total += 1
+        entry = self.entries.get(name)
+        if entry is None:
+            if len(self.entries) < self.capacity:
+                entry = self.entries[name] = self.new_entry(0)
+                heapq.heappush(self.heap, (0, name))
+            else:
+                entry = self.replace_minimum(name)
+        entry[0] += 1
+        if value_hash is not None:
+            entry[2].add(value_hash)
+            entry[3].add(value_hash)
+
+    def replace_minimum(self, name):
+        heap, entries = self.heap, self.entries
+        while True:
+            count, victim = heap[0]
+            current = entries[victim][0]
+            if current == count:
+                break
+            heapq.heapreplace(heap, (current, victim))
+        del entries[victim]
+        heapq.heapreplace(heap, (count, name))
+        entry = entries[name] = self.new_entry(count)
+        return entry
+
+    def minimum(self):
+        # Cota de lo que puede tener un usuario que no está en la tabla
+        return min(entry[0] for entry in self.entries.values()) if len(self.entries) >= self.capacity else 0
+
+    def merge(self, other):
+        # Suma de dos resúmenes: a un usuario que falta en uno se le suma el mínimo de ese
+        # resumen, como conteo y como error, y se conservan los capacity mayores
+        own_minimum, other_minimum = self.minimum(), other.minimum()
+        merged = {}
+        for name in chain(self.entries, (name for name in other.entries if name not in self.entries)):
+            mine, theirs = self.entries.get(name), other.entries.get(name)
+            entry = [0, 0, None, None]
+            for part, minimum in ((mine, own_minimum), (theirs, other_minimum)):
+                if part is None:
+                    entry[0] += minimum
+                    entry[1] += minimum
+                    continue
+                entry[0] += part[0]
+                entry[1] += part[1]
+                for index in (2, 3):
+                    if part[index] is not None:
+                        if entry[index] is None:
+                            entry[index] = part[index]
+                        else:
+                            entry[index].merge(part[index])
+            if self.distinct:
+                entry[2] = entry[2] or HyperLogLog()
+                entry[3] = entry[3] or MinHash()
+            merged[name] = entry
+        kept = sorted(merged.items(), key=lambda item: -item[1][0])[:self.capacity]
+        self.entries = dict(kept)
+        self.heap = [(entry[0], name) for name, entry in kept]
+        heapq.heapify(self.heap)
+        self.total += other.total
+
+    def ranking(self):
+        return sorted(self.entries.items(), key=lambda item: -item[1][0])
+
+    def error_bound(self):
+        # Ningún usuario tiene un error mayor que total / capacity
+        return self.total / self.capacity
+
+class ApproxStore:
+    # Con --approx reemplaza a TweetStore: retweets y menciones recibidos en Space-Saving y
+    # Count-Min y, por cada autor candidato, los retweeters en un HyperLogLog y un MinHash.
+    # Ocupa lo mismo para cualquier tamaño del corpus y se combina entre procesos con merge.
+    spilled = None
+
+    def __init__(self, capacity):
+        self.retweets = SpaceSaving(capacity, distinct=True)
+        self.retweet_counts = CountMinSketch()
+        self.mentions = SpaceSaving(capacity)
+        self.mention_counts = CountMinSketch()
+        self.rejected = {}
+        self.file_days = {}
+
+    reject = TweetStore.reject
+    add_file_days = TweetStore.add_file_days
+
+    def spill_if_needed(self):
+        pass
+
+    def add_tweet(self, author, tweet_id, retweeter=None):
+        if retweeter is not None:
+            self.retweet_counts.add(user_hash(author))
+            self.retweets.add(author, user_hash(retweeter))
+
+    def add_mention(self, mentioned, mention_by, tweet_id):
+        self.mention_counts.add(user_hash(mentioned))
+        self.mentions.add(mentioned)
+
+    def merge(self, other):
+        self.retweets.merge(other.retweets)
+        self.retweet_counts.merge(other.retweet_counts)
+        self.mentions.merge(other.mentions)
+        self.mention_counts.merge(other.mention_counts)
+        for stage, count in other.rejected.items():
+            self.reject(stage, count)
+        for signature, day_range in other.file_days.items():
+            self.add_file_days(signature, day_range)
+        return self
+
+    def memory_bytes(self):
+        # Tamaño fijo de los bocetos con las tablas llenas
+        sketch_bytes = (1 << HLL_PRECISION) + 8 * MINHASH_PERMUTATIONS
+        return 2 * 8 * COUNT_MIN_WIDTH * COUNT_MIN_DEPTH + self.retweets.capacity * sketch_bytes
+
+def new_store(spilled=None, approx=None):
+    # Almacén exacto o, con --approx (approx es la capacidad de Space-Saving), bocetos
+    return ApproxStore(approx) if approx is not None else TweetStore(spilled)
+
+def read_and_process_files(directory, hashtags_file=None, date_filter=None, buffer_size=DEFAULT_BUFFER_SIZE, parser="auto", cache_dir=None, workers=1, date_index_path=None, date_layout=False, profile=None, spilled=None, split_mb=None, prefetch=0, store_dir=None, approx=None):
+    store = new_store(spilled, approx)
+
+    # Cargar y normalizar los hashtags del archivo
+    hashtag_filter = load_hashtag_filter(hashtags_file)
+
+    if store_dir is not None:
+        # Con -st los tweets se filtran desde el almacén compilado, sin abrir los .json.bz2
+        compiled, ranges = open_compiled_store(store_dir, directory, date_filter)
+        return compiled.load(store, ranges, hashtag_filter, date_filter, profile)
     
     # Utilizamos Path para manejar rutas de manera más eficiente
     base_path = Path(directory)
 
-    file_paths = base_path.rglob('*.json.bz2')
-
-    for file_path in file_paths:
-        json_file_path = file_path.with_suffix('.json')
-
-        with bz2.BZ2File(file_path, 'rb') as source, open(json_file_path, 'wb') as target:
-            target.write(source.read())
-        #print(f"Archivo JSON descomprimido: {json_file_path}")
-
-        with open(json_file_path, 'r', encoding='utf-8') as json_file:
-            for line in json_file:
-                tweet = json.loads(line)
-                if 'retweeted_status' in tweet:
-                    process_retweet(tweet, retweets_info, mentions_info, hashtags_set, fi, ff)
-                else:
-                    process_original_tweet(tweet, retweets_info, mentions_info, hashtags_set, fi, ff)
-
-    return retweets_info, mentions_info
-
-
-def decompress_and_create_json_files_directory(directory, hashtags_file=None):
-    retweets_info = {}
-    mentions_info = {}
-    hashtags_set = set()
-    if hashtags_file:
-        with open(hashtags_file, 'r') as hashtags_file:
-            hashtags_set = {line.strip().lower() for line in hashtags_file}
-
-    # Utilizamos Path para manejar rutas de manera más eficiente
+    with stage_timer(profile)("descubrimiento"):
+        file_paths = list(base_path.rglob('*.json.bz2'))
+
+        # Los archivos que quedan enteros fuera de -fi/-ff se omiten sin abrirlos
+        date_index = load_date_index(date_index_path) if date_index_path else None
+        kept_paths, hinted = prune_files(file_paths, date_filter, date_index, base_path if date_layout else None, cache_dir)
+    if len(kept_paths) < len(file_paths):
+        print(f"Archivos omitidos por fecha: {len(file_paths) - len(kept_paths)} de {len(file_paths)}")
+    file_paths = kept_paths
+    # Con archivos leídos por una pista de -dl también se registra el rango real de cada
+    # archivo, para verificarla
+    index_days = date_index is not None or bool(hinted)
+
+    if workers > 1:
+        split_bytes = split_mb * 10**6 if split_mb is not None else None
+        store = process_files_with_workers(file_paths, hashtag_filter, date_filter, buffer_size, parser, cache_dir, workers, index_days, profile, spilled, split_bytes, prefetch, approx)
+    else:
+        # Con prefetch un hilo descomprime los archivos siguientes mientras se procesa el actual
+        with open_prefetcher(file_paths if cache_dir is None else [], prefetch, buffer_size) as prefetcher:
+            for file_path in file_paths:
+                process_file(file_path, store, hashtag_filter, date_filter, buffer_size, parser, cache_dir, index_days, profile, prefetcher)
+                store.spill_if_needed()
+
+    if date_index is not None:
+        save_date_index(date_index_path, date_index, store.file_days)
+    print_layout_hints(hinted, store.file_days, date_filter, date_index is not None)
+    return store
+
+def created_at_seconds(created_at):
+    # Segundos desde el ordinal 0 de created_at (None si el tweet no trae fecha)
+    if created_at is None:
+        return None
+    return created_at_day(created_at) * 86400 + int(created_at[11:13]) * 3600 + int(created_at[14:16]) * 60 + int(created_at[17:19])
+
+def process_live_lines(lines, hashtag_filter, date_filter, parse_tweet):
+    # Un lote de -lv pasa por process_retweet / process_original_tweet sobre un TweetStore
+    # propio, igual que en process_lines; cada tweet aceptado agrega una fila de tweets y se
+    # anota (segundo de created_at, fin de sus filas de menciones)
+    batch = TweetStore()
+    marks = []
+    for line in lines:
+        if hashtag_filter is not None and HASHTAGS_IN_LINE.search(line) is None:
+            batch.reject("línea sin hashtags")
+            continue
+        tweet = parse_tweet(line)
+        rows = len(batch.tweet_author)
+        if 'retweeted_status' in tweet:
+            process_retweet(tweet, batch, hashtag_filter, date_filter)
+        else:
+            process_original_tweet(tweet, batch, hashtag_filter, date_filter)
+        if len(batch.tweet_author) > rows:
+            marks.append((created_at_seconds(tweet.get('created_at')), len(batch.mention_pair)))
+    return batch, marks
+
+class LiveAggregates:
+    # Agregados de -lv que se actualizan por lote: agregar o vencer un tweet cuesta lo mismo
+    # sin importar cuánto historial haya. Cada fila guarda su número de llegada (seq), así
+    # las instantáneas salen en el mismo orden que una corrida por lotes sobre la ventana.
+    def __init__(self, window_seconds=None):
+        self.names = []
+        self.name_ids = {}
+        self.window_seconds = window_seconds
+        self.seq = 0
+        self.mention_seq = 0
+        self.newest = None
+        self.rejected = {}
+        # Tweets en la ventana en orden de llegada: (segundo, autor, id, retweeter, mencionados)
+        self.events = deque()
+        # {autor: {id del tweet: deque de (seq, retweeter)}} y retweets recibidos por autor
+        self.tweets = {}
+        self.received = Counter()
+        # {mencionado: deque de (seq, quien menciona, id del tweet)}
+        self.mentions = {}
+        # Retweets de cada par (autor, retweeter), autores de cada retweeter y retweeters en
+        # común de cada par de autores (clave con el menor id primero)
+        self.retweet_pairs = Counter()
+        self.authors_of = {}
+        self.shared = {}
+
+    intern = TweetStore.intern
+
+    def add_batch(self, batch, marks):
+        remap = [self.intern(name) for name in batch.names]
+        remap.append(-1)
+        for stage, count in batch.rejected.items():
+            self.rejected[stage] = self.rejected.get(stage, 0) + count
+        mention_start = 0
+        for row, (seconds, mention_end) in enumerate(marks):
+            # Un tweet sin fecha toma la del último tweet con fecha leído antes que él
+            if seconds is None:
+                seconds = self.newest
+            elif self.newest is None:
+                self.date_undated(seconds)
+                self.newest = seconds
+            elif seconds > self.newest:
+                self.newest = seconds
+            mentioned = tuple(remap[batch.pair_user[batch.mention_pair[index]]] for index in range(mention_start, mention_end))
+            event = (seconds, remap[batch.tweet_author[row]], batch.tweet_id[row], remap[batch.tweet_retweeter[row]], mentioned)
+            self.events.append(event)
+            self.add_row(*event[1:])
+            mention_start = mention_end
+        return self.expire()
+
+    def date_undated(self, seconds):
+        # Los tweets sin fecha leídos antes del primero con fecha toman la de ese tweet; si no,
+        # quedarían al frente de events y ningún tweet detrás de ellos vencería
+        self.events = deque((seconds,) + event[1:] for event in self.events)
+
+    def expire(self):
+        # Vence, en orden de llegada, los tweets anteriores al último leído menos la ventana
+        expired = 0
+        if self.window_seconds is not None and self.newest is not None:
+            limit = self.newest - self.window_seconds
+            while self.events and self.events[0][0] < limit:
+                self.remove_row(*self.events.popleft()[1:])
+                expired += 1
+        return expired
+
+    def add_row(self, author, tweet_id, retweeter, mentioned):
+        seq = self.seq
+        self.seq += 1
+        self.tweets.setdefault(author, {}).setdefault(tweet_id, deque()).append((seq, retweeter))
+        if retweeter >= 0:
+            self.received[author] += 1
+            self.retweet_pairs[author, retweeter] += 1
+            if self.retweet_pairs[author, retweeter] == 1:
+                # Nuevo retweeter del autor: comparte retweeter con los otros autores que retuiteó
+                authors = self.authors_of.setdefault(retweeter, set())
+                for other in authors:
+                    self.shared.setdefault((min(author, other), max(author, other)), set()).add(retweeter)
+                authors.add(author)
+        # Las menciones son las del tweet original, así que quien menciona es siempre su autor.
+        # Llevan su propio número de llegada: un tweet puede mencionar a varios usuarios.
+        for user in mentioned:
+            self.mentions.setdefault(user, deque()).append((self.mention_seq, author, tweet_id))
+            self.mention_seq += 1
+
+    def remove_row(self, author, tweet_id, retweeter, mentioned):
+        tweets = self.tweets[author]
+        rows = tweets[tweet_id]
+        rows.popleft()
+        if not rows:
+            del tweets[tweet_id]
+            if not tweets:
+                del self.tweets[author]
+        if retweeter >= 0:
+            self.received[author] -= 1
+            if not self.received[author]:
+                del self.received[author]
+            self.retweet_pairs[author, retweeter] -= 1
+            if not self.retweet_pairs[author, retweeter]:
+                del self.retweet_pairs[author, retweeter]
+                authors = self.authors_of[retweeter]
+                authors.discard(author)
+                for other in authors:
+                    key = (min(author, other), max(author, other))
+                    common = self.shared[key]
+                    common.discard(retweeter)
+                    if not common:
+                        del self.shared[key]
+                if not authors:
+                    del self.authors_of[retweeter]
+        for user in mentioned:
+            rows = self.mentions[user]
+            rows.popleft()
+            if not rows:
+                del self.mentions[user]
+
+    def tweet_count(self):
+        return len(self.events)
+
+    def author_first_seq(self):
+        return {author: min(rows[0][0] for rows in tweets.values()) for author, tweets in self.tweets.items()}
+
+    def retweet_records(self):
+        # Mismos registros y orden que retweet_records sobre los tweets de la ventana
+        names = self.names
+        first_seq = self.author_first_seq()
+        ranking = sorted(self.received, key=lambda author: (-self.received[author], first_seq[author]))
+        for author in ranking:
+            tweets = {}
+            for tweet_id, rows in sorted(self.tweets[author].items(), key=lambda item: item[1][0][0]):
+                tweets["tweetId: {}".format(tweet_id)] = {"retweetedBy": [names[retweeter] for seq, retweeter in rows if retweeter >= 0]}
+            yield {"username": names[author], "receivedRetweets": self.received[author], "tweets": tweets}
+
+    def mention_records(self, layout="occurrence"):
+        names = self.names
+        ranking = sorted(self.mentions, key=lambda user: (-len(self.mentions[user]), self.mentions[user][0][0]))
+        for user in ranking:
+            rows = self.mentions[user]
+            if layout == "grouped":
+                groups = {}
+                for seq, mention_by, tweet_id in rows:
+                    groups.setdefault(mention_by, []).append(str(tweet_id))
+                mentions = [{"mentionBy": names[mention_by], "totalMentions": len(tweets), "tweets": tweets}
+                            for mention_by, tweets in groups.items()]
+            else:
+                mentions = [{"mentionBy": names[mention_by], "tweets": [str(tweet_id)]} for seq, mention_by, tweet_id in rows]
+            yield {"username": names[user], "receivedMentions": len(rows), "mentions": mentions}
+
+    def coretweets(self, min_coretweets=1, top_k=None):
+        # Los pares ya están contados; solo se orientan y ordenan como compute_coretweets
+        first_seq = self.author_first_seq()
+        pairs = []
+        for (a, b), common in self.shared.items():
+            if len(common) >= min_coretweets:
+                pair = (a, b) if first_seq[a] < first_seq[b] else (b, a)
+                pairs.append((pair, common))
+        sort_key = lambda item: (-len(item[1]), first_seq[item[0][0]], first_seq[item[0][1]])
+        if top_k is not None:
+            pairs = heapq.nsmallest(top_k, pairs, key=sort_key)
+        else:
+            pairs.sort(key=sort_key)
+        return [(pair, sorted(common)) for pair, common in pairs]
+
+def write_live_snapshot(live, args):
+    # Cada salida se escribe en un temporal y se renombra: quien la lea nunca ve un archivo a medias
+    extension = "ndjson" if args.json_format == "ndjson" else "json"
+    outputs = []
+    if args.generate_retweet_json:
+        outputs.append((f"rt.{extension}", "retweets", live.retweet_records()))
+    if args.generate_mentions_json:
+        outputs.append((f"mención.{extension}", "mentions", live.mention_records(args.mentions_layout)))
+    if args.generate_corretweet_json:
+        outputs.append((f"corrtw.{extension}", "coretweets", coretweet_records(live, live.coretweets(args.min_coretweets, args.top_coretweets))))
+    for filename, key, records in outputs:
+        write_json_records(f"{filename}.tmp", key, records, args.json_format)
+        os.replace(f"{filename}.tmp", filename)
+
+def stdin_batches(stream, interval):
+    # Lotes de líneas NDJSON de stream: lo leído se entrega cada interval segundos y al terminar
+    descriptor = stream.fileno()
+    pending = b''
+    lines = []
+    deadline = time.monotonic() + interval
+    while True:
+        if select.select([descriptor], [], [], max(deadline - time.monotonic(), 0))[0]:
+            chunk = os.read(descriptor, DEFAULT_BUFFER_SIZE)
+            if not chunk:
+                break
+            *complete, pending = (pending + chunk).split(b'\n')
+            lines.extend(line for line in complete if line.strip())
+        if time.monotonic() >= deadline:
+            yield lines
+            lines = []
+            deadline = time.monotonic() + interval
+    if pending.strip():
+        lines.append(pending)
+    yield lines
+
+def read_complete_lines(file_path, seen):
+    # Líneas de un archivo leído entero antes de agregarlo al lote. Si el archivo está
+    # incompleto (EOFError) o no se puede leer, no se marca como visto y se reintenta en la
+    # próxima revisión, sin haber agregado ninguna de sus líneas.
+    try:
+        lines = list(read_tweet_lines(file_path))
+    except (EOFError, OSError) as error:
+        print(f"No se pudo leer {file_path} ({error}); se reintenta en la próxima revisión", flush=True)
+        return []
+    seen.add(file_path)
+    return lines
+
+def directory_batches(directory, interval):
+    # Lotes con las líneas de los .json.bz2 nuevos de directory, revisado cada interval
+    # segundos. Un archivo se lee cuando su tamaño no cambió desde la revisión anterior, para
+    # no tomar uno que el recolector todavía está escribiendo; también los que ya estaban al
+    # arrancar. -dl no poda aquí: sin índice ni caché no hay rangos confirmados y -fi/-ff se
+    # aplica a cada tweet.
     base_path = Path(directory)
-
-    # Utilizamos rglob para buscar recursivamente archivos *.json.bz2
-    file_paths = base_path.rglob('*.json.bz2')
-
-    for file_path in file_paths:
-        json_file_path = file_path.with_suffix('.json')
-
-        with bz2.BZ2File(file_path, 'rb') as source, open(json_file_path, 'wb') as target:
-            target.write(source.read())
-
-
-        with open(json_file_path, 'r', encoding='utf-8') as json_file:
-            for line in json_file:
-                tweet = json.loads(line)
-                if 'retweeted_status' in tweet:
-                    process_retweet(tweet, retweets_info, mentions_info, hashtags_set)
-                else:
-                    process_original_tweet(tweet, retweets_info, mentions_info, hashtags_set)
-
-    return retweets_info, mentions_info
+    seen = set()
+    sizes = {}
+    while True:
+        ready = []
+        for file_path in sorted(base_path.rglob('*.json.bz2')):
+            if file_path in seen:
+                continue
+            try:
+                size = file_path.stat().st_size
+            except OSError:
+                continue
+            if sizes.get(file_path) == size:
+                ready.append(file_path)
+                del sizes[file_path]
+            else:
+                sizes[file_path] = size
+        yield chain.from_iterable(read_complete_lines(file_path, seen) for file_path in ready)
+        time.sleep(interval)
+
+def run_live(directory, hashtags_file, date_filter, args):
+    hashtag_filter = load_hashtag_filter(hashtags_file)
+    parse_tweet = make_tweet_parser(args.parser)
+    live = LiveAggregates(args.window * 3600 if args.window is not None else None)
+    if directory == "-":
+        batches = stdin_batches(sys.stdin.buffer, args.live)
+    else:
+        batches = directory_batches(directory, args.live)
+    try:
+        for lines in batches:
+            start = time.perf_counter()
+            batch, marks = process_live_lines(lines, hashtag_filter, date_filter, parse_tweet)
+            expired = live.add_batch(batch, marks)
+            update = time.perf_counter() - start
+            if not marks and not expired:
+                continue
+            write_live_snapshot(live, args)
+            print(f"Lote: {len(marks)} tweets nuevos, {expired} vencidos, {live.tweet_count()} en la ventana; "
+                  f"actualización {update:.3f} s, instantánea {time.perf_counter() - start - update:.3f} s", flush=True)
+    except KeyboardInterrupt:
+        write_live_snapshot(live, args)
+    print_rejected(live.rejected)
+
+# Cortes por fecha o hashtags (parámetros fi, ff y h) cuyos índices se guardan entre consultas
+SLICE_CACHE_SIZE = 8
+
+# Últimas latencias guardadas por ruta para calcular p50 y p99
+LATENCY_SAMPLES = 100000
+
+class LRUCache:
+    # Diccionario de a lo sumo capacity entradas; al llenarse sale la usada hace más tiempo
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+class QueryIndex:
+    # Índices por usuario sobre un TweetStore ya filtrado: quién retuiteó a quién, quién
+    # mencionó a quién (con la cantidad de cada par) y las filas de cada autor y de cada
+    # mencionado. Los rankings desempatan igual que rt.json y mención.json.
+    def __init__(self, store):
+        self.store = store
+        self.retweeted_by = defaultdict(Counter)
+        self.retweets_of = defaultdict(Counter)
+        for author, retweeter in zip(store.tweet_author, store.tweet_retweeter):
+            if retweeter >= 0:
+                self.retweeted_by[author][retweeter] += 1
+                self.retweets_of[retweeter][author] += 1
+        self.mentioned_by = defaultdict(Counter)
+        self.mentions_of = defaultdict(Counter)
+        for pair, count in Counter(store.mention_pair).items():
+            mentioned, mention_by = store.pair_user[pair], store.pair_by[pair]
+            self.mentioned_by[mentioned][mention_by] += count
+            self.mentions_of[mention_by][mentioned] += count
+
+        # Autores con retweets en orden de aparición, como author_retweeters y corrtw.json
+        authors = [author for author in dict.fromkeys(store.tweet_author) if author in self.retweeted_by]
+        self.author_order = {author: index for index, author in enumerate(authors)}
+        self.received_retweets = {author: sum(self.retweeted_by[author].values()) for author in authors}
+        self.retweet_ranking = sorted(authors, key=self.received_retweets.get, reverse=True)
+        self.received_mentions = {user: sum(counts.values()) for user, counts in self.mentioned_by.items()}
+        self.mention_ranking = sorted(self.received_mentions, key=self.received_mentions.get, reverse=True)
+
+        self.tweet_starts, self.tweet_rows = rows_by_key(store.tweet_author, len(store.names))
+        self.mention_starts, self.mention_rows = rows_by_key(array('i', (store.pair_user[pair] for pair in store.mention_pair)), len(store.names))
+
+    def user_id(self, username):
+        user = self.store.name_ids.get(username)
+        if user is None:
+            raise LookupError(f"El usuario {username} no aparece en los datos")
+        return user
+
+    def counted(self, counts, k=None):
+        names = self.store.names
+        return [{"username": names[user], "count": count} for user, count in counts.most_common(k)]
+
+    def top(self, kind, k, min_coretweets=1):
+        names = self.store.names
+        if kind == "rt":
+            return [{"username": names[author], "receivedRetweets": self.received_retweets[author]} for author in self.retweet_ranking[:k]]
+        if kind == "menciones":
+            return [{"username": names[user], "receivedMentions": self.received_mentions[user]} for user in self.mention_ranking[:k]]
+        if kind == "corretweets":
+            return list(coretweet_records(self.store, compute_coretweets(self.store.author_retweeters(), min_coretweets, k)))
+        raise ValueError(f"tipo debe ser rt, menciones o corretweets, no {kind}")
+
+    def neighborhood(self, username, k=None):
+        user = self.user_id(username)
+        return {
+            "username": username,
+            "retweetedBy": self.counted(self.retweeted_by.get(user, Counter()), k),
+            "retweeted": self.counted(self.retweets_of.get(user, Counter()), k),
+            "mentionedBy": self.counted(self.mentioned_by.get(user, Counter()), k),
+            "mentions": self.counted(self.mentions_of.get(user, Counter()), k),
+        }
+
+    def coretweets(self, username, min_coretweets=1, top_k=None):
+        # Los pares de corrtw.json que incluyen al usuario: sus retweeters y, por cada uno,
+        # los otros autores que retuiteó
+        user = self.user_id(username)
+        shared = {}
+        for retweeter in self.retweeted_by.get(user, ()):
+            for author in self.retweets_of[retweeter]:
+                if author != user:
+                    shared.setdefault(author, []).append(retweeter)
+        order = self.author_order
+        pairs = [(tuple(sorted((user, author), key=order.get)), retweeters) for author, retweeters in shared.items() if len(retweeters) >= min_coretweets]
+        sort_key = lambda item: (-len(item[1]), order[item[0][0]], order[item[0][1]])
+        pairs = heapq.nsmallest(top_k, pairs, key=sort_key) if top_k is not None else sorted(pairs, key=sort_key)
+        return list(coretweet_records(self.store, [(pair, sorted(retweeters)) for pair, retweeters in pairs]))
+
+    def retweet_record(self, username):
+        # La entrada del usuario en rt.json
+        store, names = self.store, self.store.names
+        author = self.user_id(username)
+        tweets = {}
+        for row in self.tweet_rows[self.tweet_starts[author]:self.tweet_starts[author + 1]]:
+            retweeted_by = tweets.setdefault("tweetId: {}".format(store.tweet_id[row]), {"retweetedBy": []})["retweetedBy"]
+            if store.tweet_retweeter[row] >= 0:
+                retweeted_by.append(names[store.tweet_retweeter[row]])
+        return {"username": username, "receivedRetweets": self.received_retweets.get(author, 0), "tweets": tweets}
+
+    def mention_record(self, username, layout="occurrence"):
+        # La entrada del usuario en mención.json, con una entrada por mención o por par
+        store, names = self.store, self.store.names
+        mentioned = self.user_id(username)
+        rows = self.mention_rows[self.mention_starts[mentioned]:self.mention_starts[mentioned + 1]]
+        if layout == "grouped":
+            tweets_by_pair = {}
+            for row in rows:
+                tweets_by_pair.setdefault(store.mention_pair[row], []).append(str(store.mention_tweet[row]))
+            mentions = [{"mentionBy": names[store.pair_by[pair]], "totalMentions": len(tweets), "tweets": tweets}
+                        for pair, tweets in sorted(tweets_by_pair.items())]
+        else:
+            mentions = [{"mentionBy": names[store.pair_by[store.mention_pair[row]]], "tweets": [str(store.mention_tweet[row])]} for row in rows]
+        return {"username": username, "receivedMentions": len(rows), "mentions": mentions}
+
+def latency_percentile(samples, fraction):
+    # Percentil por rango más cercano, en milisegundos
+    ordered = sorted(samples)
+    return 1000 * ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+class QueryService:
+    # Registros de todos los archivos en memoria, el índice con los filtros de la línea de
+    # comandos y los índices de los cortes pedidos por fi, ff y h. Cada respuesta se guarda
+    # en una caché LRU por ruta y parámetros. Cada conexión tiene su hilo y las consultas
+    # se atienden de a una (lock), así los índices y las cachés no necesitan más cuidado.
+    def __init__(self, records, hashtags=None, fi=None, ff=None, cache_size=1024, min_coretweets=1, top_coretweets=None, mentions_layout="occurrence"):
+        self.records = records
+        self.defaults = (fi, ff, tuple(hashtags or ()))
+        self.min_coretweets = min_coretweets
+        self.top_coretweets = top_coretweets
+        self.mentions_layout = mentions_layout
+        self.slices = LRUCache(SLICE_CACHE_SIZE)
+        self.results = LRUCache(cache_size)
+        self.latencies = {}
+        self.lock = threading.Lock()
+        self.base = self.build_index(*self.defaults)
+
+    def build_index(self, fi, ff, hashtags):
+        # Los archivos cuyo rango de días queda fuera de fi/ff no se recorren
+        date_filter = compile_date_filter(fi, ff)
+        hashtag_filter = compile_hashtag_filter(hashtags)
+        store = TweetStore()
+        for records in self.records:
+            day_range = records.day_range()
+            if date_filter is not None and day_range is not None and not date_filter.overlaps(*day_range):
+                continue
+            records.replay(store, hashtag_filter, date_filter)
+        return QueryIndex(store)
+
+    def index_for(self, params):
+        fi, ff, hashtags = self.defaults
+        key = (params.get("fi", fi), params.get("ff", ff), tuple(params["h"].split(",")) if "h" in params else hashtags)
+        if key == self.defaults:
+            return self.base
+        index = self.slices.get(key)
+        if index is None:
+            try:
+                index = self.build_index(*key)
+            except ValueError:
+                raise ValueError("fi y ff van en formato dd-mm-aa")
+            self.slices.put(key, index)
+        return index
+
+    def answer(self, route, params):
+        def number(name, default=None, minimum=None):
+            if name not in params:
+                return default
+            try:
+                value = int(params[name])
+            except ValueError:
+                raise ValueError(f"{name} tiene que ser un número entero")
+            if minimum is not None and value < minimum:
+                raise ValueError(f"{name} no puede ser menor que {minimum}")
+            return value
+
+        def username():
+            if "usuario" not in params:
+                raise ValueError("Falta el parámetro usuario")
+            return params["usuario"]
+
+        if route == "/top":
+            return self.index_for(params).top(params.get("tipo", "rt"), number("k", 100, 0), number("min", self.min_coretweets))
+        if route == "/vecinos":
+            return self.index_for(params).neighborhood(username(), number("k", minimum=0))
+        if route == "/corretweets":
+            return self.index_for(params).coretweets(username(), number("min", self.min_coretweets), number("k", self.top_coretweets, 0))
+        if route == "/rt":
+            return self.index_for(params).retweet_record(username())
+        if route == "/menciones":
+            layout = params.get("formato", self.mentions_layout)
+            if layout not in ("occurrence", "grouped"):
+                raise ValueError("formato debe ser occurrence o grouped")
+            return self.index_for(params).mention_record(username(), layout)
+        if route == "/estadisticas":
+            return self.statistics()
+        raise LookupError(f"Ruta desconocida {route}; rutas: /top, /vecinos, /corretweets, /rt, /menciones, /estadisticas")
+
+    def query(self, route, params):
+        with self.lock:
+            return self.cached_query(route, params)
+
+    def cached_query(self, route, params):
+        # Devuelve (estado HTTP, cuerpo JSON, si salió de la caché); las estadísticas no se guardan
+        key = (route, tuple(sorted(params.items())))
+        body = self.results.get(key) if route != "/estadisticas" else None
+        if body is not None:
+            return 200, body, True
+        try:
+            status, result = 200, self.answer(route, params)
+        except ValueError as error:
+            status, result = 400, {"error": str(error)}
+        except LookupError as error:
+            status, result = 404, {"error": str(error)}
+        body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        if status == 200 and route != "/estadisticas":
+            self.results.put(key, body)
+        return status, body, False
+
+    def record_latency(self, route, seconds, cached):
+        with self.lock:
+            self.latencies.setdefault((route, cached), deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+    def statistics(self):
+        routes = {}
+        for (route, cached), samples in sorted(self.latencies.items()):
+            routes.setdefault(route, {})["cached" if cached else "computed"] = {
+                "count": len(samples), "p50Ms": latency_percentile(samples, 0.5), "p99Ms": latency_percentile(samples, 0.99)}
+        return {"cacheHits": self.results.hits, "cacheMisses": self.results.misses, "cachedResults": len(self.results.entries),
+                "cachedSlices": len(self.slices.entries), "routes": routes}
+
+    def print_statistics(self):
+        statistics = self.statistics()
+        print(f"Consultas: {statistics['cacheHits']} desde la caché, {statistics['cacheMisses']} calculadas")
+        print(f"{'ruta':<16}{'origen':<10}{'consultas':>11}{'p50 (ms)':>11}{'p99 (ms)':>11}")
+        for route, origins in statistics["routes"].items():
+            for origin, summary in origins.items():
+                print(f"{route:<16}{'caché' if origin == 'cached' else 'cálculo':<10}{summary['count']:>11}{summary['p50Ms']:>11.3f}{summary['p99Ms']:>11.3f}")
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # GET /ruta?parámetros; la latencia se mide desde que llega el pedido hasta escribir la respuesta.
+    # Todas las respuestas llevan Content-Length, así la conexión se puede reutilizar; sin
+    # Nagle los encabezados y el cuerpo salen sin esperar el ACK retrasado del cliente.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        status, body, cached = self.server.service.query(url.path, dict(parse_qsl(url.query)))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Cache", "hit" if cached else "miss")
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.service.record_latency(url.path, time.perf_counter() - start, cached)
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # HTTP sobre un socket Unix; client_address no es (host, puerto) y no se usa
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+def make_query_server(address, service):
+    # Un número es un puerto TCP en 127.0.0.1; cualquier otra cosa, la ruta de un socket Unix
+    if address.isdigit():
+        server = ThreadingHTTPServer(("127.0.0.1", int(address)), QueryHandler)
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server = UnixHTTPServer(address, QueryHandler)
+    server.service = service
+    return server
+
+def load_service_records(directory, buffer_size=DEFAULT_BUFFER_SIZE, parser="auto", cache_dir=None, workers=1):
+    # Registros de todos los .json.bz2 de directory, en el mismo orden que read_and_process_files
+    file_paths = list(Path(directory).rglob('*.json.bz2'))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(load_file_records, file_paths, [buffer_size] * len(file_paths), [parser] * len(file_paths), [cache_dir] * len(file_paths)))
+    return [load_file_records(file_path, buffer_size, parser, cache_dir) for file_path in file_paths]
+
+def run_service(directory, hashtags_file, fecha_inicial, fecha_final, args):
+    start = time.perf_counter()
+    hashtags = None
+    if hashtags_file:
+        with open(hashtags_file, 'r', encoding='utf-8') as file:
+            hashtags = file.read().splitlines()
+    records = load_service_records(directory, args.buffer_size, args.parser, args.cache, args.workers)
+    service = QueryService(records, hashtags, fecha_inicial, fecha_final, args.query_cache,
+                           args.min_coretweets, args.top_coretweets, args.mentions_layout)
+    print_rejected(service.base.store.rejected)
+    server = make_query_server(args.serve, service)
+    print(f"{sum(len(file_records.author) for file_records in records)} tweets de {len(records)} archivos cargados en "
+          f"{time.perf_counter() - start:.2f} s; atendiendo consultas en {args.serve}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if not args.serve.isdigit() and os.path.exists(args.serve):
+            os.remove(args.serve)
+    service.print_statistics()
 
 def convert_year_to_4_digits(year):
     if len(year) == 2:
         return "20" + year
 
-def generate_retweets_json(retweets_info, arg):
-    retweets_json = {"retweets": []}
-
-    for author, author_info in retweets_info.items():
-        total_retweets = sum(len(tweet_info["retweetedBy"]) for tweet_info in author_info["tweets"].values())
-        
-        # Agregar la condición para incluir solo autores con al menos un retweet
-        if total_retweets > 0:
-            author_data = {"username": author, "receivedRetweets": total_retweets, "tweets": {}}
-
-            for tweet_id, tweet_info in author_info["tweets"].items():
-                retweeted_by = tweet_info["retweetedBy"]
-                tweet_data = {"retweetedBy": retweeted_by}
-                author_data["tweets"]["tweetId: {}".format(tweet_id)] = tweet_data
-
-            retweets_json["retweets"].append(author_data)
-
-    # Ordenar el JSON por número total de retweets al usuario (de mayor a menor)
-    retweets_json["retweets"] = sorted(retweets_json["retweets"], key=lambda x: x["receivedRetweets"], reverse=True)
+def rows_by_key(keys, key_count):
+    # Ordenamiento por conteo: agrupa los índices de fila por clave conservando el orden de
+    # llegada, en un arreglo compacto en lugar de una lista por clave
+    starts = [0] * (key_count + 1)
+    for key in keys:
+        starts[key + 1] += 1
+    for key in range(key_count):
+        starts[key + 1] += starts[key]
+    positions = starts[:-1]
+    rows = array('i', bytes(4 * len(keys)))
+    for row, key in enumerate(keys):
+        rows[positions[key]] = row
+        positions[key] += 1
+    return starts, rows
+
+def retweet_records(store):
+    # Registros de rt.json en orden de ranking, construidos de a un autor por vez
+    if store.spilled is not None:
+        yield from store.spilled.retweet_records(store.names)
+        return
+    names = store.names
+    received = {author: 0 for author in dict.fromkeys(store.tweet_author)}
+    for author, retweeter in zip(store.tweet_author, store.tweet_retweeter):
+        if retweeter >= 0:
+            received[author] += 1
+
+    # Ordenar por número total de retweets al usuario (de mayor a menor); solo autores con al menos un retweet
+    ranking = sorted((author for author, total in received.items() if total > 0), key=lambda author: received[author], reverse=True)
+    starts, rows = rows_by_key(store.tweet_author, len(names))
+    for author in ranking:
+        tweets = {}
+        for row in rows[starts[author]:starts[author + 1]]:
+            retweeted_by = tweets.setdefault("tweetId: {}".format(store.tweet_id[row]), {"retweetedBy": []})["retweetedBy"]
+            if store.tweet_retweeter[row] >= 0:
+                retweeted_by.append(names[store.tweet_retweeter[row]])
+        yield {"username": names[author], "receivedRetweets": received[author], "tweets": tweets}
+
+def mention_records(store, layout="occurrence"):
+    # "occurrence" escribe una entrada por mención; "grouped" una por par (mencionado,
+    # quien menciona) con el total y todos sus tweets
+    if store.spilled is not None:
+        yield from store.spilled.mention_records(store.names, layout)
+        return
+    names = store.names
+    pair_user, pair_by = store.pair_user, store.pair_by
+    pair_count = len(pair_user)
+    pair_starts, pair_rows = rows_by_key(store.mention_pair, pair_count)
+    received = {}
+    for pair in range(pair_count):
+        received[pair_user[pair]] = received.get(pair_user[pair], 0) + pair_starts[pair + 1] - pair_starts[pair]
+
+    # Ordenar por número total de menciones al usuario (de mayor a menor)
+    ranking = sorted(received, key=received.get, reverse=True)
+    if layout == "grouped":
+        starts, pairs = rows_by_key(pair_user, len(names))
+        for mentioned in ranking:
+            mentions = []
+            for pair in pairs[starts[mentioned]:starts[mentioned + 1]]:
+                tweets = [str(store.mention_tweet[row]) for row in pair_rows[pair_starts[pair]:pair_starts[pair + 1]]]
+                mentions.append({"mentionBy": names[pair_by[pair]], "totalMentions": len(tweets), "tweets": tweets})
+            yield {"username": names[mentioned], "receivedMentions": received[mentioned], "mentions": mentions}
+        return
+
+    starts, rows = rows_by_key(array('i', (pair_user[pair] for pair in store.mention_pair)), len(names))
+    for mentioned in ranking:
+        mentions = [{"mentionBy": names[pair_by[store.mention_pair[row]]], "tweets": [str(store.mention_tweet[row])]}
+                    for row in rows[starts[mentioned]:starts[mentioned + 1]]]
+        yield {"username": names[mentioned], "receivedMentions": received[mentioned], "mentions": mentions}
+
+def write_json_records(filename, key, records, json_format="indent"):
+    # Escribe los registros a medida que se generan. "indent" produce los mismos bytes que
+    # json.dump(..., indent=2) del documento completo, "compact" lo escribe sin espacios y
+    # "ndjson" escribe un registro por línea. Devuelve la cantidad de bytes escritos.
+    written = 0
+    with open(filename, "w", encoding="utf-8") as json_file:
+        if json_format == "ndjson":
+            for record in records:
+                written += json_file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            return written
+
+        if json_format == "compact":
+            separator, opening, closing = ",", '{"%s":[' % key, "]}"
+            dumps = lambda record: json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        else:
+            separator, opening, closing = ",\n    ", '{\n  "%s": [\n    ' % key, "\n  ]\n}"
+            dumps = lambda record: json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+
+        first = True
+        for record in records:
+            written += json_file.write((opening if first else separator) + dumps(record))
+            first = False
+        if first:
+            written += json_file.write('{\n  "%s": []\n}' % key if json_format == "indent" else opening + closing)
+        else:
+            written += json_file.write(closing)
+    return written
+
+def generate_retweets_json(store, arg, filename="rt.json", json_format="indent"):
     if arg==True:
-        with open("rt.json", "w", encoding="utf-8") as json_file:
-            json.dump(retweets_json, json_file, ensure_ascii=False, indent=2)
-
-    return retweets_json
-
-def generate_mentions_json(mentions_info, arg):
-    mentions_json = {"mentions": []}
-    #pprint(mentions_info)
+        return write_json_records(filename, "retweets", retweet_records(store), json_format)
+    return {"retweets": list(retweet_records(store))}
 
-    for username, user_info in mentions_info.items():
-        total_mentions = sum(len(mention_info['tweets']) for mention_info in user_info['mentions'])
-        user_data = {"username": username, "receivedMentions": total_mentions, "mentions": []}
-
-        for mention_info in user_info["mentions"]:
-            mention_data = {"mentionBy": mention_info["mentionBy"], "tweets": mention_info["tweets"]}
-            user_data["mentions"].append(mention_data)
-
-        mentions_json["mentions"].append(user_data)
-
-    # Ordenar el JSON por número total de menciones al usuario (de mayor a menor)
-    mentions_json["mentions"] = sorted(mentions_json["mentions"], key=lambda x: x["receivedMentions"], reverse=True)
+def generate_mentions_json(store, arg, filename="mención.json", json_format="indent", layout="occurrence"):
     if arg==True:
-        with open("mención.json", "w", encoding="utf-8") as json_file:
-            json.dump(mentions_json, json_file, ensure_ascii=False, indent=2)
-
-    return mentions_json
-
-def generate_retweets_graph(retweets_json):
-    G = nx.Graph()
-
-    for author_data in retweets_json["retweets"]:
-        author = author_data["username"]
-        
-        for tweet_id, tweet_data in author_data["tweets"].items():
-            G.add_node(author)
-            for retweeted_by in tweet_data["retweetedBy"]:
-                G.add_node(retweeted_by)
-                G.add_edge(author, retweeted_by)
-
-            # Conectar al autor con todos los que retuitearon ese tweet
-            G.add_edges_from([(author, retweeted_by) for retweeted_by in tweet_data["retweetedBy"]])
-
-    nx.write_gexf(G, "rt.gexf")
-
-
-def generate_mentions_graph(mentions_json):
-    G = nx.Graph()
-
-    for user_data in mentions_json["mentions"]:
-        username = user_data["username"]
-        
-        for mention_data in user_data["mentions"]:
-            mention_by = mention_data["mentionBy"]
-            G.add_node(username)
-            G.add_node(mention_by)
-            G.add_edge(username, mention_by)
-
-    nx.write_gexf(G, "mención.gexf")
-
-
-def generate_corrtweets_json(retweets_info, arg):
-    corrtweets_dict = defaultdict(set)
-    # Recopilar información sobre quién retuiteó a cada autor
-    for author, author_info in retweets_info.items():
-        for tweet_info in author_info["tweets"].values():
-            retweeted_by = tweet_info["retweetedBy"]
-        
-        # Verificar si tweet_info["retweetedBy"] no está vacío antes de agregar a corrtweets_dict
-            if retweeted_by:
-                retweeters = set(retweeted_by)
-                corrtweets_dict[author].update(retweeters)
-
-    # Encontrar corretweets comparando retweeters entre autores
-    corrtweets_list = []
-    for author1, author2 in combinations(corrtweets_dict, 2):
-        common_retweeters = corrtweets_dict[author1] & corrtweets_dict[author2]
-        if common_retweeters:
-            coretweet_data = {
-                'authors': {'u1': author1, 'u2': author2},
-                'totalCoretweets': len(common_retweeters),
-                'retweeters': list(common_retweeters)
-            }
-            corrtweets_list.append(coretweet_data)
-    
-    corrtweets_list = sorted(corrtweets_list, key=lambda x: x['totalCoretweets'], reverse=True)
+        return write_json_records(filename, "mentions", mention_records(store, layout), json_format)
+    return {"mentions": list(mention_records(store, layout))}
+
+def write_gexf(graph_file, labels, nodes, edges, weighted):
+    graph_file.write(
+        "<?xml version='1.0' encoding='utf-8'?>\n"
+        '<gexf xmlns="http://www.gexf.net/1.2draft" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://www.gexf.net/1.2draft http://www.gexf.net/1.2draft/gexf.xsd" version="1.2">\n'
+        f'  <meta lastmodifieddate="{date.today().isoformat()}">\n'
+        '    <creator>generador.py</creator>\n'
+        '  </meta>\n'
+        '  <graph defaultedgetype="undirected" mode="static" name="">\n'
+        '    <nodes>\n'
+    )
+    graph_file.writelines(f'      <node id={labels[node]} label={labels[node]} />\n' for node in nodes)
+    graph_file.write('    </nodes>\n    <edges>\n')
+    if weighted:
+        graph_file.writelines(f'      <edge source={labels[u]} target={labels[v]} id="{index}" weight="{weight}" />\n'
+                              for index, ((u, v), weight) in enumerate(edges))
+    else:
+        graph_file.writelines(f'      <edge source={labels[u]} target={labels[v]} id="{index}" />\n'
+                              for index, ((u, v), weight) in enumerate(edges))
+    graph_file.write('    </edges>\n  </graph>\n</gexf>\n')
+
+def write_graphml(graph_file, labels, nodes, edges, weighted):
+    graph_file.write(
+        "<?xml version='1.0' encoding='utf-8'?>\n"
+        '<graphml xmlns="http://graphml.graphdrawing.org/xmlns" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n'
+    )
+    if weighted:
+        graph_file.write('  <key id="weight" for="edge" attr.name="weight" attr.type="long" />\n')
+    graph_file.write('  <graph edgedefault="undirected">\n')
+    graph_file.writelines(f'    <node id={labels[node]} />\n' for node in nodes)
+    if weighted:
+        graph_file.writelines(f'    <edge source={labels[u]} target={labels[v]}><data key="weight">{weight}</data></edge>\n'
+                              for (u, v), weight in edges)
+    else:
+        graph_file.writelines(f'    <edge source={labels[u]} target={labels[v]} />\n' for (u, v), weight in edges)
+    graph_file.write('  </graph>\n</graphml>\n')
+
+def write_graph(filename, names, edges, graph_format="gexf", weighted=False, nodes=None):
+    # Escribe el grafo directamente desde las aristas ((u, v), peso) ya agrupadas, sin
+    # construir un grafo de networkx. Los nodos salen en el orden de nodes o, si no se
+    # indica, en orden de primera aparición en las aristas.
+    # Los iteradores de una sola pasada se materializan; los recorribles se leen dos veces.
+    if iter(edges) is edges:
+        edges = list(edges)
+    if nodes is None:
+        nodes = dict.fromkeys(node for edge, weight in edges for node in edge)
+    with open(filename, "w", encoding="utf-8", newline="") as graph_file:
+        if graph_format == "csv":
+            writer = csv.writer(graph_file)
+            if weighted:
+                writer.writerow(("source", "target", "weight"))
+                writer.writerows((names[u], names[v], weight) for (u, v), weight in edges)
+            else:
+                writer.writerow(("source", "target"))
+                writer.writerows((names[u], names[v]) for (u, v), weight in edges)
+            return
+        labels = {node: quoteattr(names[node]) for node in nodes}
+        if graph_format == "graphml":
+            write_graphml(graph_file, labels, nodes, edges, weighted)
+        else:
+            write_gexf(graph_file, labels, nodes, edges, weighted)
+
+def generate_retweets_graph(store, filename="rt.gexf", graph_format="gexf", weighted=False):
+    # Conectar a cada autor con todos los que retuitearon sus tweets
+    if store.spilled is not None:
+        edges = store.spilled.retweet_edges(len(store.names))
+    else:
+        edges = store.retweet_edges().items()
+    nodes = retweet_graph_nodes(store) if graph_format != "csv" else None
+    write_graph(filename, store.names, edges, graph_format, weighted, nodes)
+
+def retweet_graph_nodes(store):
+    # Nodos en el orden de los grafos anteriores, armados desde rt.json: cada autor en orden
+    # de ranking seguido de sus retweeters, tweet por tweet
+    name_ids = store.name_ids
+    return dict.fromkeys(name_ids[name] for record in retweet_records(store)
+                         for name in chain((record["username"],), *(tweet["retweetedBy"] for tweet in record["tweets"].values())))
+
+
+def generate_mentions_graph(store, filename="mención.gexf", graph_format="gexf", weighted=False):
+    if store.spilled is not None:
+        edges = store.spilled.mention_edges(len(store.names))
+    else:
+        edges = store.mention_edges().items()
+    nodes = mention_graph_nodes(store) if graph_format != "csv" else None
+    write_graph(filename, store.names, edges, graph_format, weighted, nodes)
+
+def mention_graph_nodes(store):
+    # Nodos en el orden de los grafos anteriores, armados desde mención.json: cada mencionado
+    # en orden de ranking seguido de quienes lo mencionaron
+    name_ids = store.name_ids
+    return dict.fromkeys(name_ids[name] for record in mention_records(store, "grouped")
+                         for name in chain((record["username"],), (mention["mentionBy"] for mention in record["mentions"])))
+
+
+def compute_coretweets(author_retweeters, min_coretweets=1, top_k=None):
+    # Índice invertido retweeter -> autores: solo se recorren los pares de autores que
+    # comparten algún retweeter, en lugar de comparar todas las combinaciones de autores.
+    # Devuelve ((autor1, autor2), retweeters en común) ordenados como el recorrido anterior
+    # con combinations: más corretweets primero y, en empate, por orden de aparición.
+    authors, authors_by_retweeter = retweeter_author_index(author_retweeters)
+    pairs = rank_shared_pairs(shared_retweeters(authors_by_retweeter.items()), min_coretweets, top_k)
+    return [((authors[i], authors[j]), retweeters) for (i, j), retweeters in pairs]
+
+def retweeter_author_index(author_retweeters):
+    # Autores en orden de aparición e índice retweeter -> índices de sus autores
+    authors = list(author_retweeters)
+    authors_by_retweeter = {}
+    for index, author in enumerate(authors):
+        for retweeter in author_retweeters[author]:
+            authors_by_retweeter.setdefault(retweeter, []).append(index)
+    return authors, authors_by_retweeter
+
+def shared_retweeters(authors_by_retweeter):
+    # {(índice autor 1, índice autor 2): [retweeters en común]} a partir de pares
+    # (retweeter, índices de autores); en generadorp.py cada proceso recibe una parte
+    shared = {}
+    for retweeter, author_indexes in authors_by_retweeter:
+        if len(author_indexes) > 1:
+            for pair in combinations(author_indexes, 2):
+                shared.setdefault(pair, []).append(retweeter)
+    return shared
+
+def coretweet_sort_key(item):
+    # Más corretweets primero y, en empate, por orden de aparición de los autores
+    return -len(item[1]), item[0]
+
+def rank_shared_pairs(shared, min_coretweets=1, top_k=None):
+    pairs = [(pair, retweeters) for pair, retweeters in shared.items() if len(retweeters) >= min_coretweets]
+    if top_k is not None:
+        pairs = heapq.nsmallest(top_k, pairs, key=coretweet_sort_key)
+    else:
+        pairs.sort(key=coretweet_sort_key)
+    return [(pair, sorted(retweeters)) for pair, retweeters in pairs]
+
+def coretweet_records(store, coretweets):
+    names = store.names
+    for (author1, author2), common_retweeters in coretweets:
+        yield {
+            'authors': {'u1': names[author1], 'u2': names[author2]},
+            'totalCoretweets': len(common_retweeters),
+            'retweeters': [names[retweeter] for retweeter in common_retweeters]
+        }
+
+def generate_corrtweets_json(store, arg, filename="corrtw.json", min_coretweets=1, top_k=None, coretweets=None, json_format="indent"):
+    if coretweets is None:
+        # Encontrar corretweets a partir de los retweeters compartidos entre autores
+        coretweets = compute_coretweets(store.author_retweeters(), min_coretweets, top_k)
 
-    corrtweets_json = {'coretweets': corrtweets_list}
     if arg==True:
-        with open('corrtw.json', 'w', encoding='utf-8') as json_file:
-            json.dump(corrtweets_json, json_file, ensure_ascii=False, indent=2)
-
-
-    return corrtweets_json
-
-
-
-def generate_corrtweets_graph(corrtweets_info):
-    G = nx.Graph()
-
-    for corrtweet_info in corrtweets_info["coretweets"]:
-        author1 = corrtweet_info["authors"]["u1"]
-        author2 = corrtweet_info["authors"]["u2"]
-        total_corretweets = corrtweet_info["totalCoretweets"]
-
-        # Agregar nodos y aristas al grafo
-        G.add_node(author1)
-        G.add_node(author2)
-        G.add_edge(author1, author2, weight=total_corretweets)
-
-    nx.write_gexf(G, "corrtw.gexf")
+        return write_json_records(filename, 'coretweets', coretweet_records(store, coretweets), json_format)
+    return {'coretweets': list(coretweet_records(store, coretweets))}
+
+def generate_corrtweets_graph(store, coretweets, filename="corrtw.gexf", graph_format="gexf"):
+    # Una arista por par de autores, con el total de corretweets como peso
+    edges = Reiterable(lambda: ((authors, len(common_retweeters)) for authors, common_retweeters in coretweets))
+    write_graph(filename, store.names, edges, graph_format, weighted=True)
+
+def approx_retweet_records(store):
+    # rt_aprox: conteo de Space-Saving con su error, estimación de Count-Min y retweeters
+    # distintos con un rango de dos errores típicos de HyperLogLog más los retweets no vistos
+    for name, (count, error, distinct, signature) in store.retweets.ranking():
+        estimate = distinct.estimate()
+        spread = 2 * distinct.relative_error() * estimate
+        yield {"username": name, "receivedRetweets": count, "receivedRetweetsError": error,
+               "countMin": store.retweet_counts.estimate(user_hash(name)),
+               "distinctRetweeters": round(estimate),
+               "distinctRetweetersRange": [max(math.floor(estimate - spread), 0), min(math.ceil(estimate + spread) + error, count)]}
+
+def approx_mention_records(store):
+    for name, (count, error, distinct, signature) in store.mentions.ranking():
+        yield {"username": name, "receivedMentions": count, "receivedMentionsError": error,
+               "countMin": store.mention_counts.estimate(user_hash(name))}
+
+def approx_coretweet_records(store, min_coretweets=1, top_k=None):
+    # Retweeters en común de los pares de autores más retuiteados: con Jaccard J y los
+    # distintos de cada uno, |A ∩ B| = J / (1 + J) * (|A| + |B|)
+    authors = store.retweets.ranking()[:APPROX_CORETWEET_AUTHORS]
+    distinct = [entry[2].estimate() for name, entry in authors]
+    pairs = []
+    for (i, (name1, entry1)), (j, (name2, entry2)) in combinations(enumerate(authors), 2):
+        jaccard = entry1[3].jaccard(entry2[3])
+        shared = round(jaccard / (1 + jaccard) * (distinct[i] + distinct[j]))
+        if jaccard > 0 and shared >= min_coretweets:
+            pairs.append((shared, jaccard, name1, name2, entry1[1] + entry2[1]))
+    pairs.sort(key=lambda pair: -pair[0])
+    for shared, jaccard, name1, name2, untracked in pairs[:top_k]:
+        yield {"authors": {"u1": name1, "u2": name2}, "totalCoretweets": shared, "jaccard": round(jaccard, 4),
+               "jaccardError": round(math.sqrt(jaccard * (1 - jaccard) / MINHASH_PERMUTATIONS), 4), "untrackedRetweets": untracked}
+
+def print_approx_bounds(store):
+    retweet_bound, probability = store.retweet_counts.error_bound()
+    mention_bound, probability = store.mention_counts.error_bound()
+    print("Modo aproximado (--approx), cotas de error:")
+    print(f"  Space-Saving ({store.retweets.capacity} usuarios): conteo real entre conteo - error y conteo; "
+          f"error ≤ {store.retweets.error_bound():.0f} retweets y ≤ {store.mentions.error_bound():.0f} menciones")
+    print(f"  Count-Min ({COUNT_MIN_DEPTH} x {COUNT_MIN_WIDTH}): sobreestima en ≤ {retweet_bound:.0f} retweets y ≤ {mention_bound:.0f} menciones "
+          f"con probabilidad {probability:.1%}")
+    print(f"  HyperLogLog (2^{HLL_PRECISION} registros): error relativo típico {1.04 / math.sqrt(1 << HLL_PRECISION):.1%} en retweeters distintos")
+    print(f"  MinHash ({MINHASH_PERMUTATIONS} funciones): error típico de Jaccard ≤ {0.5 / math.sqrt(MINHASH_PERMUTATIONS):.3f}")
+    print(f"  Memoria de los bocetos: {store.memory_bytes() / 2**20:.1f} MiB")
+
+def generate_approx_outputs(store, args, suffix="", profile=None):
+    # Salidas de --approx: solo JSON, con las cotas de error junto a cada resultado
+    stage = stage_timer(profile)
+    extension = "ndjson" if args.json_format == "ndjson" else "json"
+    print_approx_bounds(store)
+    if args.generate_retweet_graph or args.generate_mentions_graph or args.generate_corretweet_graph:
+        print("Con --approx no se generan grafos")
+    with stage("escritura JSON"):
+        if args.generate_retweet_json:
+            write_json_records(f"rt_aprox{suffix}.{extension}", "retweets", approx_retweet_records(store), args.json_format)
+        if args.generate_mentions_json:
+            write_json_records(f"mención_aprox{suffix}.{extension}", "mentions", approx_mention_records(store), args.json_format)
+    if args.generate_corretweet_json:
+        with stage("corretweets"):
+            records = list(approx_coretweet_records(store, args.min_coretweets, args.top_coretweets))
+        with stage("escritura JSON"):
+            write_json_records(f"corrtw_aprox{suffix}.{extension}", "coretweets", records, args.json_format)
+
+def generate_outputs(store, args, suffix="", profile=None, coretweets=None):
+    # Cada estructura derivada se calcula una sola vez y se entrega a todas las salidas
+    # pedidas que la usan; los grafos se construyen desde los agregados, no desde los JSON.
+    # coretweets puede venir ya calculado (generadorp.py lo reparte entre los procesos).
+    stage = stage_timer(profile)
+    if store.spilled is not None:
+        # Con -m las últimas filas también pasan a disco y todas las salidas se leen de las corridas
+        store.spill_rows()
+    extension = "ndjson" if args.json_format == "ndjson" else "json"
+    graph_extension = args.graph_format
+    if args.generate_retweet_json:
+        with stage("escritura JSON"):
+            generate_retweets_json(store, True, f"rt{suffix}.{extension}", args.json_format)
+    if args.generate_retweet_graph:
+        with stage("escritura grafos"):
+            generate_retweets_graph(store, f"rt{suffix}.{graph_extension}", args.graph_format, args.graph_weights)
 
-def delete_files(folder_path):
-    # Iterate through all the files and subdirectories in the given path
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            file_path = os.path.join(root, file)
+    if args.generate_mentions_json:
+        with stage("escritura JSON"):
+            generate_mentions_json(store, True, f"mención{suffix}.{extension}", args.json_format, args.mentions_layout)
+    if args.generate_mentions_graph:
+        with stage("escritura grafos"):
+            generate_mentions_graph(store, f"mención{suffix}.{graph_extension}", args.graph_format, args.graph_weights)
+
+    if (args.generate_corretweet_json or args.generate_corretweet_graph) and coretweets is None:
+        with stage("corretweets"):
+            if store.spilled is not None:
+                coretweets = store.spilled.coretweets(len(store.names), args.min_coretweets, args.top_coretweets)
+            else:
+                coretweets = compute_coretweets(store.author_retweeters(), args.min_coretweets, args.top_coretweets)
+    if coretweets is not None:
+        if args.generate_corretweet_json:
+            with stage("escritura JSON"):
+                generate_corrtweets_json(store, True, f"corrtw{suffix}.{extension}", coretweets=coretweets, json_format=args.json_format)
+        if args.generate_corretweet_graph:
+            with stage("escritura grafos"):
+                generate_corrtweets_graph(store, coretweets, f"corrtw{suffix}.{graph_extension}", args.graph_format)
 
-            # Verificar si el archivo tiene la extensión .json
-            if file.endswith(".json"):
-                try:
-                    # Eliminar el archivo
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Error deleting {file_path}: {e}")
 
 if __name__ == "__main__":
     start_time = time.time()
     directory, fecha_inicial, fecha_final, hashtags_file, args = parse_args()
-    retweets_info, mentions_info = decompress_and_create_json_files(directory,hashtags_file, fecha_inicial, fecha_final)
-
-    tweets=retweets_info
-
-    if args.generate_retweet_graph:
-        rt_json = generate_retweets_json(retweets_info, args.generate_retweet_json)
-        generate_retweets_graph(rt_json)
-
-    if args.generate_mentions_graph:
-        mentions_json = generate_mentions_json(mentions_info, args.generate_mentions_json)
-        generate_mentions_graph(mentions_json)
-
-    if args.generate_corretweet_graph:
-        corrtweets_json = generate_corrtweets_json(retweets_info, args.generate_corretweet_json)
-        generate_corrtweets_graph(corrtweets_json)
-
-    if args.generate_retweet_json:
-        generate_retweets_json(retweets_info, args.generate_retweet_json)
-
-    if args.generate_mentions_json:
-        generate_mentions_json(mentions_info, args.generate_mentions_json)
-
-    if args.generate_corretweet_json:
-        generate_corrtweets_json(retweets_info, args.generate_corretweet_json)
+    profile = Profile() if args.profile or args.stats_json else None
+    # La ventana de fechas se compila una sola vez para todos los tweets
+    date_filter = compile_date_filter(fecha_inicial, fecha_final)
+    if args.live is not None:
+        run_live(directory, hashtags_file, date_filter, args)
+        sys.exit()
+    if args.serve is not None:
+        run_service(directory, hashtags_file, fecha_inicial, fecha_final, args)
+        sys.exit()
+    if args.compile_store is not None:
+        compile_start = time.perf_counter()
+        rows, files = compile_store(list(Path(directory).rglob('*.json.bz2')), args.compile_store, args.buffer_size, args.parser, args.cache, args.workers)
+        size = sum(path.stat().st_size for path in Path(args.compile_store).iterdir())
+        print(f"{rows} tweets de {files} archivos compilados en {args.compile_store} ({size / 1e6:.1f} MB) en {time.perf_counter() - compile_start:.2f} s")
+        sys.exit()
+    spilled = make_spilled_rows(args.memory_limit, args.spill_dir)
+    store = read_and_process_files(directory, hashtags_file, date_filter, args.buffer_size, args.parser, args.cache, args.workers, args.date_index, args.date_layout, profile, spilled, args.split_bz2, args.prefetch, args.store,
+                                   args.approx_capacity if args.approx else None)
+
+    print_rejected(store.rejected)
+    try:
+        if args.approx:
+            generate_approx_outputs(store, args, profile=profile)
+        else:
+            generate_outputs(store, args, profile=profile)
+    finally:
+        if spilled is not None:
+            spilled.close()
+
+    if profile is not None:
+        summary = profile.summary()
+        print_profile(summary)
+        if args.stats_json:
+            save_profile(args.stats_json, {"total": summary})
 
-    delete_files(directory)
     end_time = time.time()
     total_time = end_time - start_time
     print(f"Proceso completado. Tiempo total de ejecución: {total_time} segundos.")
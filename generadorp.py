@@ -1,315 +1,346 @@
-import getopt
-import os
-import argparse
-import sys
-import bz2
-import json
-import networkx as nx
+import heapq
 import time
-from collections import defaultdict
-from itertools import combinations
-import glob
+from itertools import islice
 from pathlib import Path
-from datetime import datetime
-import shutil
+from array import array
 from mpi4py import MPI
 
+from generador import (
+    DEFAULT_BUFFER_SIZE,
+    INGEST_STAGES,
+    Profile,
+    TweetStore,
+    build_parser,
+    bz2_segments,
+    compile_date_filter,
+    compile_hashtag_filter,
+    coretweet_sort_key,
+    find_bz2_markers,
+    generate_approx_outputs,
+    generate_outputs,
+    load_date_index,
+    process_bz2_segment,
+    make_spilled_rows,
+    new_store,
+    open_compiled_store,
+    open_prefetcher,
+    part_ranges,
+    print_profile,
+    print_layout_hints,
+    print_rejected,
+    process_file,
+    rank_shared_pairs,
+    retweeter_author_index,
+    prune_files,
+    save_date_index,
+    save_profile,
+    segment_bytes,
+    shared_retweeters,
+    stage_timer,
+)
+
 
 def parse_args():
-    parser = argparse.ArgumentParser(description="Descripción de tu script.", add_help=False)
-    parser.add_argument("-d", "--directory", required=True, help="Directorio de entrada")
-    parser.add_argument("-fi", "--fecha_inicial", help="Fecha inicial en formato dd-mm-aa")
-    parser.add_argument("-ff", "--fecha_final", help="Fecha final en formato dd-mm-aa")
-    parser.add_argument("-h", "--hashtags_file", help="Nombre de archivo de texto con hashtags")
-    
-    # New options for graph and JSON generation
-    parser.add_argument("-grt", "--generate_retweet_graph", action="store_true", help="Generar grafo de retweets")
-    parser.add_argument("-jrt", "--generate_retweet_json", action="store_true", help="Generar JSON de retweets")
-    parser.add_argument("-gm", "--generate_mentions_graph", action="store_true", help="Generar grafo de menciones")
-    parser.add_argument("-jm", "--generate_mentions_json", action="store_true", help="Generar JSON de menciones")
-    parser.add_argument("-gcrt", "--generate_corretweet_graph", action="store_true", help="Generar grafo de corretweets")
-    parser.add_argument("-jcrt", "--generate_corretweet_json", action="store_true", help="Generar JSON de corretweets")
+    parser = build_parser()
+    parser.add_argument("-s", "--schedule", choices=["static", "dynamic"], default="dynamic", help="Reparto de archivos: bloques fijos (static) o bajo demanda, del más grande al más pequeño (dynamic); con --approx siempre static")
 
     args = parser.parse_args()
+    if args.approx and (args.cache or args.store or args.memory_limit is not None):
+        parser.error("--approx no se usa con -c, -st ni -m")
+    if args.approx:
+        # Los bocetos no se pueden reordenar después de llenarlos: con el reparto estático
+        # cada proceso lee siempre los mismos archivos y el resultado no cambia entre corridas
+        args.schedule = "static"
     return args.directory, args.fecha_inicial, args.fecha_final, args.hashtags_file, args
 
-def get_tweet_id(tweet):
-    return tweet['id_str'] if 'retweeted_status' in tweet else str(tweet['id'])
-
-def validate_tweet_date(tweet, fi, ff):
-    if 'created_at' in tweet:
-        tweet_date_str = tweet['created_at']
-        
-        # Convertir la fecha del tweet al formato deseado
-        tweet_date = datetime.strptime(tweet_date_str, "%a %b %d %H:%M:%S +0000 %Y").date()
-            
-        if fi is not None:
-            # Convertir la fecha inicial al formato deseado
-            fi = datetime.strptime(fi, "%d-%m-%y").date()
-            if tweet_date < fi:
-                return False
-
-        if ff is not None:
-            # Convertir la fecha final al formato deseado
-            ff = datetime.strptime(ff, "%d-%m-%y").date()
-            if tweet_date > ff:
-                return False
-
-        # Si no se generó ninguna excepción, la fecha se validó correctamente
-        return True
-
-    return True
-
-def process_original_tweet(tweet, retweets_info, mentions_info, hashtags_set=None, fi=None, ff=None):
-    if fi is not None or ff is not None:
-        if not validate_tweet_date(tweet, fi, ff):
-            # Validation failed, do something or simply return
-            return
-
-    if 'user' in tweet:
-        tweet_author_username = tweet['user']['screen_name']
-        tweet_id = get_tweet_id(tweet)
-
-        if 'entities' in tweet and 'hashtags' in tweet['entities']:
-            tweet_hashtags = {tag['text'].lower() for tag in tweet['entities']['hashtags']}
-            if hashtags_set and not tweet_hashtags.intersection(hashtags_set):
-                return
-
-        retweets_info.setdefault(tweet_author_username, {"tweets": {}})
-        retweets_info[tweet_author_username]["tweets"].setdefault(tweet_id, {"retweetedBy": []})
-
-        process_mentions(tweet, mentions_info)
-
-def process_retweet(tweet, retweets_info, mentions_info, hashtags_set=None, fi=None, ff=None):
-    if fi is not None or ff is not None:
-        if not validate_tweet_date(tweet, fi, ff):
-            return
-
-    if 'retweeted_status' in tweet and 'user' in tweet['retweeted_status']:
-        retweet_author_username = tweet['retweeted_status']['user']['screen_name']
-        retweeted_tweet_id = get_tweet_id(tweet['retweeted_status'])
-
-        if 'entities' in tweet['retweeted_status'] and 'hashtags' in tweet['retweeted_status']['entities']:
-            retweet_hashtags = {tag['text'].lower() for tag in tweet['retweeted_status']['entities']['hashtags']}
-            if hashtags_set and not retweet_hashtags.intersection(hashtags_set):
-                return
-
-        retweets_info.setdefault(retweet_author_username, {"tweets": {}})
-        retweets_info[retweet_author_username]["tweets"].setdefault(retweeted_tweet_id, {"retweetedBy": []})
-        retweets_info[retweet_author_username]["tweets"][retweeted_tweet_id]["retweetedBy"].append(tweet['user']['screen_name'])
-
-        original_tweet = tweet['retweeted_status']
-        process_mentions(original_tweet, mentions_info)
-
-def process_mentions(tweet, mentions_info):
-    if 'entities' in tweet and 'user_mentions' in tweet['entities'] and tweet['entities']['user_mentions']:
-        mentioned_usernames = set(mention['screen_name'] for mention in tweet['entities']['user_mentions'])
-        for mentioned_username in mentioned_usernames:
-            mentions_info.setdefault(mentioned_username, {"mentions": []})
-            mentions_info[mentioned_username]["mentions"].append({"mentionBy": tweet['user']['screen_name'], "tweets": [get_tweet_id(tweet)]})
-
-
-def process_files_in_parallel(file_paths, hashtags_set, fi, ff, rank, size):
-    retweets_info = {}
-    mentions_info = {}
-
-    if isinstance(file_paths[0], list):
-        file_paths = [file_path for sublist in file_paths for file_path in sublist]
-
-    for file_path in file_paths:
-        #print(f"Proceso MPI {rank} procesando archivo: {file_path}")
-        json_file_path = file_path.with_suffix('.json')
-
-        with bz2.BZ2File(file_path, 'rb') as source, open(json_file_path, 'wb') as target:
-            target.write(source.read())
-
-        with open(json_file_path, 'r', encoding='utf-8') as json_file:
-            for line in json_file:
-                tweet = json.loads(line)
-                if 'retweeted_status' in tweet:
-                    process_retweet(tweet, retweets_info, mentions_info, hashtags_set, fi, ff)
-                else:
-                    process_original_tweet(tweet, retweets_info, mentions_info, hashtags_set, fi, ff)
-
-    return retweets_info, mentions_info
-
 def load_hashtags(hashtags_file):
-    hashtags_set = set()
+    hashtags = []
     try:
-        with open(hashtags_file, 'r') as file:
-            hashtags_set = {line.strip().lower() for line in file}
+        with open(hashtags_file, 'r', encoding='utf-8') as file:
+            hashtags = file.read().splitlines()
     except FileNotFoundError:
         print(f"Error: No se encontró el archivo de hashtags: {hashtags_file}")
-    return hashtags_set
+    return hashtags
+
+def find_bz2_markers_mpi(comm, file_path):
+    # Cada proceso busca las marcas bzip2 en una parte de los tramos del archivo
+    rank = comm.Get_rank()
+    size = comm.Get_size()
 
-def merge_retweets(retweets_info_list):
-    # Inicializar un diccionario predeterminado para evitar comprobaciones adicionales
-    merged_results = defaultdict(lambda: {"tweets": defaultdict(lambda: {"retweetedBy": []})})
+    def map_share(function, *columns):
+        return [function(*arguments) for arguments in list(zip(*columns))[rank::size]]
 
-    # Combinar resultados parciales de diferentes procesos
-    for retweets_info_part in retweets_info_list:
-        for author_username, author_data in retweets_info_part.items():
-            for tweet_id, tweet_data in author_data["tweets"].items():
-                # Agregar retweets y retweetedBy sin sobrescribir datos existentes
-                merged_results[author_username]["tweets"][tweet_id]["retweetedBy"].extend(tweet_data["retweetedBy"])
+    shares = comm.allgather(find_bz2_markers(file_path, map_share))
+    return sorted(marker for share in shares for marker in share)
 
-    # Convertir el diccionario predeterminado en un diccionario estándar antes de devolverlo
-    return dict(merged_results)
-
-def merge_mentions(mentions_info_list):
-    merged_results = {}
+def split_work_items(comm, file_paths, split_mb, cache_dir=None):
+    # Unidades de trabajo (archivo, tramo): tramo es None para leer el archivo entero. Con
+    # -sb los archivos de al menos split_mb MB se dividen en tramos de bloques bzip2, en su
+    # lugar dentro de la lista, así el reparto estático conserva el orden de lectura.
+    rank = comm.Get_rank()
+    large = None
+    if rank == 0:
+        large = [] if split_mb is None or cache_dir is not None else [path for path in file_paths if path.stat().st_size >= split_mb * 10**6]
+    large = comm.bcast(large, root=0)
+    segments = {}
+    for file_path in large:
+        markers = find_bz2_markers_mpi(comm, file_path)
+        if rank == 0:
+            segments[file_path] = bz2_segments(file_path, markers, comm.Get_size())
+    if rank != 0:
+        return None
+    items = []
+    for file_path in file_paths:
+        if segments.get(file_path) is None:
+            items.append((file_path, None))
+        else:
+            items.extend((file_path, segment) for segment in segments[file_path])
+    return items
+
+def item_size(item):
+    file_path, segment = item
+    return file_path.stat().st_size if segment is None else segment_bytes(segment)
+
+def process_item(item, store, hashtag_filter, date_filter, buffer_size, parser, cache_dir, index_days, profile, prefetcher=None):
+    file_path, segment = item
+    if segment is None:
+        process_file(file_path, store, hashtag_filter, date_filter, buffer_size, parser, cache_dir, index_days, profile, prefetcher)
+    else:
+        process_bz2_segment(file_path, segment, store, hashtag_filter, date_filter, parser, index_days, profile)
+
+def process_files_in_parallel(file_paths, hashtag_filter, date_filter, rank, size, buffer_size=DEFAULT_BUFFER_SIZE, parser="auto", cache_dir=None, index_days=False, profile=None, spilled=None, prefetch=0, approx=None):
+    store = new_store(spilled, approx)
+
+    if file_paths and isinstance(file_paths[0], list):
+        file_paths = [file_path for sublist in file_paths for file_path in sublist]
+
+    # Con prefetch un hilo descomprime los archivos enteros siguientes de este proceso
+    whole_files = [file_path for file_path, segment in file_paths if segment is None] if cache_dir is None else []
+    with open_prefetcher(whole_files, prefetch, buffer_size) as prefetcher:
+        for item in file_paths:
+            #print(f"Proceso MPI {rank} procesando archivo: {item[0]}")
+            process_item(item, store, hashtag_filter, date_filter, buffer_size, parser, cache_dir, index_days, profile, prefetcher)
+            store.spill_if_needed()
+
+    return store
+
+class SegmentedStore(TweetStore):
+    # Almacén de un proceso con el reparto dinámico. Cada unidad de trabajo deja sus filas
+    # en un tramo consecutivo y segments guarda, por tramo, (posición original, inicio y fin
+    # de tweets, inicio y fin de menciones, inicio y fin en segment_names). segment_names
+    # tiene los usuarios en el orden en que el tramo los usó por primera vez, que es el orden
+    # de la tabla de nombres de un almacén propio del archivo: con eso segment_store arma el
+    # mismo resultado parcial que ese almacén sin guardar una tabla de nombres por archivo.
+    def __init__(self):
+        super().__init__()
+        self.segments = []
+        self.segment_names = array('i')
+        # Último tramo que usó cada usuario
+        self.name_segment = array('i')
+        self.segment = -1
+
+    def intern(self, name):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+            self.name_segment.append(self.segment)
+            self.segment_names.append(name_id)
+        elif self.name_segment[name_id] != self.segment:
+            self.name_segment[name_id] = self.segment
+            self.segment_names.append(name_id)
+        return name_id
+
+    def begin_segment(self):
+        self.segment += 1
+        return len(self.tweet_author), len(self.mention_pair), len(self.segment_names)
+
+    def end_segment(self, position, start):
+        tweet_start, mention_start, names_start = start
+        self.segments.append((position, tweet_start, len(self.tweet_author), mention_start, len(self.mention_pair), names_start, len(self.segment_names)))
+
+    def segment_store(self, index):
+        # Resultado parcial de un solo tramo, como si su archivo se hubiera leído en un
+        # TweetStore propio
+        position, tweet_start, tweet_end, mention_start, mention_end, names_start, names_end = self.segments[index]
+        part = TweetStore()
+        remap = {}
+        for name_id in self.segment_names[names_start:names_end]:
+            remap[name_id] = part.intern(self.names[name_id])
+        part.tweet_author = array('i', (remap[author] for author in self.tweet_author[tweet_start:tweet_end]))
+        part.tweet_id = self.tweet_id[tweet_start:tweet_end]
+        part.tweet_retweeter = array('i', (-1 if retweeter < 0 else remap[retweeter] for retweeter in self.tweet_retweeter[tweet_start:tweet_end]))
+        pairs = self.mention_pair[mention_start:mention_end]
+        pair_remap = {pair: part.pair_id(remap[self.pair_user[pair]], remap[self.pair_by[pair]]) for pair in dict.fromkeys(pairs)}
+        part.mention_pair = array('i', (pair_remap[pair] for pair in pairs))
+        part.mention_tweet = self.mention_tweet[mention_start:mention_end]
+        return part
+
+def process_files_dynamic(comm, queue, hashtag_filter, date_filter, buffer_size=DEFAULT_BUFFER_SIZE, parser="auto", cache_dir=None, index_days=False, profile=None, prefetch=0):
+    # Reparto bajo demanda: un contador compartido en el proceso 0 indica el siguiente
+    # archivo de la cola y cada proceso lo incrementa de forma atómica al quedar libre.
+    # Cada entrada de la cola es (posición original, unidad de trabajo); cada unidad deja
+    # sus filas en un tramo de un solo SegmentedStore por proceso, para combinarlas después
+    # en el orden de los archivos (merge_segments).
+    # El siguiente archivo no se conoce de antemano, así que prefetch solo adelanta la
+    # descompresión dentro del archivo actual.
+    store = SegmentedStore()
+    files_done = 0
+    busy_time = 0.0
+    fetch_time = 0.0
+
+    itemsize = MPI.INT64_T.Get_size()
+    win = MPI.Win.Allocate(itemsize if comm.Get_rank() == 0 else 0, itemsize, comm=comm)
+    if comm.Get_rank() == 0:
+        win.Lock(0)
+        win.Put(array('q', [0]), 0)
+        win.Unlock(0)
+    comm.Barrier()
+
+    one = array('q', [1])
+    next_index = array('q', [0])
+    while True:
+        fetch_start = time.time()
+        win.Lock(0)
+        win.Fetch_and_op(one, next_index, 0, 0, MPI.SUM)
+        win.Unlock(0)
+        fetch_time += time.time() - fetch_start
+        if next_index[0] >= len(queue):
+            break
+
+        busy_start = time.time()
+        position, item = queue[next_index[0]]
+        start = store.begin_segment()
+        with open_prefetcher([item[0]] if item[1] is None and cache_dir is None else [], prefetch, buffer_size) as prefetcher:
+            process_item(item, store, hashtag_filter, date_filter, buffer_size, parser, cache_dir, index_days, profile, prefetcher)
+        store.end_segment(position, start)
+        busy_time += time.time() - busy_start
+        files_done += 1
+
+    win.Free()
+    return store, files_done, busy_time, fetch_time
+
+def print_load_report(load_stats):
+    print("Proceso  Archivos  Ocupado (s)  Inactivo (s)")
+    for rank, (files_done, busy_time, idle_time) in enumerate(load_stats):
+        print(f"{rank:>7}  {files_done:>8}  {busy_time:>11.2f}  {idle_time:>12.2f}")
+
+def print_rank_profiles(summaries):
+    # Tiempo de pared de cada etapa de lectura, combinación y corretweets por proceso
+    stages = [stage for stage in INGEST_STAGES + ("combinación", "corretweets") if any(stage in summary["stages"] for summary in summaries)]
+    print("Proceso" + "".join(f"{stage:>15}" for stage in stages) + f"{'tweets/s':>12}{'RSS máx (MiB)':>15}")
+    for rank, summary in enumerate(summaries):
+        walls = "".join(f"{summary['stages'][stage]['wall'] if stage in summary['stages'] else 0.0:>15.2f}" for stage in stages)
+        print(f"{rank:>7}{walls}{summary['tweets_per_s']:>12,.0f}{summary['peak_rss_mib']:>15.1f}")
+
+def merge_partial_results(store, store_part):
+    return store.merge(store_part)
+
+def tree_merge(comm, partial, merge_into=merge_partial_results):
+    # Reducción en árbol binomial: en cada ronda los procesos impares del nivel envían su
+    # resultado parcial al compañero de la izquierda, que lo combina con el suyo. La
+    # combinación se reparte entre los procesos en log2(P) rondas y el proceso 0 solo
+    # recibe un resultado parcial a la vez. El orden de combinación respeta el orden de
+    # los procesos, igual que reunir todos los resultados en el proceso 0 y combinarlos en
+    # orden.
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+    step = 1
+    while step < size:
+        if rank % (2 * step) == step:
+            comm.send(partial, dest=rank - step, tag=step)
+            return None
+        if rank + step < size:
+            partial = merge_into(partial, comm.recv(source=rank + step, tag=step))
+        step *= 2
+    return partial
+
+def ordered_merge(comm, partial, merge_into=merge_partial_results):
+    # Con -m el proceso 0 recibe los resultados de los demás de a uno, en orden de proceso,
+    # y después de cada combinación vuelca a disco lo que supere el límite de memoria
+    rank = comm.Get_rank()
+    if rank != 0:
+        comm.send(partial, dest=0, tag=0)
+        return None
+    for source in range(1, comm.Get_size()):
+        partial = merge_into(partial, comm.recv(source=source, tag=0))
+        partial.spill_if_needed()
+    return partial
+
+def merge_segments(comm, store, spilled=None, merge_into=merge_partial_results):
+    # Combinación del reparto dinámico: el proceso 0 recorre las posiciones de los archivos en
+    # el orden original y combina el tramo de cada uno, tomado de su propio almacén o
+    # recibido del proceso que lo leyó. Cada proceso envía sus tramos de a uno y en orden de
+    # posición, así el proceso 0 tiene en memoria un solo tramo ajeno a la vez y el resultado
+    # es el mismo que leyendo los archivos en orden, sin importar qué proceso leyó cada uno.
+    rank = comm.Get_rank()
+    positions = comm.gather([segment[0] for segment in store.segments], root=0)
+    totals = comm.gather((store.rejected, store.file_days), root=0)
+    if rank != 0:
+        for index in sorted(range(len(store.segments)), key=lambda index: store.segments[index][0]):
+            comm.send(store.segment_store(index), dest=0, tag=1)
+        return None
+
+    owners = {position: source for source, owned in enumerate(positions) for position in owned}
+    local = {segment[0]: index for index, segment in enumerate(store.segments)}
+    merged = TweetStore(spilled)
+    for position in sorted(owners):
+        source = owners[position]
+        part = store.segment_store(local[position]) if source == 0 else comm.recv(source=source, tag=1)
+        merged = merge_into(merged, part)
+        merged.spill_if_needed()
+    for rejected, file_days in totals:
+        for stage, count in rejected.items():
+            merged.reject(stage, count)
+        for signature, day_range in file_days.items():
+            merged.add_file_days(signature, day_range)
+    return merged
+
+def partition_retweeters(authors_by_retweeter, parts):
+    # Reparte los retweeters con al menos dos autores entre parts procesos según la cantidad
+    # de pares de autores que generan: del que más genera al que menos, cada uno al proceso
+    # con menos pares asignados hasta el momento
+    shares = [[] for _ in range(parts)]
+    loads = [(0, part) for part in range(parts)]
+    candidates = [(retweeter, indexes) for retweeter, indexes in authors_by_retweeter.items() if len(indexes) > 1]
+    for retweeter, indexes in sorted(candidates, key=lambda item: len(item[1]), reverse=True):
+        load, part = heapq.heappop(loads)
+        shares[part].append((retweeter, indexes))
+        heapq.heappush(loads, (load + len(indexes) * (len(indexes) - 1) // 2, part))
+    return shares
+
+def distributed_coretweets(comm, store, min_coretweets=1, top_k=None):
+    # Corretweets calculados entre todos los procesos. El proceso 0 reparte los retweeters;
+    # cada proceso arma los pares de autores de los suyos y los envía al proceso dueño de
+    # cada par, que junta los retweeters de todos los procesos, filtra y ordena sus pares.
+    # El proceso 0 mezcla las listas ya ordenadas. Mismo resultado que compute_coretweets:
+    # la orientación u1/u2 y los empates dependen del orden de los retweets en store, que
+    # con los dos repartos es el de los archivos (OrderedParts en el dinámico).
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+    shares = None
+    if rank == 0:
+        authors, authors_by_retweeter = retweeter_author_index(store.author_retweeters())
+        shares = partition_retweeters(authors_by_retweeter, size)
+    shared = shared_retweeters(comm.scatter(shares, root=0))
+
+    outgoing = [{} for _ in range(size)]
+    for (i, j), retweeters in shared.items():
+        outgoing[(i * 1000003 + j) % size][(i, j)] = retweeters
+    del shared
+    owned = {}
+    for incoming in comm.alltoall(outgoing):
+        for pair, retweeters in incoming.items():
+            owned.setdefault(pair, []).extend(retweeters)
+    ranked = comm.gather(rank_shared_pairs(owned, min_coretweets, top_k), root=0)
+    if rank != 0:
+        return None
+
+    pairs = heapq.merge(*ranked, key=coretweet_sort_key)
+    if top_k is not None:
+        pairs = islice(pairs, top_k)
+    return [((authors[i], authors[j]), retweeters) for (i, j), retweeters in pairs]
 
-    for mentions_info_part in mentions_info_list:
-        for key, value in mentions_info_part.items():
-            merged_results.setdefault(key, {"mentions": []})
-            merged_results[key]["mentions"].extend(value["mentions"])
-
-    return merged_results
-
-def generate_retweets_json(retweets_info, arg):
-    retweets_json = {"retweets": []}
-
-    for author, author_info in retweets_info.items():
-        total_retweets = sum(len(tweet_info["retweetedBy"]) for tweet_info in author_info["tweets"].values())
-        
-        # Agregar la condición para incluir solo autores con al menos un retweet
-        if total_retweets > 0:
-            author_data = {"username": author, "receivedRetweets": total_retweets, "tweets": {}}
-
-            for tweet_id, tweet_info in author_info["tweets"].items():
-                retweeted_by = tweet_info["retweetedBy"]
-                tweet_data = {"retweetedBy": retweeted_by}
-                author_data["tweets"]["tweetId: {}".format(tweet_id)] = tweet_data
-
-            retweets_json["retweets"].append(author_data)
-
-    # Ordenar el JSON por número total de retweets al usuario (de mayor a menor)
-    retweets_json["retweets"] = sorted(retweets_json["retweets"], key=lambda x: x["receivedRetweets"], reverse=True)
-    if arg==True:
-        with open("rtp.json", "w", encoding="utf-8") as json_file:
-            json.dump(retweets_json, json_file, ensure_ascii=False, indent=2)
-
-    return retweets_json
-
-def generate_mentions_json(mentions_info, arg):
-    mentions_json = {"mentions": []}
-    #pprint(mentions_info)
-
-    for username, user_info in mentions_info.items():
-        total_mentions = sum(len(mention_info['tweets']) for mention_info in user_info['mentions'])
-        user_data = {"username": username, "receivedMentions": total_mentions, "mentions": []}
-
-        for mention_info in user_info["mentions"]:
-            mention_data = {"mentionBy": mention_info["mentionBy"], "tweets": mention_info["tweets"]}
-            user_data["mentions"].append(mention_data)
-
-        mentions_json["mentions"].append(user_data)
-
-    # Ordenar el JSON por número total de menciones al usuario (de mayor a menor)
-    mentions_json["mentions"] = sorted(mentions_json["mentions"], key=lambda x: x["receivedMentions"], reverse=True)
-    if arg==True:
-        with open("menciónp.json", "w", encoding="utf-8") as json_file:
-            json.dump(mentions_json, json_file, ensure_ascii=False, indent=2)
-
-    return mentions_json
-
-def generate_retweets_graph(retweets_json):
-    G = nx.Graph()
-
-    for author_data in retweets_json["retweets"]:
-        author = author_data["username"]
-        
-        for tweet_id, tweet_data in author_data["tweets"].items():
-            G.add_node(author)
-            for retweeted_by in tweet_data["retweetedBy"]:
-                G.add_node(retweeted_by)
-                G.add_edge(author, retweeted_by)
-
-            # Conectar al autor con todos los que retuitearon ese tweet
-            G.add_edges_from([(author, retweeted_by) for retweeted_by in tweet_data["retweetedBy"]])
-
-    nx.write_gexf(G, "rtp.gexf")
-
-
-def generate_mentions_graph(mentions_json):
-    G = nx.Graph()
-
-    for user_data in mentions_json["mentions"]:
-        username = user_data["username"]
-        
-        for mention_data in user_data["mentions"]:
-            mention_by = mention_data["mentionBy"]
-            G.add_node(username)
-            G.add_node(mention_by)
-            G.add_edge(username, mention_by)
-
-    nx.write_gexf(G, "menciónp.gexf")
-
-
-def generate_corrtweets_json(retweets_info, arg):
-    corrtweets_dict = defaultdict(set)
-    # Recopilar información sobre quién retuiteó a cada autor
-    for author, author_info in retweets_info.items():
-        for tweet_info in author_info["tweets"].values():
-            retweeted_by = tweet_info["retweetedBy"]
-        
-        # Verificar si tweet_info["retweetedBy"] no está vacío antes de agregar a corrtweets_dict
-            if retweeted_by:
-                retweeters = set(retweeted_by)
-                corrtweets_dict[author].update(retweeters)
-
-    # Encontrar corretweets comparando retweeters entre autores
-    corrtweets_list = []
-    for author1, author2 in combinations(corrtweets_dict, 2):
-        common_retweeters = corrtweets_dict[author1] & corrtweets_dict[author2]
-        if common_retweeters:
-            coretweet_data = {
-                'authors': {'u1': author1, 'u2': author2},
-                'totalCoretweets': len(common_retweeters),
-                'retweeters': list(common_retweeters)
-            }
-            corrtweets_list.append(coretweet_data)
-    
-    corrtweets_list = sorted(corrtweets_list, key=lambda x: x['totalCoretweets'], reverse=True)
-
-    corrtweets_json = {'coretweets': corrtweets_list}
-    if arg==True:
-        with open('corrtwp.json', 'w', encoding='utf-8') as json_file:
-            json.dump(corrtweets_json, json_file, ensure_ascii=False, indent=2)
-
-    return corrtweets_json
-
-
-
-def generate_corrtweets_graph(corrtweets_info):
-    G = nx.Graph()
-
-    for corrtweet_info in corrtweets_info["coretweets"]:
-        author1 = corrtweet_info["authors"]["u1"]
-        author2 = corrtweet_info["authors"]["u2"]
-        total_corretweets = corrtweet_info["totalCoretweets"]
-
-        # Agregar nodos y aristas al grafo
-        G.add_node(author1)
-        G.add_node(author2)
-        G.add_edge(author1, author2, weight=total_corretweets)
-
-    nx.write_gexf(G, "corrtwp.gexf")
-
-def delete_files(folder_path):
-    # Iterate through all the files and subdirectories in the given path
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-
-            # Verificar si el archivo tiene la extensión .json
-            if file.endswith(".json"):
-                try:
-                    # Eliminar el archivo
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Error deleting {file_path}: {e}")
-    
 if __name__ == "__main__":
     comm = MPI.COMM_WORLD
     rank = comm.Get_rank()
@@ -317,74 +348,150 @@ if __name__ == "__main__":
 
     start_time = time.time()
     directory, fecha_inicial, fecha_final, hashtags_file, args = parse_args()
+    profile = Profile() if args.profile or args.stats_json else None
 
-    # Broadcast hashtags_set, fi, ff to all processes
-    hashtags_set = None
+    # Broadcast hashtags, fi, ff to all processes
+    hashtags = None
     if hashtags_file and rank == 0:
-        hashtags_set = load_hashtags(hashtags_file)
+        hashtags = load_hashtags(hashtags_file)
 
-    # Transmitir hashtags_set, fi, ff a todos los procesos
-    hashtags_set = comm.bcast(hashtags_set, root=0)
+    # Transmitir hashtags, fi, ff a todos los procesos
+    hashtags = comm.bcast(hashtags, root=0)
     fi = comm.bcast(fecha_inicial, root=0)
     ff = comm.bcast(fecha_final, root=0)
+    # Cada proceso normaliza los hashtags y compila la ventana de fechas una sola vez
+    hashtag_filter = compile_hashtag_filter(hashtags)
+    date_filter = compile_date_filter(fi, ff)
+
+    # Con --approx cada proceso llena sus bocetos y se combinan como los resultados exactos
+    approx = args.approx_capacity if args.approx else None
+    # Con -m solo el proceso 0 vuelca filas a disco: es el que acumula el resultado combinado.
+    # Los resultados parciales de los demás procesos quedan enteros en memoria (ver README).
+    spilled = make_spilled_rows(args.memory_limit, args.spill_dir) if rank == 0 else None
 
     base_path = Path(directory)
-    file_paths = list(base_path.rglob('*.json.bz2'))
-    local_file_paths = None
-    if rank == 0:
-        # Divide las rutas de archivos entre los procesos
-        chunk_size = len(file_paths) // size
-        remainder = len(file_paths) % size
-        start_index = 0
-
-        local_file_paths = []
-        for i in range(size):
-            end_index = start_index + chunk_size + (1 if i < remainder else 0)
-            local_file_paths.append(file_paths[start_index:end_index])
-            start_index = end_index
+    date_index = None
+    file_paths = None
+    hinted = []
+    if rank == 0 and args.store is None:
+        # El proceso 0 omite los archivos que quedan enteros fuera de -fi/-ff antes de repartirlos
+        with stage_timer(profile)("descubrimiento"):
+            all_file_paths = list(base_path.rglob('*.json.bz2'))
+            date_index = load_date_index(args.date_index) if args.date_index is not None else None
+            file_paths, hinted = prune_files(all_file_paths, date_filter, date_index, base_path if args.date_layout else None, args.cache)
+        if len(file_paths) < len(all_file_paths):
+            print(f"Archivos omitidos por fecha: {len(all_file_paths) - len(file_paths)} de {len(all_file_paths)}")
+    # Con archivos leídos por una pista de -dl también se registra el rango real de cada
+    # archivo, para verificarla
+    index_days = comm.bcast(args.date_index is not None or bool(hinted), root=0)
+
+    # Cada unidad de trabajo es un archivo o, con -sb, un tramo de bloques de un archivo grande
+    if args.store is None:
+        with stage_timer(profile)("bloques bz2"):
+            file_paths = split_work_items(comm, file_paths, args.split_bz2, args.cache)
+
+    if args.store is not None:
+        # Con -st cada proceso filtra un tramo consecutivo de filas del almacén compilado; el
+        # orden de los procesos es el orden de las filas, igual que el reparto estático
+        busy_start = time.time()
+        compiled, ranges = open_compiled_store(args.store, directory if rank == 0 else None, date_filter)
+        local_ranges = part_ranges(ranges, rank, size)
+        local_store = compiled.load(TweetStore(spilled), local_ranges, hashtag_filter, date_filter, profile)
+        busy_time = time.time() - busy_start
+        files_done = len(local_ranges)
+        fetch_time = 0.0
+    elif args.schedule == "dynamic":
+        # Cola de archivos ordenada por tamaño en disco, del más grande al más pequeño; cada
+        # entrada conserva su posición original para combinar los resultados en ese orden
+        queue = None
+        if rank == 0:
+            queue = sorted(enumerate(file_paths), key=lambda entry: item_size(entry[1]), reverse=True)
+        queue = comm.bcast(queue, root=0)
+
+        local_store, files_done, busy_time, fetch_time = process_files_dynamic(
+            comm, queue, hashtag_filter, date_filter, args.buffer_size, args.parser, args.cache, index_days, profile, args.prefetch
+        )
     else:
         local_file_paths = None
+        if rank == 0:
+            # Divide las rutas de archivos entre los procesos
+            chunk_size = len(file_paths) // size
+            remainder = len(file_paths) % size
+            start_index = 0
+
+            local_file_paths = []
+            for i in range(size):
+                end_index = start_index + chunk_size + (1 if i < remainder else 0)
+                local_file_paths.append(file_paths[start_index:end_index])
+                start_index = end_index
+        else:
+            local_file_paths = None
+
+        # Broadcast de las rutas de archivos a todos los procesos
+        local_file_paths = comm.scatter(local_file_paths, root=0)
+
+        # Procesa los archivos asignados a cada proceso
+        busy_start = time.time()
+        local_store = process_files_in_parallel(
+            local_file_paths, hashtag_filter, date_filter, rank, size, args.buffer_size, args.parser, args.cache, index_days, profile, spilled, args.prefetch, approx
+        )
+        busy_time = time.time() - busy_start
+        files_done = len(local_file_paths)
+        fetch_time = 0.0
+
+    # Tiempo de espera hasta que el último proceso termina su parte
+    wait_start = time.time()
+    comm.Barrier()
+    idle_time = fetch_time + time.time() - wait_start
+    load_stats = comm.gather((files_done, busy_time, idle_time), root=0)
+
+    # Combina los resultados de todos los procesos en un árbol; el resultado final queda en el proceso 0
+    def timed_merge(store, store_part):
+        with stage_timer(profile)("combinación"):
+            return merge_partial_results(store, store_part)
+    if isinstance(local_store, SegmentedStore):
+        store = merge_segments(comm, local_store, spilled, timed_merge)
+    elif args.memory_limit is not None:
+        store = ordered_merge(comm, local_store, timed_merge)
+    else:
+        store = tree_merge(comm, local_store, timed_merge)
 
-    # Broadcast de las rutas de archivos a todos los procesos
-    local_file_paths = comm.scatter(local_file_paths, root=0)
-
-    # Procesa los archivos asignados a cada proceso
-    local_retweets_info, local_mentions_info = process_files_in_parallel(
-        local_file_paths, hashtags_set, fi, ff, rank, size
-    )
+    # Sin -m los corretweets se calculan entre todos los procesos; con -m el proceso 0 los
+    # calcula desde las corridas en disco y con --approx salen de los MinHash
+    coretweets = None
+    if (args.generate_corretweet_json or args.generate_corretweet_graph) and args.memory_limit is None and not args.approx:
+        with stage_timer(profile)("corretweets"):
+            coretweets = distributed_coretweets(comm, store, args.min_coretweets, args.top_coretweets)
 
-    # Recopila los resultados de todos los procesos
-    retweets_info = comm.gather(local_retweets_info, root=0)
-    mentions_info = comm.gather(local_mentions_info, root=0)
+    # Perfil de cada proceso hasta aquí; el proceso 0 sigue midiendo la generación de salidas
+    rank_profiles = comm.gather((profile, profile.summary()) if profile is not None else None, root=0)
 
-    # El proceso 0 combina los resultados finales
     if rank == 0:
-        merged_results = merge_retweets(retweets_info)
-        mentions_results = merge_mentions(mentions_info)
+        print_load_report(load_stats)
+        print_rejected(store.rejected)
+        if date_index is not None:
+            save_date_index(args.date_index, date_index, store.file_days)
+        print_layout_hints(hinted, store.file_days, date_filter, date_index is not None)
 
         # Continuar con el resto del código (generación de gráficos, archivos JSON, etc.)
-        if args.generate_retweet_graph:
-            rt_json = generate_retweets_json(merged_results, args.generate_retweet_json)
-            generate_retweets_graph(rt_json)
-
-        if args.generate_mentions_graph:
-            mentions_json = generate_mentions_json(mentions_results, args.generate_mentions_json)
-            generate_mentions_graph(mentions_json)
-
-        if args.generate_corretweet_graph:
-            corrtweets_json = generate_corrtweets_json(merged_results, args.generate_corretweet_json)
-            generate_corrtweets_graph(corrtweets_json)
-
-        if args.generate_retweet_json:
-            generate_retweets_json(merged_results, args.generate_retweet_json)
-
-        if args.generate_mentions_json:
-            generate_mentions_json(mentions_results, args.generate_mentions_json)
-
-        if args.generate_corretweet_json:
-            generate_corrtweets_json(merged_results, args.generate_corretweet_json)
+        try:
+            if args.approx:
+                generate_approx_outputs(store, args, suffix="p", profile=profile)
+            else:
+                generate_outputs(store, args, suffix="p", profile=profile, coretweets=coretweets)
+        finally:
+            if spilled is not None:
+                spilled.close()
+
+        if profile is not None:
+            for rank_profile, rank_summary in rank_profiles[1:]:
+                profile.merge(rank_profile)
+            summary = profile.summary()
+            print_profile(summary)
+            print_rank_profiles([rank_summary for rank_profile, rank_summary in rank_profiles])
+            if args.stats_json:
+                save_profile(args.stats_json, {"total": summary, "ranks": [rank_summary for rank_profile, rank_summary in rank_profiles]})
 
-        delete_files(directory)
         end_time = time.time()
         total_time = end_time - start_time
         print(f"Proceso completado. Tiempo total de ejecución: {total_time} segundos.")
\ No newline at end of file